@@ -2,6 +2,8 @@
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+import asyncio
 import uvicorn
 import os
 
@@ -9,12 +11,20 @@ from routers.features import router as features_router
 from routers.autoencoder import router as autoencoder_router
 from routers.dual_lstm import router as dual_lstm_router
 from routers.hybrid_lstm import router as hybrid_lstm_router
-from routers.streaming import router as streaming_router
+from routers.streaming import router as streaming_router, streaming_pipeline_manager
 from routers.pipeline import router as pipeline_router
 from routers.batches import router as batches_router
+from routers.inference import router as inference_router
+from routers.pipeline_jobs import router as pipeline_jobs_router, pipeline_job_manager
+from routers.backfill import router as backfill_router, backfill_runner
+from routers.bulk_analysis import router as bulk_analysis_router
 
 from database.database import connect_to_mongo, close_mongo_connection, connect_to_minio
+from database.write_behind import write_behind
+from models.preload import preload_models, get_model_states, not_ready_models
 from utils.logger import log
+from utils.instrumentation import HTTPMetricsMiddleware, monitor_event_loop_lag
+from utils.metrics import REGISTRY
 
 MODULE = 'app'
 
@@ -31,25 +41,41 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(HTTPMetricsMiddleware)
 
 @app.on_event("startup")
 async def startup_event():
     log('=== AI Services Starting ===', MODULE)
     await connect_to_mongo()
     connect_to_minio()
+    write_behind.start()
+    app.state.loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+    app.state.preload_task = asyncio.create_task(preload_models())
+    await pipeline_job_manager.start()
+    await streaming_pipeline_manager.start()
     log('=== Startup Complete ===', MODULE)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     log('=== Shutting Down ===', MODULE)
+    await streaming_pipeline_manager.shutdown()
+    await pipeline_job_manager.stop()
+    await backfill_runner.shutdown()
+    await write_behind.stop()
+    app.state.loop_lag_task.cancel()
     await close_mongo_connection()
 
 app.include_router(features_router)
 app.include_router(autoencoder_router)
 app.include_router(dual_lstm_router)
+app.include_router(hybrid_lstm_router)
 app.include_router(streaming_router)
 app.include_router(pipeline_router) 
+app.include_router(bulk_analysis_router)
+app.include_router(pipeline_jobs_router)
+app.include_router(backfill_router)
 app.include_router(batches_router)
+app.include_router(inference_router)
 
 @app.get("/health")
 async def health_check():
@@ -59,6 +85,27 @@ async def health_check():
         "environment": os.getenv('ENVIRONMENT', 'local')
     }
 
+@app.get("/health/live")
+async def liveness_check():
+    """Процесс жив и обслуживает event loop"""
+    return {"status": "alive", "service": "ai-services"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Готов к трафику, когда все модели из PRELOAD_MODELS загружены и прогреты"""
+    pending = not_ready_models()
+    body = {
+        "status": "ready" if not pending else "not_ready",
+        "models": get_model_states(),
+        "pending": pending
+    }
+    return JSONResponse(status_code=200 if not pending else 503, content=body)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/")
 async def root():
     return {
@@ -0,0 +1,81 @@
+# src\ai-services\backfill.py
+"""
+Перерасчёт сохранённых данных без HTTP:
+
+    python backfill.py --result-version v2 --recordings data/*.csv
+    python backfill.py --result-version v2 --batch-ids-file batches.txt --autoencoder-version <версия>
+    python backfill.py --resume <backfill_id>
+    python backfill.py --status <backfill_id>
+
+Прогон общий с /pipeline/backfill: начатый здесь можно смотреть и продолжать через API и наоборот.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from database.database import connect_to_mongo, close_mongo_connection
+from routers.backfill import BackfillRequest, backfill_runner
+from utils.logger import log
+
+MODULE = 'backfill_cli'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill: reprocess stored recordings or batches")
+    parser.add_argument("--result-version", help="Версия результатов перерасчёта")
+    parser.add_argument("--recordings", nargs="*", default=[], help="CSV/JSON на диске или minio://bucket/object")
+    parser.add_argument("--batch-ids", nargs="*", default=[], help="Батчи, пересчитываемые из сохранённых признаков")
+    parser.add_argument("--batch-ids-file", help="Файл с batch_id, по одному в строке")
+    parser.add_argument("--user-id", default="backfill")
+    parser.add_argument("--window-size", type=int, default=16384)
+    parser.add_argument("--dual-lstm-steps", type=int, default=5)
+    parser.add_argument("--autoencoder-version")
+    parser.add_argument("--dual-lstm-version")
+    parser.add_argument("--no-lstm", action="store_true", help="Без прогноза Dual LSTM")
+    parser.add_argument("--resume", metavar="BACKFILL_ID", help="Продолжить прогон")
+    parser.add_argument("--status", metavar="BACKFILL_ID", help="Показать прогресс и выйти")
+    return parser.parse_args()
+
+
+async def main(args) -> int:
+    await connect_to_mongo()
+    try:
+        if args.status:
+            print(json.dumps(await backfill_runner.progress(args.status), indent=2, default=str))
+            return 0
+
+        run_id = args.resume
+        if run_id is None:
+            if not args.result_version:
+                log("--result-version is required for a new backfill", MODULE, level="ERROR")
+                return 2
+            batch_ids = list(args.batch_ids)
+            if args.batch_ids_file:
+                with open(args.batch_ids_file) as f:
+                    batch_ids += [line.strip() for line in f if line.strip()]
+            doc = await backfill_runner.create(BackfillRequest(
+                recordings=args.recordings,
+                batch_ids=batch_ids,
+                result_version=args.result_version,
+                user_id=args.user_id,
+                window_size=args.window_size,
+                dual_lstm_steps=args.dual_lstm_steps,
+                autoencoder_version=args.autoencoder_version,
+                dual_lstm_version=args.dual_lstm_version,
+                run_lstm=not args.no_lstm
+            ))
+            run_id = doc["_id"]
+            log(f"Backfill created: {run_id} ({doc['total']} item(s)), resume with --resume {run_id}", MODULE)
+
+        state = await backfill_runner.run(run_id)
+        print(json.dumps(await backfill_runner.progress(run_id), indent=2, default=str))
+        return 0 if state == "completed" else 1
+    finally:
+        await backfill_runner.shutdown()
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
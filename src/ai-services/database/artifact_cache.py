@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from minio.error import S3Error
+
+from database.database import get_minio_client
+from utils.logger import log
+
+MODULE = "artifact_cache"
+
+ARTIFACT_CACHE_DIR = os.getenv(
+    "ARTIFACT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "model_artifacts")
+)
+ARTIFACT_CACHE_MAX_MB = int(os.getenv("ARTIFACT_CACHE_MAX_MB", 2048))
+ARTIFACT_FETCH_WORKERS = int(os.getenv("ARTIFACT_FETCH_WORKERS", 4))
+# sha256 — пересчитывать хэш файла при каждом попадании, size — сверять только размер
+ARTIFACT_CACHE_VERIFY = os.getenv("ARTIFACT_CACHE_VERIFY", "sha256").lower()
+
+_CHUNK_SIZE = 4 * 1024 * 1024
+_MD5_ETAG = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Локальный кэш артефактов моделей из MinIO.
+
+    Ключ — объект и его ETag, поэтому новая версия объекта под тем же именем
+    скачивается заново, а неизменённая берётся с диска. Целостность проверяется
+    по SHA-256 (и по MD5, если ETag — простой MD5). Размер кэша ограничен,
+    вытесняются давно не использованные артефакты.
+    """
+
+    def __init__(self, root: str = ARTIFACT_CACHE_DIR, max_bytes: int = ARTIFACT_CACHE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._executor = ThreadPoolExecutor(max_workers=ARTIFACT_FETCH_WORKERS,
+                                            thread_name_prefix="artifact-fetch")
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        self._index = self._read_index()
+
+    def fetch(self, bucket: str, object_name: str) -> str:
+        """Возвращает локальный путь к актуальной версии объекта (блокирующий вызов)"""
+        minio = get_minio_client()
+        try:
+            stat = minio.stat_object(bucket, object_name)
+        except S3Error:
+            raise
+        except Exception as e:
+            cached = self._latest_entry(bucket, object_name)
+            if cached is None:
+                raise
+            log(f"MinIO unavailable ({e}), using cached {object_name}", MODULE, level="WARN")
+            return cached["path"]
+
+        etag = (stat.etag or "").strip('"')
+        key = hashlib.sha256(f"{bucket}/{object_name}@{etag}".encode()).hexdigest()[:32]
+
+        with self._key_lock(key):
+            path = self._lookup(key)
+            if path is not None:
+                self.hits += 1
+                return path
+
+            self.misses += 1
+            return self._download(minio, key, bucket, object_name, etag, stat.size)
+
+    def fetch_many(self, bucket: str, object_names: List[str]) -> List[str]:
+        """Параллельно скачивает несколько объектов, сохраняя порядок"""
+        futures = [self._executor.submit(self.fetch, bucket, name) for name in object_names]
+        return [future.result() for future in futures]
+
+    async def fetch_async(self, bucket: str, object_name: str) -> str:
+        return await asyncio.to_thread(self.fetch, bucket, object_name)
+
+    async def fetch_many_async(self, bucket: str, object_names: List[str]) -> List[str]:
+        return list(await asyncio.gather(*[self.fetch_async(bucket, name) for name in object_names]))
+
+    def read_bytes(self, bucket: str, object_name: str) -> bytes:
+        with open(self.fetch(bucket, object_name), "rb") as f:
+            return f.read()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = list(self._index.values())
+        return {
+            "root": self.root,
+            "entries": len(entries),
+            "size_bytes": sum(e["size"] for e in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "verify": ARTIFACT_CACHE_VERIFY,
+            "objects": sorted(f"{e['bucket']}/{e['object']}" for e in entries)
+        }
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _lookup(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._index.get(key)
+        if entry is None:
+            return None
+
+        path = entry["path"]
+        valid = os.path.exists(path) and os.path.getsize(path) == entry["size"]
+        if valid and ARTIFACT_CACHE_VERIFY == "sha256":
+            valid = _file_sha256(path) == entry["sha256"]
+        if not valid:
+            log(f"Cached artifact failed integrity check, refetching: {entry['object']}", MODULE, level="WARN")
+            self._remove(key)
+            return None
+
+        with self._lock:
+            entry["last_access"] = time.time()
+            self._write_index()
+        return path
+
+    def _download(self, minio, key: str, bucket: str, object_name: str, etag: str, size: int) -> str:
+        entry_dir = os.path.join(self.root, key)
+        os.makedirs(entry_dir, exist_ok=True)
+        final_path = os.path.join(entry_dir, os.path.basename(object_name))
+        partial_path = final_path + ".part"
+
+        started = time.perf_counter()
+        sha256, md5 = hashlib.sha256(), hashlib.md5()
+        response = minio.get_object(bucket, object_name)
+        try:
+            with open(partial_path, "wb") as f:
+                for chunk in response.stream(_CHUNK_SIZE):
+                    sha256.update(chunk)
+                    md5.update(chunk)
+                    f.write(chunk)
+        finally:
+            response.close()
+            response.release_conn()
+
+        downloaded = os.path.getsize(partial_path)
+        if downloaded != size or (_MD5_ETAG.match(etag) and md5.hexdigest() != etag):
+            os.remove(partial_path)
+            raise RuntimeError(f"Integrity check failed for {bucket}/{object_name}")
+
+        os.replace(partial_path, final_path)
+        with self._lock:
+            self._index[key] = {
+                "bucket": bucket,
+                "object": object_name,
+                "etag": etag,
+                "sha256": sha256.hexdigest(),
+                "size": downloaded,
+                "path": final_path,
+                "last_access": time.time()
+            }
+            self._evict(protect=key)
+            self._write_index()
+
+        log(f"Fetched {bucket}/{object_name}: {downloaded} bytes in "
+            f"{(time.perf_counter() - started) * 1000:.0f}ms", MODULE)
+        return final_path
+
+    def _evict(self, protect: str):
+        total = sum(e["size"] for e in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda kv: kv[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if key == protect:
+                continue
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            del self._index[key]
+            total -= entry["size"]
+            log(f"Evicted artifact {entry['object']} ({entry['size']} bytes)", MODULE)
+
+    def _remove(self, key: str):
+        with self._lock:
+            self._index.pop(key, None)
+            self._write_index()
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def _latest_entry(self, bucket: str, object_name: str) -> Optional[dict]:
+        with self._lock:
+            entries = [e for e in self._index.values()
+                       if e["bucket"] == bucket and e["object"] == object_name and os.path.exists(e["path"])]
+        return max(entries, key=lambda e: e["last_access"]) if entries else None
+
+    def _read_index(self) -> Dict[str, dict]:
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self):
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+
+
+artifact_cache = ArtifactCache()
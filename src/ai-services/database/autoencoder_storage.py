@@ -1,24 +1,22 @@
 # src\ai-services\database\autoencoder_storage.py
 
 from database.database import get_database
-from typing import Dict, List, Any
+from database.write_behind import write_behind
+from typing import Dict, List, Any, Optional
+from bson import ObjectId
 import asyncio
 
 _COLLECTION_NAME = "autoencoder_results"
 
 async def save_one_result(result: Dict[str, Any]) -> str:
-    db = get_database()
-    coll = db[_COLLECTION_NAME]
-    insert_res = await coll.insert_one(result)
-    print(f"✓ Сводка сохранена: {insert_res.inserted_id}")
-    return str(insert_res.inserted_id)
+    result_id = await write_behind.insert(_COLLECTION_NAME, result)
+    print(f"✓ Сводка поставлена на запись: {result_id}")
+    return result_id
 
 async def save_many_results(results: List[Dict[str, Any]]) -> List[str]:
-    db = get_database()
-    coll = db[_COLLECTION_NAME]
-    insert_res = await coll.insert_many(results)
-    print(f"✓ Сохранено {len(insert_res.inserted_ids)} сводок")
-    return [str(iid) for iid in insert_res.inserted_ids]
+    result_ids = [await write_behind.insert(_COLLECTION_NAME, result) for result in results]
+    print(f"✓ Поставлено на запись {len(result_ids)} сводок")
+    return result_ids
 
 async def get_result_by_id(result_id: str) -> Dict[str, Any]:
     db = get_database()
@@ -33,14 +31,22 @@ async def get_last_results(n: int = 10) -> List[Dict[str, Any]]:
     return [doc async for doc in cursor]
 
 async def save_batch_result(batch_object: Dict[str, Any]) -> str:
+    result_id = await write_behind.insert(_COLLECTION_NAME, batch_object)
+    print(f"✓ Batch сводка поставлена на запись: {result_id}")
+    return result_id
+
+async def get_batch_result(batch_id: str, result_version: Optional[str] = None) -> Dict[str, Any]:
+    """Последняя сводка батча: по умолчанию — пайплайна, с result_version — этой версии перерасчёта"""
     db = get_database()
     coll = db[_COLLECTION_NAME]
-    insert_res = await coll.insert_one(batch_object)
-    print(f"✓ Batch сводка сохранена: {insert_res.inserted_id}")
-    return str(insert_res.inserted_id)
+    query = {"batch_id": batch_id, "result_version": result_version or {"$exists": False}}
+    doc = await coll.find_one(query, {"_id": 0}, sort=[("_id", -1)])
+    return doc
 
-async def get_batch_result(batch_id: str) -> Dict[str, Any]:
+async def delete_superseded(batch_id: str, keep_id: str) -> int:
+    """Удаляет прежние сводки пайплайна после перезапуска этапа, оставляя keep_id; версии перерасчёта не трогает"""
     db = get_database()
     coll = db[_COLLECTION_NAME]
-    doc = await coll.find_one({"batch_id": batch_id}, {"_id": 0})
-    return doc
\ No newline at end of file
+    keep = ObjectId(keep_id) if ObjectId.is_valid(keep_id) else keep_id
+    result = await coll.delete_many({"batch_id": batch_id, "_id": {"$ne": keep}, "result_version": {"$exists": False}})
+    return result.deleted_count
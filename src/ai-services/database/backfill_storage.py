@@ -0,0 +1,103 @@
+# src\ai-services\database\backfill_storage.py
+from database.database import get_database
+from pymongo import ReplaceOne, ReturnDocument
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+import os
+
+_COLLECTION_NAME = "backfill_runs"
+BACKFILL_STALE_S = float(os.getenv("BACKFILL_STALE_S", 900))
+
+
+async def create_run(run_id: str, items: List[Dict[str, Any]], result_version: str,
+                     options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Новый прогон перерасчёта: список элементов и параметры, по которым его можно продолжить
+    """
+    now = datetime.utcnow()
+    document = {
+        "_id": run_id,
+        "state": "pending",
+        "result_version": result_version,
+        "options": options,
+        "items": items,
+        "total": len(items),
+        "completed": [],
+        "failed": {},
+        "windows_processed": 0,
+        "owner": None,
+        "error": None,
+        "created_at": now,
+        "started_at": None,
+        "updated_at": now,
+        "finished_at": None
+    }
+    await get_database()[_COLLECTION_NAME].insert_one(document)
+    return document
+
+
+async def get_run(run_id: str, with_items: bool = True) -> Optional[Dict[str, Any]]:
+    projection = None if with_items else {"items": 0}
+    return await get_database()[_COLLECTION_NAME].find_one({"_id": run_id}, projection)
+
+
+async def list_runs(limit: int = 20) -> List[Dict[str, Any]]:
+    cursor = get_database()[_COLLECTION_NAME].find({}, {"items": 0, "completed": 0, "failed": 0})
+    return await cursor.sort("created_at", -1).limit(limit).to_list(length=limit)
+
+
+async def claim_run(run_id: str, owner: str, stale_after_s: float = BACKFILL_STALE_S) -> Optional[Dict[str, Any]]:
+    """
+    Переводит прогон в running; None — его выполняет живой процесс. Прогон, который
+    дольше stale_after_s не отмечал прогресс, считается брошенным и забирается
+    """
+    now = datetime.utcnow()
+    return await get_database()[_COLLECTION_NAME].find_one_and_update(
+        {"_id": run_id, "$or": [{"state": {"$ne": "running"}},
+                                {"updated_at": {"$lt": now - timedelta(seconds=stale_after_s)}}]},
+        {"$set": {"state": "running", "owner": owner, "error": None, "started_at": now, "updated_at": now,
+                  "finished_at": None}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def record_progress(run_id: str, completed: List[str], failed: Dict[str, str], windows: int):
+    """
+    Отмечает обработанную пачку: готовые элементы больше не пересчитываются при продолжении
+    """
+    update: Dict[str, Any] = {
+        "$set": {"updated_at": datetime.utcnow(), **{f"failed.{_field(key)}": error for key, error in failed.items()}},
+        "$inc": {"windows_processed": windows}
+    }
+    if completed:
+        update["$addToSet"] = {"completed": {"$each": completed}}
+        update["$unset"] = {f"failed.{_field(key)}": "" for key in completed}
+    await get_database()[_COLLECTION_NAME].update_one({"_id": run_id}, update)
+
+
+async def finish_run(run_id: str, state: str, error: Optional[str] = None):
+    now = datetime.utcnow()
+    await get_database()[_COLLECTION_NAME].update_one(
+        {"_id": run_id},
+        {"$set": {"state": state, "error": error, "owner": None, "updated_at": now, "finished_at": now}}
+    )
+
+
+async def bulk_upsert_results(collection: str, documents: List[Dict[str, Any]]) -> int:
+    """
+    Результаты перерасчёта одной групповой записью; ключ — batch_id и result_version,
+    поэтому повтор пачки после сбоя заменяет, а не дублирует
+    """
+    if not documents:
+        return 0
+    operations = [
+        ReplaceOne({"batch_id": doc["batch_id"], "result_version": doc["result_version"]}, doc, upsert=True)
+        for doc in documents
+    ]
+    result = await get_database()[collection].bulk_write(operations, ordered=False)
+    return result.upserted_count + result.modified_count
+
+
+def _field(key: str) -> str:
+    """Ключ элемента (путь записи) как имя поля Mongo: без точек и $"""
+    return key.replace(".", "．").replace("$", "＄")
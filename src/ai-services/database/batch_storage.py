@@ -1,4 +1,5 @@
 from database.database import get_database
+from database.write_behind import write_behind
 from datetime import datetime
 import uuid
 from typing import Dict, Any, Optional, List
@@ -23,11 +24,34 @@ class BatchStorage:
             "created_at": datetime.utcnow()
         }
         
-        await self.collection.replace_one(
-            {"_id": batch_id}, 
-            doc, 
-            upsert=True
-        )
+        await write_behind.replace("batch_metadata", doc)
+        return batch_id
+    
+    async def save_checkpoint(self, batch_id: str, user_id: str, status: str, stages: List[Dict[str, Any]],
+                              run_config: Dict[str, Any], data_summary: Optional[dict] = None,
+                              total_execution_time_ms: float = 0, reruns: Optional[List[dict]] = None,
+                              created_at: Optional[datetime] = None):
+        """
+        Контрольная точка батча: статус каждого этапа и параметры запуска.
+        Пишется после каждого этапа; по ней /pipeline/rerun перезапускает
+        упавшие этапы из сохранённых признаков
+        """
+        now = datetime.utcnow()
+        doc = {
+            "_id": batch_id,
+            "batch_id": batch_id,
+            "user_id": user_id,
+            "timestamp": now.isoformat(),
+            "status": status,
+            "data_summary": data_summary or {},
+            "stages": stages,
+            "run_config": run_config,
+            "reruns": reruns or [],
+            "total_execution_time_ms": total_execution_time_ms,
+            "created_at": created_at or now
+        }
+        
+        await write_behind.replace("batch_metadata", doc)
         return batch_id
     
     async def get_user_batches(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
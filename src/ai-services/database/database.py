@@ -1,8 +1,12 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from minio import Minio
+from pymongo import monitoring
 from typing import Optional
 import os
+import time
+import urllib3
 from utils.logger import log
+from utils.metrics import MS_BUCKETS, LabeledHistogram
 from dotenv import load_dotenv
 
 load_dotenv(override=False)
@@ -16,6 +20,49 @@ class Database:
 db = Database()
 MODULE = "database"
 
+MONGO_COMMAND_MS = LabeledHistogram(
+    "mongo_command_ms", "Длительность команды MongoDB, мс", MS_BUCKETS, ("command", "status")
+)
+MINIO_REQUEST_MS = LabeledHistogram(
+    "minio_request_ms", "Длительность HTTP-запроса к MinIO, мс", MS_BUCKETS, ("method", "status")
+)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Латентность каждой команды драйвера (insert, find, bulk_write уходит как insert/update)"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_MS.labels(event.command_name, "ok").observe(event.duration_micros / 1000)
+
+    def failed(self, event):
+        MONGO_COMMAND_MS.labels(event.command_name, "error").observe(event.duration_micros / 1000)
+
+
+class TimedPoolManager(urllib3.PoolManager):
+    """HTTP-клиент MinIO с замером каждого запроса; настройки — как у клиента MinIO по умолчанию"""
+
+    def urlopen(self, method, url, *args, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = super().urlopen(method, url, *args, **kwargs)
+            status = str(response.status)
+            return response
+        finally:
+            MINIO_REQUEST_MS.labels(method, status).observe((time.perf_counter() - started) * 1000)
+
+
+def _minio_http_client() -> TimedPoolManager:
+    timeout = 300
+    return TimedPoolManager(
+        timeout=urllib3.Timeout(connect=timeout, read=timeout),
+        maxsize=10,
+        retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+    )
+
 
 async def connect_to_mongo():
     """Подключение к MongoDB AI с проверкой"""
@@ -31,7 +78,7 @@ async def connect_to_mongo():
         
         connection_string = f"mongodb://{mongo_user}:{mongo_password}@{mongo_host}:{mongo_port}/{mongo_database}?authSource=admin"
         
-        db.client = AsyncIOMotorClient(connection_string)
+        db.client = AsyncIOMotorClient(connection_string, event_listeners=[MongoCommandMetrics()])
         db.database = db.client[mongo_database]
         
         # Проверяем подключение
@@ -59,7 +106,8 @@ def connect_to_minio():
             minio_endpoint,
             access_key=minio_user,
             secret_key=minio_password,
-            secure=False
+            secure=False,
+            http_client=_minio_http_client()
         )
         
         buckets = db.minio_client.list_buckets()
@@ -1,6 +1,7 @@
 # src\ai-services\database\dual_lstm_storage.py
 from database.database import get_database
-from typing import Dict, Any, List
+from database.write_behind import write_behind
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 import uuid
 
@@ -10,14 +11,13 @@ async def save_inference_result(
     batch_id: str,
     input_data: List[List[float]],
     predictions: Dict[str, Any],
-    metadata: Dict[str, Any]
+    metadata: Dict[str, Any],
+    model_version: str
 ) -> str:
     """
-    Сохранение результата инференса в MongoDB
+    Сохранение результата инференса в MongoDB (через отложенную запись);
+    model_version — версия модели, которая действительно считала прогноз
     """
-    db = get_database()
-    collection = db.dual_lstm_results
-    
     document = {
         "_id": inference_id,
         "batch_id": batch_id,
@@ -29,11 +29,10 @@ async def save_inference_result(
         "predictions": predictions,
         "metadata": metadata,
         "created_at": datetime.utcnow(),
-        "model_version": "dual_lstm_original_20250806_225816"
+        "model_version": model_version
     }
     
-    result = await collection.insert_one(document)
-    return str(result.inserted_id)
+    return await write_behind.insert("dual_lstm_results", document)
 
 
 async def get_inference_result(inference_id: str) -> Dict[str, Any]:
@@ -52,14 +51,16 @@ async def get_inference_result(inference_id: str) -> Dict[str, Any]:
     return None
 
 
-async def get_batch_results(batch_id: str) -> List[Dict[str, Any]]:
+async def get_batch_results(batch_id: str, result_version: Optional[str] = None) -> List[Dict[str, Any]]:
     """
-    Получение всех результатов для батча
+    Получение всех результатов для батча: по умолчанию — результаты пайплайна,
+    с result_version — только этой версии перерасчёта
     """
     db = get_database()
     collection = db.dual_lstm_results
     
-    cursor = collection.find({"batch_id": batch_id})
+    query = {"batch_id": batch_id, "result_version": result_version or {"$exists": False}}
+    cursor = collection.find(query)
     results = []
     
     async for doc in cursor:
@@ -69,6 +70,23 @@ async def get_batch_results(batch_id: str) -> List[Dict[str, Any]]:
     return results
 
 
+async def delete_superseded(batch_id: str, keep_id: str) -> int:
+    """
+    Удаление прежних результатов пайплайна после перезапуска этапа;
+    результаты версий перерасчёта не трогаются
+    """
+    db = get_database()
+    collection = db.dual_lstm_results
+    
+    result = await collection.delete_many({
+        "batch_id": batch_id,
+        "_id": {"$ne": keep_id},
+        "result_version": {"$exists": False}
+    })
+    
+    return result.deleted_count
+
+
 async def get_recent_inferences(limit: int = 100) -> List[Dict[str, Any]]:
     """
     Получение последних инференсов
@@ -1,4 +1,6 @@
 from database.database import get_database
+from database.write_behind import write_behind
+from models.feature_schema import FeatureMatrix
 from datetime import datetime
 import uuid
 from typing import Dict, Any, Optional, List
@@ -9,30 +11,34 @@ class FeatureStorage:
     def collection(self):
         return get_database().feature_extractions
     
-    async def save_features(self, user_id: str, features: dict, metadata: dict, batch_id: str = None):
+    async def save_features(self, user_id: str, features: FeatureMatrix, metadata: dict, batch_id: str = None):
         doc = {
             "_id": str(uuid.uuid4()),
             "batch_id": batch_id,
             "user_id": user_id,
-            "features": features,
+            "features": features.to_document(),
             "metadata": metadata,
             "created_at": datetime.utcnow(),
-            "feature_count": self._count_features(features)
+            "feature_count": features.schema.size
         }
         
-        result = await self.collection.insert_one(doc)
-        return str(result.inserted_id)
+        return await write_behind.insert("feature_extractions", doc)
 
-    async def get_features_by_batch_id(self, batch_id: str):
-        doc = await self.collection.find_one({"batch_id": batch_id}, {"_id": 0})
-        return doc
+    async def get_feature_matrix_by_batch_id(self, batch_id: str) -> Optional[FeatureMatrix]:
+        """Признаки батча матрицей — для внутренних потребителей, без словарей"""
+        doc = await self.collection.find_one(_batch_query(batch_id), {"features": 1})
+        return FeatureMatrix.from_document(doc["features"]) if doc else None
+
+    async def get_features_by_batch_id(self, batch_id: str, result_version: Optional[str] = None):
+        doc = await self.collection.find_one(_batch_query(batch_id, result_version), {"_id": 0})
+        return self._to_api(doc)
     
     async def get_features(self, extraction_id: str) -> Optional[Dict[str, Any]]:
-        return await self.collection.find_one({"_id": extraction_id})
+        return self._to_api(await self.collection.find_one({"_id": extraction_id}))
     
     async def get_user_extractions(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         cursor = self.collection.find(
-            {"user_id": user_id}, 
+            {"user_id": user_id, "result_version": {"$exists": False}}, 
             {"features": 0}
         ).sort("created_at", -1).limit(limit)
         return await cursor.to_list(length=limit)
@@ -43,20 +49,16 @@ class FeatureStorage:
             "user_id": user_id
         })
         return result.deleted_count > 0
-    
-    def _count_features(self, features: Dict[str, Any]) -> int:
-        if "windows" in features:
-            if features["windows"]:
-                first_window = features["windows"][0]
-                count = 0
-                for group_name, group_features in first_window.items():
-                    if isinstance(group_features, dict):
-                        count += len([k for k in group_features.keys() if not k.startswith('window_')])
-                return count
-            return 0
-        else:
-            count = 0
-            for group_name, group_features in features.items():
-                if isinstance(group_features, dict):
-                    count += len(group_features)
-            return count
+
+    def _to_api(self, doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Документ для ответа клиенту: матрица разворачивается в прежние словари окон"""
+        if doc and "features" in doc:
+            doc["features"] = FeatureMatrix.from_document(doc["features"]).to_dicts()
+        return doc
+
+
+def _batch_query(batch_id: str, result_version: Optional[str] = None) -> Dict[str, Any]:
+    """Признаки пайплайна или, с result_version, признаки этой версии перерасчёта"""
+    return {"batch_id": batch_id, "result_version": result_version or {"$exists": False}}
+
+feature_storage = FeatureStorage()
@@ -1,4 +1,5 @@
 from database.database import get_database
+from database.write_behind import write_behind
 from typing import Dict, Any, List
 from datetime import datetime
 
@@ -10,9 +11,6 @@ async def save_hybrid_inference_result(
     predictions: Dict[str, Any],
     metadata: Dict[str, Any]
 ) -> str:
-    db = get_database()
-    collection = db.hybrid_lstm_results
-    
     document = {
         "_id": inference_id,
         "batch_id": batch_id,
@@ -28,8 +26,7 @@ async def save_hybrid_inference_result(
         "model_type": "hybrid_lstm_attention"
     }
     
-    result = await collection.insert_one(document)
-    return str(result.inserted_id)
+    return await write_behind.insert("hybrid_lstm_results", document)
 
 
 async def get_hybrid_inference_result(inference_id: str) -> Dict[str, Any]:
@@ -0,0 +1,292 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from database.database import get_database
+from utils.logger import log
+from utils.metrics import Counter
+
+MODULE = "lease_queue"
+
+# local — сессии и задания живут в памяти процесса, как раньше;
+# distributed — раздаются через Mongo любому числу реплик
+WORK_QUEUE_MODE = os.getenv("WORK_QUEUE_MODE", "local").lower()
+DISTRIBUTED = WORK_QUEUE_MODE == "distributed"
+WORK_LEASE_TTL_S = float(os.getenv("WORK_LEASE_TTL_S", 30))
+WORK_HEARTBEAT_INTERVAL_S = float(os.getenv("WORK_HEARTBEAT_INTERVAL_S", 10))
+WORK_CLAIM_INTERVAL_S = float(os.getenv("WORK_CLAIM_INTERVAL_S", 2))
+WORK_MAX_ATTEMPTS = int(os.getenv("WORK_MAX_ATTEMPTS", 3))
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+_COLLECTION_NAME = "work_items"
+
+ACTIVE_STATES = ("pending", "leased")
+FINAL_STATES = ("completed", "failed", "cancelled")
+
+LEASE_EVENTS = Counter(
+    "work_lease_events_total",
+    "События аренд: claimed, reclaimed (после истёкшей аренды), lost, released, finished",
+    ("kind", "event")
+)
+
+
+class LeaseQueue:
+    """
+    Очередь работы в коллекции work_items с арендами.
+
+    Элемент (потоковая сессия или задание пайплайна) берёт тот воркер, который
+    первым атомарно перевёл его в leased; владелец продлевает аренду
+    heartbeat'ом. Если воркер умер, аренда истекает через WORK_LEASE_TTL_S,
+    и элемент забирает другой воркер — так сессия переезжает на живой узел.
+    Остановка — флаг stop_requested, который владелец видит на heartbeat.
+    """
+
+    def __init__(self, worker_id: str = WORKER_ID, lease_ttl_s: float = WORK_LEASE_TTL_S):
+        self.worker_id = worker_id
+        self.lease_ttl = timedelta(seconds=lease_ttl_s)
+        self._indexes_ready = False
+
+    def _collection(self):
+        return get_database()[_COLLECTION_NAME]
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        try:
+            await self._collection().create_index([("kind", 1), ("state", 1), ("created_at", 1)])
+            await self._collection().create_index([("kind", 1), ("key", 1)])
+            self._indexes_ready = True
+        except PyMongoError as e:
+            log(f"Work queue indexes not created: {e}", MODULE, level="WARN")
+
+    async def enqueue(self, kind: str, key: str, payload: Dict[str, Any],
+                      item_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Ставит элемент в очередь. С item_id элемент единственный: None, если
+        такой уже активен; завершённый перезаписывается.
+        """
+        now = datetime.utcnow()
+        doc = {
+            "kind": kind,
+            "key": key,
+            "payload": payload,
+            "state": "pending",
+            "owner": None,
+            "lease_expires_at": None,
+            "heartbeat_at": None,
+            "attempts": 0,
+            "stop_requested": False,
+            "status": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None
+        }
+        try:
+            return await self._collection().find_one_and_update(
+                {"_id": item_id or str(uuid.uuid4()), "state": {"$in": list(FINAL_STATES)}},
+                {"$set": doc},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return None
+
+    async def claim(self, kind: str, max_attempts: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Берёт старейший свободный элемент или элемент с истёкшей арендой"""
+        now = datetime.utcnow()
+        query: Dict[str, Any] = {
+            "kind": kind,
+            "stop_requested": False,
+            "$or": [{"state": "pending"}, {"state": "leased", "lease_expires_at": {"$lt": now}}]
+        }
+        if max_attempts is not None:
+            query["attempts"] = {"$lt": max_attempts}
+        doc = await self._collection().find_one_and_update(
+            query,
+            {
+                "$set": {"state": "leased", "owner": self.worker_id, "lease_expires_at": now + self.lease_ttl,
+                         "heartbeat_at": now, "started_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is not None:
+            event = "claimed" if doc["attempts"] == 1 else "reclaimed"
+            LEASE_EVENTS.labels(kind, event).inc()
+            log(f"Claimed {kind} {doc['_id']} (attempt {doc['attempts']})", MODULE)
+        return doc
+
+    async def reap(self, kind: str, max_attempts: Optional[int] = None):
+        """Закрывает брошенные элементы, которые уже никто не возьмёт"""
+        now = datetime.utcnow()
+        expired = {"kind": kind, "state": "leased", "lease_expires_at": {"$lt": now}}
+        await self._collection().update_many(
+            {**expired, "stop_requested": True},
+            {"$set": {"state": "cancelled", "owner": None, "finished_at": now}}
+        )
+        if max_attempts is not None:
+            await self._collection().update_many(
+                {**expired, "attempts": {"$gte": max_attempts}},
+                {"$set": {"state": "failed", "owner": None, "finished_at": now,
+                          "error": f"Lease expired {max_attempts} time(s), worker lost"}}
+            )
+
+    async def heartbeat(self, item_id: str, status: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Продлевает аренду; None — аренда потеряна (истекла и перехвачена или элемент закрыт)"""
+        now = datetime.utcnow()
+        update: Dict[str, Any] = {"lease_expires_at": now + self.lease_ttl, "heartbeat_at": now}
+        if status is not None:
+            update["status"] = status
+        return await self._collection().find_one_and_update(
+            {"_id": item_id, "owner": self.worker_id, "state": "leased"},
+            {"$set": update},
+            projection={"stop_requested": 1}
+        )
+
+    async def finish(self, item_id: str, state: str, result: Optional[Dict[str, Any]] = None,
+                     error: Optional[str] = None, status: Optional[Dict[str, Any]] = None) -> bool:
+        update: Dict[str, Any] = {"state": state, "result": result, "error": error, "finished_at": datetime.utcnow(),
+                                  "lease_expires_at": None}
+        if status is not None:
+            update["status"] = status
+        outcome = await self._collection().update_one(
+            {"_id": item_id, "owner": self.worker_id, "state": "leased"}, {"$set": update}
+        )
+        return outcome.modified_count == 1
+
+    async def release(self, item_id: str, status: Optional[Dict[str, Any]] = None) -> bool:
+        """Возвращает элемент в очередь без ожидания истечения аренды — при штатной остановке узла"""
+        update: Dict[str, Any] = {"state": "pending", "owner": None, "lease_expires_at": None}
+        if status is not None:
+            update["status"] = status
+        outcome = await self._collection().update_one(
+            {"_id": item_id, "owner": self.worker_id, "state": "leased"}, {"$set": update}
+        )
+        return outcome.modified_count == 1
+
+    async def request_stop(self, item_id: str) -> Optional[Dict[str, Any]]:
+        """Ожидающий элемент отменяется сразу, арендованный — получает stop_requested"""
+        now = datetime.utcnow()
+        doc = await self._collection().find_one_and_update(
+            {"_id": item_id, "state": "pending"},
+            {"$set": {"state": "cancelled", "finished_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is not None:
+            return doc
+        return await self._collection().find_one_and_update(
+            {"_id": item_id, "state": "leased"},
+            {"$set": {"stop_requested": True}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def get(self, item_id: str) -> Optional[Dict[str, Any]]:
+        return await self._collection().find_one({"_id": item_id})
+
+    async def list_active(self, kind: str) -> List[Dict[str, Any]]:
+        cursor = self._collection().find({"kind": kind, "state": {"$in": list(ACTIVE_STATES)}}, {"payload": 0})
+        return await cursor.to_list(length=None)
+
+    async def count(self, kind: str, state: str) -> int:
+        return await self._collection().count_documents({"kind": kind, "state": state})
+
+
+lease_queue = LeaseQueue()
+
+
+class Lease:
+    """
+    Аренда, которую держит запущенная работа: фоновый heartbeat раз в
+    WORK_HEARTBEAT_INTERVAL_S с текущим статусом. on_stop вызывается, когда
+    остановку запросили через другой узел, on_lost — когда аренду перехватили.
+    """
+
+    def __init__(self, doc: Dict[str, Any], status_fn: Callable[[], Dict[str, Any]],
+                 on_stop: Callable[[], Awaitable[Any]], on_lost: Callable[[], Awaitable[Any]],
+                 queue: LeaseQueue = lease_queue):
+        self.item_id = doc["_id"]
+        self.kind = doc["kind"]
+        self.queue = queue
+        self.status_fn = status_fn
+        self.on_stop = on_stop
+        self.on_lost = on_lost
+        self.lost = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._keep())
+
+    async def finish(self, state: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        self._cancel_heartbeat()
+        if self.lost:
+            return
+        try:
+            if await self.queue.finish(self.item_id, state, result, error, status=self._status()):
+                LEASE_EVENTS.labels(self.kind, "finished").inc()
+            else:
+                log(f"Lease on {self.item_id} was gone when finishing as {state}", MODULE, level="WARN")
+        except PyMongoError as e:
+            log(f"Failed to finish {self.item_id}: {e}", MODULE, level="ERROR")
+
+    async def release(self):
+        self._cancel_heartbeat()
+        if self.lost:
+            return
+        try:
+            if await self.queue.release(self.item_id, status=self._status()):
+                LEASE_EVENTS.labels(self.kind, "released").inc()
+        except PyMongoError as e:
+            log(f"Failed to release {self.item_id}: {e}", MODULE, level="WARN")
+
+    def _cancel_heartbeat(self):
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def _status(self) -> Optional[Dict[str, Any]]:
+        try:
+            return self.status_fn()
+        except Exception:
+            return None
+
+    async def _keep(self):
+        while True:
+            await asyncio.sleep(WORK_HEARTBEAT_INTERVAL_S)
+            try:
+                doc = await self.queue.heartbeat(self.item_id, self._status())
+            except PyMongoError as e:
+                # Аренда ещё действует до lease_expires_at; следующий heartbeat повторит попытку
+                log(f"Heartbeat failed for {self.item_id}: {e}", MODULE, level="WARN")
+                continue
+            if doc is None:
+                self.lost = True
+                LEASE_EVENTS.labels(self.kind, "lost").inc()
+                log(f"Lease lost on {self.item_id}, stopping local work", MODULE, level="WARN")
+                await self.on_lost()
+                return
+            if doc.get("stop_requested"):
+                log(f"Stop requested for {self.item_id}", MODULE)
+                await self.on_stop()
+                return
+
+
+async def poll_claim(kind: str, max_attempts: Optional[int] = None) -> Dict[str, Any]:
+    """Ждёт, пока в очереди появится элемент, и берёт его"""
+    while True:
+        try:
+            await lease_queue.reap(kind, max_attempts)
+            doc = await lease_queue.claim(kind, max_attempts)
+        except PyMongoError as e:
+            log(f"Claim failed for {kind}: {e}", MODULE, level="WARN")
+            doc = None
+        if doc is not None:
+            return doc
+        await asyncio.sleep(WORK_CLAIM_INTERVAL_S)
@@ -0,0 +1,29 @@
+# src\ai-services\database\profile_storage.py
+from database.database import get_database
+from database.write_behind import write_behind
+from typing import Dict, Any, Optional
+from datetime import datetime
+
+
+async def save_pipeline_profile(batch_id: str, pipeline_id: str, profile: Dict[str, Any]) -> str:
+    """
+    Профиль запуска пайплайна рядом с результатами батча (через отложенную запись)
+    """
+    document = {
+        "batch_id": batch_id,
+        "pipeline_id": pipeline_id,
+        "profile": profile,
+        "created_at": datetime.utcnow()
+    }
+    return await write_behind.insert("pipeline_profiles", document)
+
+
+async def get_pipeline_profile(batch_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Последний профиль батча
+    """
+    db = get_database()
+    result = await db.pipeline_profiles.find_one({"batch_id": batch_id}, sort=[("created_at", -1)])
+    if result:
+        result["_id"] = str(result["_id"])
+    return result
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from database.database import get_database
+from database.write_behind import write_behind
+from utils.logger import log
+from utils.metrics import CallbackMetric, Counter
+
+MODULE = "window_cache"
+
+WINDOW_CACHE_ENABLED = os.getenv("WINDOW_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+WINDOW_CACHE_MAX_MB = int(os.getenv("WINDOW_CACHE_MAX_MB", 256))
+WINDOW_CACHE_MONGO = os.getenv("WINDOW_CACHE_MONGO", "false").lower() in ("1", "true", "yes")
+WINDOW_CACHE_MONGO_TTL_DAYS = int(os.getenv("WINDOW_CACHE_MONGO_TTL_DAYS", 7))
+
+# Меняется при любом изменении расчёта признаков, чтобы старые строки не подмешивались
+FEATURE_EXTRACTOR_VERSION = "motor_features_v1"
+
+_COLLECTION_NAME = "window_cache"
+
+CACHE_REQUESTS = Counter(
+    "window_cache_requests_total",
+    "Обращения к кэшу окон: hit/miss в памяти, mongo_hit — подтянуто из Mongo перед расчётом",
+    ("namespace", "result")
+)
+
+
+def window_key(*arrays: np.ndarray, salt: str) -> str:
+    """BLAKE2b по сырым отсчётам окна и версии расчёта; ~1 ГБ/с, на порядки дешевле DSP"""
+    digest = hashlib.blake2b(salt.encode(), digest_size=20)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str(array.dtype).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+class WindowResultCache:
+    """
+    Кэш результатов по содержимому окна.
+
+    Пространства имён: features — строка признаков окна (ключ — отсчёты трёх
+    фаз, размер окна и версия экстрактора), autoencoder — результат окна
+    (ключ — вектор признаков, версия модели и бэкенд). Первый уровень — LRU
+    в памяти, ограниченный WINDOW_CACHE_MAX_MB; второй, опциональный —
+    коллекция Mongo с TTL, общая для реплик и переживающая перезапуск.
+    """
+
+    def __init__(self, enabled: bool = WINDOW_CACHE_ENABLED, max_bytes: int = WINDOW_CACHE_MAX_MB * 1024 * 1024,
+                 mongo: bool = WINDOW_CACHE_MONGO):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.mongo = mongo
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._outbox: List[Tuple[str, str, Any]] = []
+        self._index_ready = False
+        self.evictions = 0
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None:
+                self._entries.move_to_end((namespace, key))
+        CACHE_REQUESTS.labels(namespace, "hit" if entry is not None else "miss").inc()
+        return entry[0] if entry is not None else None
+
+    def put(self, namespace: str, key: str, value: Any, persist: bool = True):
+        """Кладёт значение в память; для второго уровня — в очередь, которую сбрасывает persist_pending()"""
+        if not self.enabled:
+            return
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop((namespace, key), None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[(namespace, key)] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+            if self.mongo and persist:
+                self._outbox.append((namespace, key, value))
+
+    async def prefetch(self, namespace: str, keys: Iterable[str]):
+        """Подтягивает из Mongo в память ключи, которых нет в памяти"""
+        if not (self.enabled and self.mongo):
+            return
+        with self._lock:
+            missing = list({key for key in keys if (namespace, key) not in self._entries})
+        if not missing:
+            return
+        try:
+            cursor = get_database()[_COLLECTION_NAME].find(
+                {"_id": {"$in": [f"{namespace}:{key}" for key in missing]}}, {"value": 1}
+            )
+            found = 0
+            async for doc in cursor:
+                self.put(namespace, doc["_id"].split(":", 1)[1], doc["value"], persist=False)
+                found += 1
+        except Exception as e:
+            log(f"Window cache prefetch failed: {e}", MODULE, level="WARN")
+            return
+        if found:
+            CACHE_REQUESTS.labels(namespace, "mongo_hit").inc(found)
+
+    async def persist_pending(self):
+        """Отправляет новые записи во второй уровень через отложенную запись"""
+        if not (self.enabled and self.mongo):
+            return
+        with self._lock:
+            pending, self._outbox = self._outbox, []
+        if not pending:
+            return
+        await self._ensure_index()
+        for namespace, key, value in pending:
+            await write_behind.replace(_COLLECTION_NAME, {
+                "_id": f"{namespace}:{key}",
+                "namespace": namespace,
+                "value": value,
+                "created_at": datetime.utcnow()
+            })
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for namespace, _ in self._entries.keys():
+                counts[namespace] = counts.get(namespace, 0) + 1
+            requests: Dict[str, Dict[str, int]] = {}
+            for labels, value in CACHE_REQUESTS.values():
+                requests.setdefault(labels["namespace"], {})[labels["result"]] = int(value)
+            return {
+                "enabled": self.enabled,
+                "mongo_tier": self.mongo,
+                "max_bytes": self.max_bytes,
+                "used_bytes": self._bytes,
+                "entries": counts,
+                "evictions": self.evictions,
+                "requests": requests
+            }
+
+    async def _ensure_index(self):
+        if self._index_ready:
+            return
+        try:
+            await get_database()[_COLLECTION_NAME].create_index(
+                "created_at", expireAfterSeconds=WINDOW_CACHE_MONGO_TTL_DAYS * 86400
+            )
+            self._index_ready = True
+        except Exception as e:
+            log(f"Window cache TTL index not created: {e}", MODULE, level="WARN")
+
+
+window_cache = WindowResultCache()
+
+CallbackMetric("window_cache_bytes", "Объём кэша окон в памяти, байт", lambda: window_cache._bytes)
+CallbackMetric("window_cache_evictions_total", "Вытеснений из кэша окон", lambda: window_cache.evictions,
+               kind="counter")
@@ -0,0 +1,316 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from bson import ObjectId
+from pymongo import InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from database.database import get_database
+from utils.logger import log
+from utils.metrics import CallbackMetric, Histogram
+
+MODULE = "write_behind"
+
+PERSIST_WRITE_BEHIND = os.getenv("PERSIST_WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+PERSIST_FLUSH_MAX_DOCS = int(os.getenv("PERSIST_FLUSH_MAX_DOCS", 200))
+PERSIST_FLUSH_INTERVAL_MS = float(os.getenv("PERSIST_FLUSH_INTERVAL_MS", 200))
+PERSIST_SPOOL_MAX_DOCS = int(os.getenv("PERSIST_SPOOL_MAX_DOCS", 10000))
+PERSIST_MAX_RETRIES = int(os.getenv("PERSIST_MAX_RETRIES", 5))
+PERSIST_RETRY_BASE_MS = float(os.getenv("PERSIST_RETRY_BASE_MS", 100))
+PERSIST_SHUTDOWN_TIMEOUT_S = float(os.getenv("PERSIST_SHUTDOWN_TIMEOUT_S", 30))
+# Сколько запрос ждёт записи своего батча; дольше — ответ без подтверждения записи
+PERSIST_WAIT_TIMEOUT_MS = float(os.getenv("PERSIST_WAIT_TIMEOUT_MS", 5000))
+
+LAG_MS_BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+FLUSH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 200, 500, 1000)
+FLUSH_MS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+_DUPLICATE_KEY = 11000
+
+
+class _PendingWrite:
+    __slots__ = ("collection", "doc", "upsert_filter", "batch_id", "future", "enqueued_at", "attempts")
+
+    def __init__(self, collection: str, doc: Dict[str, Any], upsert_filter: Optional[Dict[str, Any]],
+                 future: asyncio.Future):
+        self.collection = collection
+        self.doc = doc
+        self.upsert_filter = upsert_filter
+        self.batch_id = doc.get("batch_id")
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.attempts = 0
+
+    def operation(self):
+        if self.upsert_filter is not None:
+            return ReplaceOne(self.upsert_filter, self.doc, upsert=True)
+        return InsertOne(self.doc)
+
+
+class WriteBehindWriter:
+    """
+    Отложенная запись результатов в MongoDB.
+
+    Документы ставятся в локальную очередь и пишутся группами через bulk_write,
+    когда набралось PERSIST_FLUSH_MAX_DOCS или старейший ждёт дольше
+    PERSIST_FLUSH_INTERVAL_MS. _id присваивается при постановке, поэтому
+    повтор после сетевой ошибки не создаёт дублей. Очередь ограничена:
+    при переполнении постановка ждёт, пока запись догонит. Документ, не
+    записанный за PERSIST_MAX_RETRIES попыток, остаётся в очереди, но его
+    ожидающие получают отказ, а не висят до конца сбоя.
+    """
+
+    def __init__(self, enabled: bool = PERSIST_WRITE_BEHIND, max_batch: int = PERSIST_FLUSH_MAX_DOCS,
+                 interval_ms: float = PERSIST_FLUSH_INTERVAL_MS, spool_size: int = PERSIST_SPOOL_MAX_DOCS):
+        self.enabled = enabled
+        self.max_batch = max(1, max_batch)
+        self.interval_ms = max(0.0, interval_ms)
+        self.spool_size = max(self.max_batch, spool_size)
+        self._spool: Deque[_PendingWrite] = deque()
+        self._by_batch: Dict[str, Set[asyncio.Future]] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+        # кто-то ждёт записи батча — группа пишется, не дожидаясь interval_ms
+        self._urgent = False
+        self.lag_histogram = Histogram("persist_lag_ms", "Задержка от постановки до записи в Mongo, мс", LAG_MS_BUCKETS)
+        self.flush_size_histogram = Histogram("persist_flush_size", "Документов в одной групповой записи", FLUSH_SIZE_BUCKETS)
+        self.flush_ms_histogram = Histogram("persist_flush_ms", "Длительность bulk_write, мс", FLUSH_MS_BUCKETS)
+        self.enqueued = 0
+        self.written = 0
+        self.retries = 0
+        self.failed = 0
+        self.dropped = 0
+        self.backpressure_waits = 0
+
+    @property
+    def running(self) -> bool:
+        return self._flusher is not None and not self._flusher.done()
+
+    def start(self):
+        if not self.enabled or self.running:
+            return
+        self._wake = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._stopping = False
+        self._flusher = asyncio.create_task(self._run())
+        log(f"Write-behind started: batch={self.max_batch}, interval={self.interval_ms}ms, "
+            f"spool={self.spool_size}", MODULE)
+
+    async def stop(self, timeout: float = PERSIST_SHUTDOWN_TIMEOUT_S):
+        """Дописывает очередь до таймаута; что не успело — теряется и учитывается в dropped"""
+        if not self.running:
+            return
+        self._stopping = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._flusher), timeout)
+        except asyncio.TimeoutError:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        while self._spool:
+            self._resolve(self._spool.popleft(), False)
+            self.dropped += 1
+        if self.dropped:
+            log(f"Write-behind stopped with {self.dropped} unwritten document(s)", MODULE, level="ERROR")
+        else:
+            log("Write-behind flushed and stopped", MODULE)
+        self._flusher = None
+
+    async def insert(self, collection: str, doc: Dict[str, Any]) -> str:
+        """Ставит документ на вставку и возвращает его _id, не дожидаясь записи"""
+        doc.setdefault("_id", ObjectId())
+        await self._enqueue(collection, doc, None)
+        return str(doc["_id"])
+
+    async def replace(self, collection: str, doc: Dict[str, Any]) -> str:
+        """Ставит upsert документа по _id; повторные замены одного _id в группе схлопываются"""
+        await self._enqueue(collection, doc, {"_id": doc["_id"]})
+        return str(doc["_id"])
+
+    async def wait_for_batch(self, batch_id: str, timeout_ms: Optional[float] = PERSIST_WAIT_TIMEOUT_MS) -> bool:
+        """
+        Ждёт записи всех поставленных документов батча, не дольше timeout_ms;
+        False — часть не записана или ещё ждёт в очереди
+        """
+        futures = list(self._by_batch.get(batch_id, ()))
+        if not futures:
+            return True
+        if self.running:
+            self._urgent = True
+            self._wake.set()
+        done, pending = await asyncio.wait(futures, timeout=timeout_ms / 1000 if timeout_ms else None)
+        return not pending and all(future.result() for future in done)
+
+    def stats(self) -> dict:
+        oldest = self._spool[0].enqueued_at if self._spool else None
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "spool_depth": len(self._spool),
+            "spool_size": self.spool_size,
+            "oldest_pending_ms": round((time.perf_counter() - oldest) * 1000, 1) if oldest else 0.0,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "retries": self.retries,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "backpressure_waits": self.backpressure_waits,
+            "lag_ms": self.lag_histogram.snapshot(),
+            "flush_size": self.flush_size_histogram.snapshot(),
+            "flush_ms": self.flush_ms_histogram.snapshot()
+        }
+
+    async def _enqueue(self, collection: str, doc: Dict[str, Any], upsert_filter: Optional[Dict[str, Any]]):
+        self.enqueued += 1
+        if not self.running:
+            await self._write_direct(collection, doc, upsert_filter)
+            self.written += 1
+            return
+
+        async with self._space:
+            if len(self._spool) >= self.spool_size:
+                self.backpressure_waits += 1
+                log(f"Write-behind spool full ({self.spool_size}), waiting for Mongo", MODULE, level="WARN")
+                await self._space.wait_for(lambda: len(self._spool) < self.spool_size)
+
+        pending = _PendingWrite(collection, doc, upsert_filter, asyncio.get_running_loop().create_future())
+        self._spool.append(pending)
+        if pending.batch_id:
+            self._by_batch.setdefault(pending.batch_id, set()).add(pending.future)
+        if len(self._spool) >= self.max_batch:
+            self._wake.set()
+
+    async def _write_direct(self, collection: str, doc: Dict[str, Any], upsert_filter: Optional[Dict[str, Any]]):
+        coll = get_database()[collection]
+        if upsert_filter is not None:
+            await coll.replace_one(upsert_filter, doc, upsert=True)
+        else:
+            await coll.insert_one(doc)
+
+    async def _run(self):
+        while True:
+            if not self._spool:
+                if self._stopping:
+                    return
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            age_ms = (time.perf_counter() - self._spool[0].enqueued_at) * 1000
+            if (len(self._spool) < self.max_batch and age_ms < self.interval_ms and not self._stopping
+                    and not self._urgent):
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), (self.interval_ms - age_ms) / 1000)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._urgent = False
+            group = [self._spool.popleft() for _ in range(min(self.max_batch, len(self._spool)))]
+            async with self._space:
+                self._space.notify_all()
+
+            retry = await self._flush(group)
+            if retry:
+                self._spool.extendleft(reversed(retry))
+                delay = PERSIST_RETRY_BASE_MS * 2 ** min(max(p.attempts for p in retry) - 1, 6)
+                await asyncio.sleep(delay / 1000)
+
+    async def _flush(self, group: List[_PendingWrite]) -> List[_PendingWrite]:
+        """Пишет группу по коллекциям; возвращает то, что нужно повторить"""
+        by_collection: Dict[str, List[_PendingWrite]] = {}
+        for pending in group:
+            by_collection.setdefault(pending.collection, []).append(pending)
+
+        retry: List[_PendingWrite] = []
+        for collection, writes in by_collection.items():
+            writes = self._coalesce(writes)
+            started = time.perf_counter()
+            try:
+                await get_database()[collection].bulk_write([p.operation() for p in writes], ordered=False)
+                failed_indexes = set()
+            except BulkWriteError as e:
+                failed_indexes = set()
+                for error in e.details.get("writeErrors", []):
+                    if error.get("code") == _DUPLICATE_KEY and writes[error["index"]].upsert_filter is None:
+                        continue  # вставлен предыдущей попыткой
+                    failed_indexes.add(error["index"])
+                    log(f"Write to {collection} rejected: {error.get('errmsg')}", MODULE, level="ERROR")
+            except PyMongoError as e:
+                self.retries += 1
+                for pending in writes:
+                    pending.attempts += 1
+                exhausted = [p for p in writes if p.attempts > PERSIST_MAX_RETRIES]
+                log(f"Bulk write to {collection} failed ({len(writes)} docs), will retry: {e}", MODULE, level="WARN")
+                if exhausted and not self._stopping:
+                    if any(not p.future.done() for p in exhausted):
+                        log(f"{len(exhausted)} document(s) for {collection} exceeded {PERSIST_MAX_RETRIES} "
+                            f"retries, kept in spool, waiters released", MODULE, level="ERROR")
+                    for pending in exhausted:
+                        self._release(pending)
+                if self._stopping and exhausted:
+                    for pending in exhausted:
+                        self._resolve(pending, False)
+                        self.dropped += 1
+                    writes = [p for p in writes if p.attempts <= PERSIST_MAX_RETRIES]
+                retry.extend(writes)
+                continue
+
+            self.flush_ms_histogram.observe((time.perf_counter() - started) * 1000)
+            self.flush_size_histogram.observe(len(writes))
+            for ix, pending in enumerate(writes):
+                ok = ix not in failed_indexes
+                self._resolve(pending, ok)
+                if ok:
+                    self.written += 1
+                else:
+                    self.failed += 1
+        return retry
+
+    def _coalesce(self, writes: List[_PendingWrite]) -> List[_PendingWrite]:
+        """Из нескольких upsert одного _id в группе остаётся последний"""
+        latest: Dict[Any, _PendingWrite] = {}
+        result = []
+        for pending in writes:
+            if pending.upsert_filter is None:
+                result.append(pending)
+                continue
+            key = pending.upsert_filter["_id"]
+            superseded = latest.get(key)
+            if superseded is not None:
+                result.remove(superseded)
+                self._resolve(superseded, True)
+            latest[key] = pending
+            result.append(pending)
+        return result
+
+    def _resolve(self, pending: _PendingWrite, ok: bool):
+        if ok:
+            self.lag_histogram.observe((time.perf_counter() - pending.enqueued_at) * 1000)
+        self._release(pending, ok)
+
+    def _release(self, pending: _PendingWrite, ok: bool = False):
+        """Отвечает ожидающим документа; сам документ может остаться в очереди на повтор"""
+        if not pending.future.done():
+            pending.future.set_result(ok)
+        if pending.batch_id:
+            futures = self._by_batch.get(pending.batch_id)
+            if futures is not None:
+                futures.discard(pending.future)
+                if not futures:
+                    del self._by_batch[pending.batch_id]
+
+
+write_behind = WriteBehindWriter()
+
+CallbackMetric("persist_spool_depth", "Документов в очереди отложенной записи", lambda: len(write_behind._spool))
+CallbackMetric("persist_written_total", "Записано документов", lambda: write_behind.written, kind="counter")
+CallbackMetric("persist_retries_total", "Повторов групповой записи", lambda: write_behind.retries, kind="counter")
+CallbackMetric("persist_failed_total", "Документов, отклонённых Mongo", lambda: write_behind.failed, kind="counter")
+CallbackMetric("persist_dropped_total", "Документов, не записанных к остановке", lambda: write_behind.dropped, kind="counter")
@@ -7,23 +7,41 @@ os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
 os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
 
 import tensorflow as tf
+import asyncio
+import gc
 import json
 import threading
+import time
+from datetime import datetime
 from minio.error import S3Error
-from database.database import get_minio_client
+from database.artifact_cache import artifact_cache
 from utils.logger import log
+from contextlib import contextmanager
+from models.inference_batcher import MicroBatcher
+from models.model_registry import keras_model_bytes, model_registry
+from models.tflite_backend import load_tflite_backend
+from utils.metrics import MODEL_BATCH_SIZE, MODEL_CALL_MS
+from database.window_cache import window_cache, window_key
 
 
 MODULE = "autoencoder"
 MODEL_BUCKET = "models"
-MODEL_OBJECT = "multihead_attention_autoencoder_20250805_195221.weights.h5"
+MODEL_VERSION = os.getenv("AUTOENCODER_MODEL_VERSION", "multihead_attention_autoencoder_20250805_195221")
+MODEL_OBJECT = f"{MODEL_VERSION}.weights.h5"
 _MODEL_LOCK = threading.Lock()
+# Вызовы Keras-модели автоэнкодера по одному: MC-проходы в training=True меняют статистики
+# BatchNormalization и пересевают глобальный генератор TF, поэтому параллельный вызов из
+# другого потока (объяснения, прогрев, сборка при перезагрузке) увидел бы их посреди прохода
+_INFERENCE_LOCK = threading.RLock()
 _MODEL_CACHE = {}
+_RELOAD_LOCK = None
+_RELOAD_STATE = {"generation": 1, "last_reload": None}
 
 class AutoencoderInferenceInput(BaseModel):
     input: List[float] = Field(..., description="119 признаков для автоэнкодера")
     data_id: Optional[str] = None
     features: Optional[bool] = True
+    model_version: Optional[str] = Field(default=None, description="Версия модели, по умолчанию — текущая")
 
 class AttentionDetails(BaseModel):
     reconstruction_error: float
@@ -51,74 +69,125 @@ class AutoencoderBatchInferenceInput(BaseModel):
     batch_id: str = Field(..., description="ID батча")
     normalization_stats: Optional[dict] = None
     features: Optional[bool] = True
+    model_version: Optional[str] = Field(default=None, description="Версия модели, по умолчанию — текущая")
 
 class AutoencoderBatchInferenceOutput(BaseModel):
     results: List[AutoencoderInferenceOutput]
 
-def run_autoencoder_batch_inference(batch: List[List[float]], normalization_stats=None, features: bool = False):
+def run_autoencoder_batch_inference(batch: List[List[float]], normalization_stats=None, features: bool = False,
+                                    model_version: Optional[str] = None):
     """Батчевая обработка сэмплов автоэнкодером"""
-    outputs = []
-    for ix, sample in enumerate(batch):
-        data_id = f"sample_{ix}"
-        output = run_autoencoder_inference(
-            input_values=sample,
-            data_id=data_id,
-            request_id=f"req_{ix}",
-            features=features
+    if not batch:
+        return AutoencoderBatchInferenceOutput(results=[])
+    for sample in batch:
+        if len(sample) != 119:
+            raise ValueError("Input should be a list of 119 floats")
+    x = np.array(batch, dtype=np.float32).reshape(len(batch), -1)
+    with model_registry.acquire("autoencoder", model_version) as bundle:
+        outputs = _score_samples(
+            x,
+            [f"sample_{ix}" for ix in range(len(batch))],
+            [f"req_{ix}" for ix in range(len(batch))],
+            features,
+            bundle=bundle
         )
-        outputs.append(output)
     return AutoencoderBatchInferenceOutput(results=outputs)
 
 def _load_model_and_stats():
     """Загружает модель, статистики нормализации и пороги из S3"""
+    bundle = _get_model_bundle()
+    return bundle["model"], bundle["stats"], bundle["thresholds"]
+
+def _get_model_bundle():
+    """Текущий комплект модели; загружается при первом обращении"""
+    bundle = _MODEL_CACHE
+    if "model" in bundle:
+        return bundle
     with _MODEL_LOCK:
-        if "model" in _MODEL_CACHE:
-            return _MODEL_CACHE["model"], _MODEL_CACHE["stats"], _MODEL_CACHE["thresholds"]
+        if "model" not in _MODEL_CACHE:
+            _swap_model_bundle(_build_model_bundle())
+        return _MODEL_CACHE
+
+def _swap_model_bundle(bundle):
+    """Подменяет комплект одним присваиванием: запросы, уже взявшие старый, дорабатывают на нём"""
+    global _MODEL_CACHE
+    _MODEL_CACHE = bundle
+
+@contextmanager
+def _acquire_default_bundle():
+    yield _get_model_bundle()
+
+def _build_model_bundle(version: str = MODEL_VERSION):
+    """Собирает модель, пороги, статистики и TFLite-бэкенд в новый словарь, не трогая текущий"""
+    weights_fn = f"{version}.weights.h5"
+    thresh_fn = weights_fn.replace(".weights.h5", "_thresholds.json")
+    norm_fn = weights_fn.replace(".weights.h5", "_normalization_stats.json")
+
+    try:
+        weights_path, thresh_path, norm_path = artifact_cache.fetch_many(
+            MODEL_BUCKET, [weights_fn, thresh_fn, norm_fn]
+        )
+    except S3Error as e:
+        raise RuntimeError(f"Model artifact not found: {e}")
 
-        minio = get_minio_client()
-        tmp_dir = "/tmp"
+    log(f"Model artifacts loaded: {weights_fn}", MODULE)
 
-        weights_fn = MODEL_OBJECT
-        thresh_fn = weights_fn.replace(".weights.h5", "_thresholds.json")
-        norm_fn = weights_fn.replace(".weights.h5", "_normalization_stats.json")
-        
-        weights_path = os.path.join(tmp_dir, weights_fn)
-        thresh_path = os.path.join(tmp_dir, thresh_fn)
-        norm_path = os.path.join(tmp_dir, norm_fn)
-
-        if not os.path.exists(weights_path):
-            minio.fget_object(MODEL_BUCKET, weights_fn, weights_path)
-        if not os.path.exists(thresh_path):
-            minio.fget_object(MODEL_BUCKET, thresh_fn, thresh_path)
-        if not os.path.exists(norm_path):
-            try:
-                minio.fget_object(MODEL_BUCKET, norm_fn, norm_path)
-            except S3Error:
-                raise RuntimeError(f"Normalization stats file not found: {norm_fn}")
-
-        log(f"Model artifacts loaded: {weights_fn}", MODULE)
-
-        with open(norm_path) as f:
-            stats = json.load(f)
-            stats = {
-                "mean": np.array(stats["mean"]),
-                "std": np.array(stats["std"])
-            }
+    with open(norm_path) as f:
+        stats = json.load(f)
+        stats = {
+            "mean": np.array(stats["mean"]),
+            "std": np.array(stats["std"])
+        }
 
-        model = _build_autoencoder_model()
-        dummy_input = np.zeros((1, 119)).astype(np.float32)
-        model(dummy_input)
-        model.load_weights(weights_path)
-        
-        with open(thresh_path) as f:
-            loaded_thresholds = json.load(f)
-            
-        _MODEL_CACHE["model"] = model
-        _MODEL_CACHE["thresholds"] = loaded_thresholds
-        _MODEL_CACHE["stats"] = stats
+    model = _build_autoencoder_model()
+    dummy_input = np.zeros((1, 119)).astype(np.float32)
+    model(dummy_input)
+    model.load_weights(weights_path)
+    
+    with open(thresh_path) as f:
+        loaded_thresholds = json.load(f)
         
-        log(f"Model loaded successfully, parameters: {model.count_params()}", MODULE)
-        return model, stats, loaded_thresholds
+    bundle = {
+        "model": model,
+        "thresholds": loaded_thresholds,
+        "stats": stats,
+        "tflite": load_tflite_backend("autoencoder", weights_fn),
+        "version": version
+    }
+    
+    log(f"Model loaded successfully, parameters: {model.count_params()}", MODULE)
+    return bundle
+
+def _build_warm_model_bundle(version: str = MODEL_VERSION):
+    bundle = _build_model_bundle(version)
+    _score_samples(np.zeros((1, 119), dtype=np.float32), ["warmup"], ["warmup"],
+                   features=True, bundle=bundle)
+    return bundle
+
+async def reload_autoencoder_model():
+    """
+    Горячая перезагрузка: новый комплект собирается и прогревается в потоке,
+    затем атомарно подменяет текущий. Старый освобождается сборщиком мусора,
+    когда на него перестанут ссылаться незавершённые запросы.
+    """
+    global _RELOAD_LOCK
+    if _RELOAD_LOCK is None:
+        _RELOAD_LOCK = asyncio.Lock()
+
+    async with _RELOAD_LOCK:
+        started = time.perf_counter()
+        bundle = await asyncio.to_thread(_build_warm_model_bundle)
+        with _MODEL_LOCK:
+            _swap_model_bundle(bundle)
+        gc.collect()
+        _RELOAD_STATE["generation"] += 1
+        _RELOAD_STATE["last_reload"] = {
+            "generation": _RELOAD_STATE["generation"],
+            "build_time_ms": round((time.perf_counter() - started) * 1000, 1),
+            "completed_at": datetime.utcnow().isoformat()
+        }
+        log(f"Autoencoder swapped to generation {_RELOAD_STATE['generation']}", MODULE)
+        return dict(_RELOAD_STATE["last_reload"], parameters=int(bundle["model"].count_params()))
 
 def _build_autoencoder_model():
     """Создает архитектуру MultiHead Attention Autoencoder"""
@@ -211,83 +280,174 @@ def _build_autoencoder_model():
 
     return MultiHeadAttentionAutoencoder()
 
-def run_autoencoder_inference(input_values: List[float], data_id: str, request_id: str, features: bool = False):
+COMPONENTS = ['bearing', 'eccentricity', 'rotor', 'stator']
+FEATURE_RANGES = [(17, 47), (47, 76), (76, 91), (91, 119)]
+COMMON_FEATURE_NAMES = [
+    'rms_A', 'mean_A', 'std_A', 'rms_B', 'mean_B', 'std_B',
+    'rms_C', 'mean_C', 'std_C', 'total_imb', 'rms_imb',
+    'imb_ab', 'imb_bc', 'imb_ca', 'park_ell', 'park_mean', 'park_std'
+]
+N_MONTE_CARLO = 5
+
+
+def _save_bn_states(model, bn_states, prefix=""):
+    for i, layer in enumerate(model.layers):
+        layer_name = f"{prefix}layer_{i}"
+        if isinstance(layer, tf.keras.layers.BatchNormalization):
+            bn_states[layer_name] = {
+                'moving_mean': layer.moving_mean.numpy().copy(),
+                'moving_variance': layer.moving_variance.numpy().copy()
+            }
+        elif hasattr(layer, 'layers'):
+            _save_bn_states(layer, bn_states, f"{layer_name}_")
+
+
+def _restore_bn_states(model, bn_states, prefix=""):
+    for i, layer in enumerate(model.layers):
+        layer_name = f"{prefix}layer_{i}"
+        if isinstance(layer, tf.keras.layers.BatchNormalization) and layer_name in bn_states:
+            layer.moving_mean.assign(bn_states[layer_name]['moving_mean'])
+            layer.moving_variance.assign(bn_states[layer_name]['moving_variance'])
+        elif hasattr(layer, 'layers'):
+            _restore_bn_states(layer, bn_states, f"{layer_name}_")
+
+
+def run_autoencoder_inference(input_values: List[float], data_id: str, request_id: str, features: bool = False,
+                              model_version: Optional[str] = None):
     """Выполняет инференс автоэнкодера для одного сэмпла"""
-    tf.random.set_seed(42)
-    np.random.seed(42)
-    
     if not isinstance(input_values, list) or len(input_values) != 119:
         raise ValueError("Input should be a list of 119 floats")
-    
+
     x = np.array(input_values, dtype=np.float32).reshape(1, -1)
-    model, stats, fixed_thresholds = _load_model_and_stats()
+    with model_registry.acquire("autoencoder", model_version) as bundle:
+        return _score_samples(x, [data_id], [request_id], features, bundle=bundle)[0]
+
+
+def _score_samples(x: np.ndarray, data_ids: List[str], request_ids: List[str], features: bool = False,
+                   bundle: Optional[Dict[str, Any]] = None, mc_passes: int = N_MONTE_CARLO):
+    with _INFERENCE_LOCK:
+        return _score_samples_locked(x, data_ids, request_ids, features, bundle, mc_passes)
+
+
+def _score_samples_locked(x: np.ndarray, data_ids: List[str], request_ids: List[str], features: bool,
+                          bundle: Optional[Dict[str, Any]], mc_passes: int):
+    """
+    Оценивает матрицу сэмплов (n, 119).
+
+    Базовый проход и извлечение латентов выполняются одним батчем (базовый проход —
+    через TFLite, если он включён и прошёл валидацию). Monte-Carlo
+    проходы идут по сэмплу: в режиме training=True BatchNormalization считает
+    статистики по батчу, и объединение сэмплов изменило бы их оценки.
+    Комплект модели берётся один раз, чтобы горячая перезагрузка не смешала версии.
+    mc_passes=0 — только базовый проход: неопределённость 0, attention базового прохода.
+    """
+    bundle = bundle or _get_model_bundle()
+    model, stats, fixed_thresholds = bundle["model"], bundle["stats"], bundle["thresholds"]
 
     normalized_x = (x - stats["mean"]) / stats["std"]
     normalized_x_tf = tf.convert_to_tensor(normalized_x.astype(np.float32))
 
-    components = ['bearing', 'eccentricity', 'rotor', 'stator']
-    feature_ranges = [(17, 47), (47, 76), (76, 91), (91, 119)]
-    common_feature_names = [
-        'rms_A', 'mean_A', 'std_A', 'rms_B', 'mean_B', 'std_B',
-        'rms_C', 'mean_C', 'std_C', 'total_imb', 'rms_imb',
-        'imb_ab', 'imb_bc', 'imb_ca', 'park_ell', 'park_mean', 'park_std'
-    ]
-
     bn_states = {}
-    
-    def save_bn_states(model, prefix=""):
-        for i, layer in enumerate(model.layers):
-            layer_name = f"{prefix}layer_{i}"
-            if isinstance(layer, tf.keras.layers.BatchNormalization):
-                bn_states[layer_name] = {
-                    'moving_mean': layer.moving_mean.numpy().copy(),
-                    'moving_variance': layer.moving_variance.numpy().copy()
-                }
-            elif hasattr(layer, 'layers'):
-                save_bn_states(layer, f"{layer_name}_")
-    
-    def restore_bn_states(model, prefix=""):
-        for i, layer in enumerate(model.layers):
-            layer_name = f"{prefix}layer_{i}"
-            if isinstance(layer, tf.keras.layers.BatchNormalization) and layer_name in bn_states:
-                layer.moving_mean.assign(bn_states[layer_name]['moving_mean'])
-                layer.moving_variance.assign(bn_states[layer_name]['moving_variance'])
-            elif hasattr(layer, 'layers'):
-                restore_bn_states(layer, f"{layer_name}_")
-
-    save_bn_states(model)
-
-    baseline_pred, baseline_att = model(normalized_x_tf, training=False, return_attention=True)
-    
-    features_out = None
+    _save_bn_states(model, bn_states)
+
+    tflite_runner = bundle.get("tflite")
+    started = time.perf_counter()
+    if tflite_runner is not None:
+        tflite_outputs = tflite_runner.run(normalized_x)
+        baseline_pred_np = [tflite_outputs[comp] for comp in COMPONENTS]
+        baseline_att_np = {comp: tflite_outputs[f"attention_{comp}"] for comp in COMPONENTS}
+    else:
+        baseline_pred, baseline_att = model(normalized_x_tf, training=False, return_attention=True)
+        baseline_pred_np = [p.numpy() for p in baseline_pred]
+        baseline_att_np = {k: v.numpy() for k, v in baseline_att.items()}
+    MODEL_CALL_MS.labels("autoencoder", "tflite" if tflite_runner is not None else "keras").observe(
+        (time.perf_counter() - started) * 1000
+    )
+    MODEL_BATCH_SIZE.labels("autoencoder").observe(normalized_x.shape[0])
+
+    latents = None
     if features:
         shared_latent, component_latents = model.extract_component_latents(normalized_x_tf)
-        features_out = {
-            'shared_latent': shared_latent.numpy().tolist(),
-            'component_latents': {k: v.numpy().tolist() for k, v in component_latents.items()},
-            'attention_weights': {k: v[0].numpy().tolist() for k, v in baseline_att.items()}
-        }
-    
-    baseline_pred_np = [p.numpy() for p in baseline_pred]
-    baseline_att_np = {k: v.numpy() for k, v in baseline_att.items()}
+        latents = (
+            shared_latent.numpy(),
+            {k: v.numpy() for k, v in component_latents.items()},
+            baseline_att_np
+        )
 
-    n_monte_carlo = 5
-    mc_predictions, mc_attention_weights = [], []
-    
-    for mc_run in range(n_monte_carlo):
-        restore_bn_states(model)
-        preds, att = model(normalized_x_tf, training=True, return_attention=True)
-        mc_predictions.append([p.numpy() for p in preds])
-        mc_attention_weights.append({k: v.numpy() for k, v in att.items()})
-    
-    restore_bn_states(model)
+    outputs = []
+    for row in range(normalized_x.shape[0]):
+        tf.random.set_seed(42)
+        np.random.seed(42)
+
+        sample_tf = normalized_x_tf[row:row + 1]
+        mc_predictions, mc_attention_weights = [], []
+        for mc_run in range(mc_passes):
+            _restore_bn_states(model, bn_states)
+            preds, att = model(sample_tf, training=True, return_attention=True)
+            mc_predictions.append([p.numpy() for p in preds])
+            mc_attention_weights.append({k: v.numpy() for k, v in att.items()})
+
+        _restore_bn_states(model, bn_states)
+        if not mc_predictions:
+            mc_predictions = [[p[row:row + 1] for p in baseline_pred_np]]
+            mc_attention_weights = [{k: v[row:row + 1] for k, v in baseline_att_np.items()}]
+
+        features_out = _feature_row(latents, row) if latents is not None else None
+
+        output = _build_output(
+            normalized_x[row],
+            [p[row] for p in baseline_pred_np],
+            mc_predictions,
+            mc_attention_weights,
+            fixed_thresholds,
+            data_ids[row],
+            request_ids[row],
+            features_out
+        )
+        output.overall["model_version"] = bundle.get("version", MODEL_VERSION)
+        outputs.append(output)
+
+    return outputs
+
+
+def _feature_row(latents, row: int) -> Dict[str, Any]:
+    shared_np, component_np, attention_np = latents
+    return {
+        'shared_latent': shared_np[row:row + 1].tolist(),
+        'component_latents': {k: v[row:row + 1].tolist() for k, v in component_np.items()},
+        'attention_weights': {k: v[row].tolist() for k, v in attention_np.items()}
+    }
+
+
+def explain_samples(x: np.ndarray, bundle: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Латенты и attention базового прохода для матрицы (n, 119) — то же, что
+    autoencoder_features при features=True, но без Monte-Carlo и вердикта.
+    """
+    bundle = bundle or _get_model_bundle()
+    stats = bundle["stats"]
+    normalized_x_tf = tf.convert_to_tensor(((x - stats["mean"]) / stats["std"]).astype(np.float32))
+
+    with _INFERENCE_LOCK:
+        _, attention = bundle["model"](normalized_x_tf, training=False, return_attention=True)
+        shared_latent, component_latents = bundle["model"].extract_component_latents(normalized_x_tf)
+    latents = (
+        shared_latent.numpy(),
+        {k: v.numpy() for k, v in component_latents.items()},
+        {k: v.numpy() for k, v in attention.items()}
+    )
+    return [_feature_row(latents, row) for row in range(x.shape[0])]
 
+
+def _build_output(true_row, base_preds, mc_predictions, mc_attention_weights,
+                  fixed_thresholds, data_id, request_id, features_out):
+    """Собирает вердикт по компонентам и системе для одного сэмпла"""
     overall_errors, component_anomalies, component_confidences = [], [], []
     result_obj = {}
 
-    for i, (comp, (start, end)) in enumerate(zip(components, feature_ranges)):
-        true_val = normalized_x[0, start:end]
-        base_pred = baseline_pred_np[i][0]
+    for i, (comp, (start, end)) in enumerate(zip(COMPONENTS, FEATURE_RANGES)):
+        true_val = true_row[start:end]
+        base_pred = base_preds[i]
         base_err = float(np.mean((true_val - base_pred) ** 2))
         threshold = fixed_thresholds[comp]['threshold']
         is_anomaly = bool(base_err > threshold)
@@ -310,7 +470,7 @@ def run_autoencoder_inference(input_values: List[float], data_id: str, request_i
         max_ent = np.log(len(mean_att))
         att_focus = float(1.0 - (att_entropy / max_ent))
         top_ids = np.argsort(mean_att)[-3:][::-1]
-        top_feat = ", ".join([f"{common_feature_names[idx]}({mean_att[idx]:.3f})" for idx in top_ids])
+        top_feat = ", ".join([f"{COMMON_FEATURE_NAMES[idx]}({mean_att[idx]:.3f})" for idx in top_ids])
         anomaly_severity = float(base_err / threshold) if is_anomaly else 0.0
         
         ad = AttentionDetails(
@@ -351,8 +511,8 @@ def run_autoencoder_inference(input_values: List[float], data_id: str, request_i
         overall_reconstruction_error=round(err, 6),
         overall_confidence_score=round(conf, 4),
         anomaly_count=anomaly_count,
-        most_uncertain_component=components[int(np.argmin(component_confidences))],
-        highest_error_component=components[int(np.argmax(overall_errors))]
+        most_uncertain_component=COMPONENTS[int(np.argmin(component_confidences))],
+        highest_error_component=COMPONENTS[int(np.argmax(overall_errors))]
     )
 
     # TODO: Отрефаторить - выделение модели в отдельный модуль, 
@@ -368,3 +528,120 @@ def run_autoencoder_inference(input_values: List[float], data_id: str, request_i
         thresholds=fixed_thresholds,
         autoencoder_features=features_out,
     )
+
+
+def _score_batch_items(items):
+    """batch_fn для MicroBatcher: элемент — (вектор, data_id, request_id, features, комплект модели, MC-проходы)"""
+    groups = {}
+    for ix, item in enumerate(items):
+        groups.setdefault((id(item[4]), item[5]), []).append(ix)
+
+    outputs = [None] * len(items)
+    for indices in groups.values():
+        group = [items[ix] for ix in indices]
+        x = np.stack([np.asarray(item[0], dtype=np.float32) for item in group])
+        features = any(item[3] for item in group)
+        scored = _score_samples(x, [item[1] for item in group], [item[2] for item in group],
+                                features, bundle=group[0][4], mc_passes=group[0][5])
+        for ix, output, item in zip(indices, scored, group):
+            if not item[3]:
+                output.autoencoder_features = None
+            outputs[ix] = output
+    return outputs
+
+
+autoencoder_batcher = MicroBatcher("autoencoder", _score_batch_items)
+
+
+def _result_cache_key(sample, features: bool, bundle: Dict[str, Any], mc_passes: int) -> str:
+    """Вектор признаков + версия модели, бэкенд и число MC-проходов: проходы засеяны, результат детерминирован"""
+    tflite = bundle.get("tflite")
+    backend = tflite.variant if tflite is not None else "keras"
+    salt = f"autoencoder:{bundle.get('version', MODEL_VERSION)}:{backend}:{int(features)}:{mc_passes}"
+    return window_key(np.asarray(sample, dtype=np.float32), salt=salt)
+
+
+async def _infer_cached(items):
+    """
+    Оценка элементов батчера с кэшем окон: совпавшие векторы берутся из кэша,
+    одинаковые промахи внутри вызова считаются один раз
+    """
+    if not window_cache.enabled:
+        return await autoencoder_batcher.infer_many(items)
+
+    keys = [_result_cache_key(item[0], item[3], item[4], item[5]) for item in items]
+    await window_cache.prefetch("autoencoder", keys)
+
+    outputs = [None] * len(items)
+    misses: Dict[str, List[int]] = {}
+    for ix, (item, key) in enumerate(zip(items, keys)):
+        cached = window_cache.get("autoencoder", key)
+        if cached is not None:
+            outputs[ix] = AutoencoderInferenceOutput(**{**cached, "data_id": item[1], "request_id": item[2]})
+        else:
+            misses.setdefault(key, []).append(ix)
+
+    if misses:
+        scored = await autoencoder_batcher.infer_many([items[indices[0]] for indices in misses.values()])
+        for (key, indices), output in zip(misses.items(), scored):
+            window_cache.put("autoencoder", key, output.dict())
+            outputs[indices[0]] = output
+            for ix in indices[1:]:
+                outputs[ix] = output.copy(update={"data_id": items[ix][1], "request_id": items[ix][2]})
+        await window_cache.persist_pending()
+    return outputs
+
+
+async def run_autoencoder_inference_async(input_values: List[float], data_id: str, request_id: str,
+                                          features: bool = False, model_version: Optional[str] = None):
+    """Инференс одного сэмпла через общий батчер: конкурентные запросы объединяются в один проход"""
+    if not isinstance(input_values, list) or len(input_values) != 119:
+        raise ValueError("Input should be a list of 119 floats")
+    async with model_registry.acquire_async("autoencoder", model_version) as bundle:
+        return (await _infer_cached([(input_values, data_id, request_id, features, bundle, N_MONTE_CARLO)]))[0]
+
+
+async def run_autoencoder_batch_inference_async(batch: List[List[float]], normalization_stats=None,
+                                                features: bool = False, model_version: Optional[str] = None,
+                                                mc_passes: Optional[int] = None):
+    """
+    Батчевая обработка через общий батчер, сэмплы смешиваются с запросами других пайплайнов.
+    mc_passes меньше N_MONTE_CARLO — под нагрузкой: вердикт тот же, оценка неопределённости грубее.
+    """
+    mc_passes = N_MONTE_CARLO if mc_passes is None else mc_passes
+    for sample in batch:
+        if len(sample) != 119:
+            raise ValueError("Input should be a list of 119 floats")
+    async with model_registry.acquire_async("autoencoder", model_version) as bundle:
+        items = [(sample, f"sample_{ix}", f"req_{ix}", features, bundle, mc_passes) for ix, sample in enumerate(batch)]
+        outputs = await _infer_cached(items)
+    return AutoencoderBatchInferenceOutput(results=outputs)
+
+
+async def explain_autoencoder_async(vectors: List[List[float]], model_version: Optional[str] = None):
+    """Пересчёт объяснений для сохранённых векторов признаков по запросу"""
+    for sample in vectors:
+        if len(sample) != 119:
+            raise ValueError("Input should be a list of 119 floats")
+    x = np.array(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    async with model_registry.acquire_async("autoencoder", model_version) as bundle:
+        return await asyncio.to_thread(explain_samples, x, bundle)
+
+
+def get_autoencoder_reload_status():
+    return {
+        "generation": _RELOAD_STATE["generation"],
+        "reloading": _RELOAD_LOCK is not None and _RELOAD_LOCK.locked(),
+        "last_reload": _RELOAD_STATE["last_reload"]
+    }
+
+
+model_registry.register(
+    "autoencoder",
+    MODEL_VERSION,
+    _build_warm_model_bundle,
+    _acquire_default_bundle,
+    lambda bundle: keras_model_bytes(bundle["model"])
+    + (bundle["tflite"].size_bytes if bundle["tflite"] else 0),
+    ".weights.h5"
+)
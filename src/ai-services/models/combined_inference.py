@@ -0,0 +1,59 @@
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from models.autoencoder_model import run_autoencoder_batch_inference_async
+from models.feature_schema import FeatureMatrix
+from models.model_registry import model_registry
+
+# Строк признаков в одном вызове автоэнкодера при обработке нескольких записей разом
+COMBINED_INFERENCE_BATCH = int(os.getenv("COMBINED_INFERENCE_BATCH", 4096))
+
+
+async def score_matrices(matrices: List[FeatureMatrix], model_version: Optional[str] = None,
+                         mc_passes: Optional[int] = None, features: bool = False,
+                         batch_rows: int = COMBINED_INFERENCE_BATCH) -> List[List[Dict[str, Any]]]:
+    """
+    Автоэнкодер по полным окнам нескольких записей одной общей матрицей,
+    вызовами по batch_rows строк; результат разбит обратно по записям
+    """
+    rows = np.concatenate([matrix.valid_rows() for matrix in matrices]) if matrices else np.empty((0, 0))
+    results: List[Dict[str, Any]] = []
+    for start in range(0, len(rows), batch_rows):
+        output = await run_autoencoder_batch_inference_async(
+            rows[start:start + batch_rows], features=features, model_version=model_version, mc_passes=mc_passes
+        )
+        results.extend(res.dict() if hasattr(res, "dict") else res for res in output.results)
+
+    split, offset = [], 0
+    for matrix in matrices:
+        count = int(matrix.valid.sum())
+        split.append(results[offset:offset + count])
+        offset += count
+    return split
+
+
+async def forecast_sequences(sequence_sets: List[Optional[np.ndarray]], n_steps: int,
+                             model_version: Optional[str] = None) -> List[Optional[List[Dict[str, Any]]]]:
+    """
+    Dual LSTM по последовательностям нескольких записей одним прокатом модели.
+    None в sequence_sets — у записи нет последовательностей, в ответе тоже None
+    """
+    batch = [sequences for sequences in sequence_sets if sequences is not None and len(sequences)]
+    if not batch:
+        return [None] * len(sequence_sets)
+    async with model_registry.acquire_async("dual_lstm", model_version) as predictor:
+        outputs = await predictor.predict_multistep_batch_async(np.concatenate(batch), n_steps)
+
+    split, offset = [], 0
+    for sequences in sequence_sets:
+        if sequences is None or not len(sequences):
+            split.append(None)
+            continue
+        split.append([
+            {"window_index": ix, "predictions": result["predictions"], "metadata": result["metadata"]}
+            for ix, result in enumerate(outputs[offset:offset + len(sequences)])
+        ])
+        offset += len(sequences)
+    return split
@@ -1,21 +1,36 @@
+import asyncio
+import threading
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers, regularizers # type: ignore
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import pandas as pd
 import pickle
-import tempfile
 import os
 import time
 from typing import Dict, List, Any, Tuple
 from datetime import datetime
-from database.database import get_minio_client
-from contextlib import contextmanager
+from database.artifact_cache import artifact_cache
+from models.inference_batcher import MicroBatcher
+from models.model_registry import keras_model_bytes, model_registry
+from models.model_slot import ModelSlot
+from models.scaling import AffineScaler
+from models.tflite_backend import load_tflite_backend
+from utils.deadline import check
+from utils.metrics import MODEL_BATCH_SIZE, MODEL_CALL_MS
 
 
 SEQUENCE_LENGTH = 10
 ORIGINAL_FEATURES = 119
 
+DEFAULT_MODEL_VERSION = os.getenv("DUAL_LSTM_MODEL_VERSION", "dual_lstm_original_20250806_225816")
+
+
+def window_sequences(matrix: np.ndarray) -> np.ndarray:
+    """Последовательности из SEQUENCE_LENGTH соседних окон матрицы (n, 119): представление (n - 9, 10, 119) без копии"""
+    return sliding_window_view(matrix, SEQUENCE_LENGTH, axis=0).transpose(0, 2, 1)
+
 
 class SimplifiedDualChannelLSTM(keras.Model):
     def __init__(self, l2_reg=0.001):
@@ -97,76 +112,154 @@ class SimplifiedDualChannelLSTM(keras.Model):
         return tf.reshape(output, (-1, 1, ORIGINAL_FEATURES))
 
 
-@contextmanager
-def download_model_files_temp(bucket_name: str, model_prefix: str):
-    client = get_minio_client()
-    temp_dir = tempfile.gettempdir()
-    
-    weights_object_name = f"{model_prefix}.keras"
-    scaler_object_name = f"{model_prefix}.pkl"
-    
-    weights_local_path = os.path.join(temp_dir, weights_object_name)
-    scaler_local_path = os.path.join(temp_dir, scaler_object_name)
-    
-    client.fget_object(bucket_name, weights_object_name, weights_local_path)
-    client.fget_object(bucket_name, scaler_object_name, scaler_local_path)
-    
-    try:
-        yield weights_local_path, scaler_local_path
-    finally:
-        for path in [weights_local_path, scaler_local_path]:
-            if os.path.exists(path):
-                os.remove(path)
-
-
 class DualLSTMPredictor:
-    def __init__(self, bucket_name: str = "models", model_prefix: str = "dual_lstm_original_20250806_225816"):
+    def __init__(self, bucket_name: str = "models", model_prefix: str = DEFAULT_MODEL_VERSION):
         self.bucket_name = bucket_name
         self.model_prefix = model_prefix
         self.model = None
         self.scaler = None
+        self.affine = None
+        self.tflite_runner = None
+        self.is_loaded = False
+        self._load_lock = threading.Lock()
+        batcher_name = "dual_lstm" if model_prefix == DEFAULT_MODEL_VERSION else f"dual_lstm@{model_prefix}"
+        self.batcher = MicroBatcher(batcher_name, self._forward_batch)
+    
+    def ensure_loaded(self):
+        """Загружает модель один раз, даже при параллельных первых запросах"""
+        with self._load_lock:
+            if not self.is_loaded:
+                self.load_model()
+    
+    def warm_up(self):
+        self._forward_batch([np.zeros((SEQUENCE_LENGTH, ORIGINAL_FEATURES), dtype=np.float32)])
+    
+    def close(self):
+        """Останавливает батчер и отпускает модель после горячей перезагрузки"""
+        self.batcher.close()
+        self.model = None
+        self.scaler = None
+        self.affine = None
+        self.tflite_runner = None
+        self.is_loaded = False
     
     def load_model(self):
-        with download_model_files_temp(self.bucket_name, self.model_prefix) as (weights_path, scaler_path):
-            self.model = SimplifiedDualChannelLSTM(l2_reg=0.001)
-            dummy_input = tf.random.normal((1, SEQUENCE_LENGTH, ORIGINAL_FEATURES))
-            _ = self.model(dummy_input)
-            
-            self.model.compile(
-                optimizer=tf.keras.optimizers.Adam(learning_rate=1e-3, clipnorm=1.0),
-                loss=tf.keras.losses.Huber(delta=0.5),
-                metrics=['mae', 'mse']
-            )
-            
-            self.model.load_weights(weights_path)
-            
-            with open(scaler_path, 'rb') as f:
-                self.scaler = pickle.load(f)
+        weights_path, scaler_path = artifact_cache.fetch_many(
+            self.bucket_name, [f"{self.model_prefix}.keras", f"{self.model_prefix}.pkl"]
+        )
+        
+        self.model = SimplifiedDualChannelLSTM(l2_reg=0.001)
+        dummy_input = tf.random.normal((1, SEQUENCE_LENGTH, ORIGINAL_FEATURES))
+        _ = self.model(dummy_input)
+        
+        self.model.compile(
+            optimizer=tf.keras.optimizers.Adam(learning_rate=1e-3, clipnorm=1.0),
+            loss=tf.keras.losses.Huber(delta=0.5),
+            metrics=['mae', 'mse']
+        )
+        
+        self.model.load_weights(weights_path)
+        
+        with open(scaler_path, 'rb') as f:
+            self.scaler = pickle.load(f)
+        self.affine = AffineScaler(self.scaler, ORIGINAL_FEATURES)
+        
+        self.tflite_runner = load_tflite_backend("dual_lstm", self.model_prefix)
+        self.is_loaded = True
+    
+    def _forward_batch(self, sequences: List[np.ndarray]) -> List[np.ndarray]:
+        """Один проход модели по набору нормализованных последовательностей (10, 119)"""
+        return list(self._forward_array(np.stack(sequences)))
+    
+    def _forward_array(self, batch: np.ndarray) -> np.ndarray:
+        """Проход модели по тензору (k, 10, 119), результат (k, 119)"""
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        started = time.perf_counter()
+        if self.tflite_runner is not None:
+            output = self.tflite_runner.run(batch)["prediction"]
+        else:
+            output = self.model(batch, training=False)
+        output = np.asarray(output).reshape(len(batch), ORIGINAL_FEATURES)
+        backend = "tflite" if self.tflite_runner is not None else "keras"
+        MODEL_CALL_MS.labels("dual_lstm", backend).observe((time.perf_counter() - started) * 1000)
+        MODEL_BATCH_SIZE.labels("dual_lstm").observe(len(batch))
+        return output
     
     def predict_multistep(self, input_data: np.ndarray, n_steps: int) -> Dict[str, Any]:
-        if self.model is None or self.scaler is None:
-            self.load_model()
+        return self.predict_multistep_batch(input_data[None], n_steps)[0]
+    
+    def predict_multistep_batch(self, sequences, n_steps: int) -> List[Dict[str, Any]]:
+        """
+        Авторегрессионный прогноз сразу для k последовательностей (k, 10, 119):
+        n_steps проходов модели вместо k * n_steps.
+        
+        Окна лежат в одном буфере (k, 10 + n_steps, 119): прогноз шага пишется
+        в следующую колонку, и окно шага s — срез [s:s + 10] без np.roll и копий.
+        """
+        if not self.is_loaded:
+            self.ensure_loaded()
         
         start_time = time.time()
+        return self._rollout(self.affine.transform(np.asarray(sequences, dtype=np.float64)), n_steps, start_time)
+    
+    def predict_window_sequences(self, matrix: np.ndarray, n_steps: int, first_sequence: int = 0) -> List[Dict[str, Any]]:
+        """
+        Прогноз по последовательностям соседних окон матрицы признаков (n, 119),
+        начиная с first_sequence. Матрица масштабируется один раз, а не каждое
+        окно в каждой из 10 последовательностей, куда оно входит.
+        """
+        if not self.is_loaded:
+            self.ensure_loaded()
         
-        test_sequence_norm = self.scaler.transform(input_data)
-        current_sequence = test_sequence_norm.copy()
-        all_predictions = []
+        start_time = time.time()
+        scaled = self.affine.transform(np.asarray(matrix, dtype=np.float64))
+        return self._rollout(window_sequences(scaled)[first_sequence:], n_steps, start_time)
+    
+    def _rollout(self, scaled_sequences: np.ndarray, n_steps: int, start_time: float) -> List[Dict[str, Any]]:
+        k = scaled_sequences.shape[0]
+        buffer = np.empty((k, SEQUENCE_LENGTH + n_steps, ORIGINAL_FEATURES), dtype=np.float32)
+        buffer[:, :SEQUENCE_LENGTH] = scaled_sequences
         
         for step in range(n_steps):
-            test_input = current_sequence.reshape(1, SEQUENCE_LENGTH, ORIGINAL_FEATURES)
-            prediction_norm = self.model.predict(test_input, verbose=0)
-            prediction = self.scaler.inverse_transform(prediction_norm.reshape(1, -1))
-            
-            all_predictions.append(prediction.flatten())
-            
-            current_sequence = np.roll(current_sequence, -1, axis=0)
-            current_sequence[-1] = prediction_norm.flatten()
+            check("dual_lstm_analysis")
+            buffer[:, SEQUENCE_LENGTH + step] = self._forward_array(buffer[:, step:step + SEQUENCE_LENGTH])
         
+        predictions = self.affine.inverse_transform(buffer[:, SEQUENCE_LENGTH:].astype(np.float64))
         inference_time = time.time() - start_time
+        return [self._build_result(predictions[i], n_steps, inference_time, batch_size=k) for i in range(k)]
+    
+    async def predict_multistep_batch_async(self, sequences, n_steps: int) -> List[Dict[str, Any]]:
+        if not self.is_loaded:
+            await asyncio.to_thread(self.ensure_loaded)
+        return await asyncio.to_thread(self.predict_multistep_batch, sequences, n_steps)
+    
+    async def predict_window_sequences_async(self, matrix: np.ndarray, n_steps: int,
+                                             first_sequence: int = 0) -> List[Dict[str, Any]]:
+        if not self.is_loaded:
+            await asyncio.to_thread(self.ensure_loaded)
+        return await asyncio.to_thread(self.predict_window_sequences, matrix, n_steps, first_sequence)
+    
+    async def predict_multistep_async(self, input_data: np.ndarray, n_steps: int) -> Dict[str, Any]:
+        """
+        Тот же прогноз, но каждый шаг идёт через батчер: шаги параллельных
+        прогнозов (стримы, запросы) объединяются в один проход модели.
+        """
+        if not self.is_loaded:
+            await asyncio.to_thread(self.ensure_loaded)
+        
+        start_time = time.time()
         
-        predictions_array = np.array(all_predictions)
+        buffer = np.empty((SEQUENCE_LENGTH + n_steps, ORIGINAL_FEATURES), dtype=np.float32)
+        buffer[:SEQUENCE_LENGTH] = self.affine.transform(np.asarray(input_data, dtype=np.float64))
+        
+        for step in range(n_steps):
+            buffer[SEQUENCE_LENGTH + step] = await self.batcher.infer(buffer[step:step + SEQUENCE_LENGTH])
         
+        predictions = self.affine.inverse_transform(buffer[SEQUENCE_LENGTH:].astype(np.float64))
+        return self._build_result(predictions, n_steps, time.time() - start_time)
+    
+    def _build_result(self, predictions_array: np.ndarray, n_steps: int, inference_time: float,
+                      batch_size: int = 1) -> Dict[str, Any]:
         return {
             "predictions": {
                 "values": predictions_array.tolist(),
@@ -178,18 +271,39 @@ class DualLSTMPredictor:
                     "total_parameters": int(self.model.count_params()),
                     "input_shape": [SEQUENCE_LENGTH, ORIGINAL_FEATURES],
                     "model_type": "Dual-LSTM",
-                    "source": f"S3: {self.bucket_name}/{self.model_prefix}"
+                    "source": f"S3: {self.bucket_name}/{self.model_prefix}",
+                    "version": self.model_prefix,
+                    "backend": f"tflite_{self.tflite_runner.variant}" if self.tflite_runner else "keras"
                 },
                 "inference_stats": {
                     "total_steps": n_steps,
                     "features_per_step": ORIGINAL_FEATURES,
                     "total_predictions": n_steps * ORIGINAL_FEATURES,
                     "inference_time_ms": round(inference_time * 1000, 1),
-                    "avg_time_per_step_ms": round(inference_time * 1000 / n_steps, 1)
+                    "avg_time_per_step_ms": round(inference_time * 1000 / n_steps, 1),
+                    "rollout_batch_size": batch_size
                 },
                 "timestamp": datetime.utcnow().isoformat()
             }
         }
 
 
-predictor = DualLSTMPredictor()
+def build_dual_lstm_predictor(model_prefix: str = DEFAULT_MODEL_VERSION) -> DualLSTMPredictor:
+    """Собирает и прогревает новый экземпляр для горячей подмены или реестра версий"""
+    instance = DualLSTMPredictor(model_prefix=model_prefix)
+    instance.load_model()
+    instance.warm_up()
+    return instance
+
+
+predictor_slot = ModelSlot("dual_lstm", DualLSTMPredictor())
+
+model_registry.register(
+    "dual_lstm",
+    DEFAULT_MODEL_VERSION,
+    build_dual_lstm_predictor,
+    predictor_slot.acquire,
+    lambda instance: keras_model_bytes(instance.model)
+    + (instance.tflite_runner.size_bytes if instance.tflite_runner else 0),
+    ".keras"
+)
@@ -0,0 +1,184 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.logger import log
+
+MODULE = "feature_schema"
+
+
+class FeatureSchema:
+    """
+    Порядок признаков на входе моделей.
+
+    Единственный источник порядка 119 признаков: по нему собирается матрица
+    (окна × признаки), строится /features/schema и обратно разворачиваются
+    словари для клиентов. Любое изменение состава или порядка — новая версия.
+    """
+
+    def __init__(self, version: str, groups: List[Tuple[str, str, List[str]]]):
+        self.version = version
+        self.groups = [(name, description, tuple(features)) for name, description, features in groups]
+        self.names = tuple(feature for _, _, features in self.groups for feature in features)
+        self.size = len(self.names)
+        self.index = {name: ix for ix, name in enumerate(self.names)}
+        self._pairs = tuple((group, feature) for group, _, features in self.groups for feature in features)
+
+    def row(self, feature_groups: Dict[str, Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Строка float32 из словаря групп экстрактора; None, если признака нет или он не число"""
+        try:
+            return np.fromiter(
+                (feature_groups[group][feature] for group, feature in self._pairs),
+                dtype=np.float32, count=self.size
+            )
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def to_groups(self, row: np.ndarray) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Обратное преобразование строки в словарь групп — только для ответа клиенту.
+        NaN (неполное окно) — None: JSON-ответ не принимает NaN
+        """
+        values = [None if value != value else value for value in row.tolist()]
+        groups, offset = {}, 0
+        for group, _, features in self.groups:
+            groups[group] = dict(zip(features, values[offset:offset + len(features)]))
+            offset += len(features)
+        return groups
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "total_features": self.size,
+            "categories": {
+                group: {"description": description, "features": list(features)}
+                for group, description, features in self.groups
+            }
+        }
+
+
+FEATURE_SCHEMA = FeatureSchema("1.1", [
+    ("common", "Basic statistical features", [
+        'rms_A', 'mean_A', 'std_A', 'rms_B', 'mean_B', 'std_B', 'rms_C', 'mean_C', 'std_C',
+        'total_imbalance', 'rms_imbalance', 'imbalance_ab', 'imbalance_bc', 'imbalance_ca',
+        'park_ellipticity', 'park_mag_mean', 'park_mag_std'
+    ]),
+    ("bearing", "Bearing fault detection", [
+        'bearing_bpfo_amp_A', 'bearing_bpfi_amp_A', 'bearing_bpfo_amp_B', 'bearing_bpfi_amp_B',
+        'bearing_bpfo_amp_C', 'bearing_bpfi_amp_C', 'bearing_bsf_amp_A', 'bearing_ftf_amp_A',
+        'bearing_bpfo_2h_amp_A', 'bearing_bpfi_2h_amp_A', 'bearing_bpfo_band_rms_A',
+        'bearing_bpfi_band_rms_A', 'bearing_env_kurtosis_A', 'bearing_env_rms_A',
+        'bearing_env_peak_factor_A', 'bearing_env_bpfo_A', 'bearing_env_bpfi_A',
+        'bearing_hf_energy_A', 'bearing_crest_factor_A', 'bearing_env_kurtosis_B',
+        'bearing_env_rms_B', 'bearing_env_peak_factor_B', 'bearing_hf_energy_B',
+        'bearing_crest_factor_B', 'bearing_env_kurtosis_C', 'bearing_env_rms_C',
+        'bearing_env_peak_factor_C', 'bearing_hf_energy_C', 'bearing_env_kurtosis_max',
+        'bearing_hf_energy_max'
+    ]),
+    ("eccentricity", "Rotor eccentricity analysis", [
+        'ecc_current_asymmetry', 'ecc_max_deviation', 'ecc_rms_variance', 'ecc_max_min_ratio',
+        'ecc_corr_ab', 'ecc_corr_bc', 'ecc_corr_ca', 'ecc_mean_correlation',
+        'ecc_correlation_variance', 'ecc_min_correlation', 'ecc_main_1_lower_amp_A',
+        'ecc_main_1_lower_ratio_A', 'ecc_main_1_upper_amp_A', 'ecc_main_1_upper_ratio_A',
+        'ecc_main_1_lower_amp_B', 'ecc_main_1_upper_amp_B', 'ecc_main_1_lower_amp_C',
+        'ecc_main_1_upper_amp_C', 'ecc_main_2_lower_ratio_A', 'ecc_rotor_freq_modulation_A',
+        'ecc_2rotor_freq_modulation_A', 'ecc_envelope_modulation_A', 'ecc_rotor_freq_modulation_B',
+        'ecc_envelope_modulation_B', 'ecc_rotor_freq_modulation_C', 'ecc_harmonic_ratio_A',
+        'ecc_total_harmonic_energy_A', 'ecc_harmonic_ratio_B', 'ecc_harmonic_ratio_C'
+    ]),
+    ("rotor", "Rotor fault indicators", [
+        'rotor_sb1_lower_ratio_A', 'rotor_sb1_upper_ratio_A', 'rotor_sb2_lower_ratio_A',
+        'rotor_sb1_lower_amp_A', 'rotor_sb1_upper_amp_A', 'rotor_sb1_lower_ratio_B',
+        'rotor_sb1_upper_ratio_B', 'rotor_sb1_upper_ratio_C', 'rotor_sb1_lower_ratio_combined',
+        'rotor_stft_ratio_A', 'rotor_stft_main_energy_A', 'rotor_stft_sb1_energy_A',
+        'rotor_stft_energy_var_A', 'rotor_stft_ratio_B', 'rotor_stft_ratio_C'
+    ]),
+    ("stator", "Stator winding analysis", [
+        'k2_asymmetry', 'thd_A', 'thd_B', 'thd_C', 'h3_ratio_A', 'h5_ratio_A', 'h7_ratio_A',
+        'h3_ratio_B', 'h5_ratio_B', 'h7_ratio_B', 'h3_ratio_C', 'h5_ratio_C', 'h7_ratio_C',
+        'phase_deviation_ab', 'phase_deviation_bc', 'phase_deviation_ca', 'modulation_coeff_A',
+        'modulation_coeff_B', 'modulation_coeff_C', 'rel_energy_low_band_A',
+        'rel_energy_medium_band_A', 'rel_energy_high_band_A', 'rel_energy_low_band_B',
+        'rel_energy_medium_band_B', 'rel_energy_high_band_B', 'rel_energy_low_band_C',
+        'rel_energy_medium_band_C', 'rel_energy_high_band_C'
+    ]),
+])
+
+
+class FeatureMatrix:
+    """
+    Признаки записи: values — float32 (окна × 119) в порядке FEATURE_SCHEMA,
+    valid — окна, где экстрактор вернул все признаки числами.
+    Без оконной обработки — одна строка и windowed=False.
+    """
+
+    def __init__(self, values: np.ndarray, valid: np.ndarray, windows_metadata: Optional[List[Dict[str, int]]] = None,
+                 schema: FeatureSchema = FEATURE_SCHEMA):
+        self.values = values
+        self.valid = valid
+        self.windows_metadata = windows_metadata
+        self.schema = schema
+
+    @property
+    def windowed(self) -> bool:
+        return self.windows_metadata is not None
+
+    @property
+    def n_windows(self) -> int:
+        return self.values.shape[0]
+
+    def valid_rows(self) -> np.ndarray:
+        return self.values if self.valid.all() else self.values[self.valid]
+
+    @classmethod
+    def from_rows(cls, rows: List[Optional[np.ndarray]], windows_metadata: Optional[List[Dict[str, int]]] = None,
+                  schema: FeatureSchema = FEATURE_SCHEMA) -> "FeatureMatrix":
+        values = np.full((len(rows), schema.size), np.nan, dtype=np.float32)
+        valid = np.zeros(len(rows), dtype=bool)
+        for ix, row in enumerate(rows):
+            if row is not None:
+                values[ix] = row
+                valid[ix] = True
+        if not valid.all():
+            log(f"{int((~valid).sum())} of {len(rows)} window(s) have incomplete features", MODULE, level="WARN")
+        return cls(values, valid, windows_metadata, schema)
+
+    def to_document(self) -> Dict[str, Any]:
+        """Форма для Mongo: матрица одним бинарным полем float32, без вложенных словарей"""
+        return {
+            "schema_version": self.schema.version,
+            "dtype": "float32",
+            "shape": list(self.values.shape),
+            "matrix": np.ascontiguousarray(self.values, dtype=np.float32).tobytes(),
+            "valid": self.valid.tolist(),
+            "windowed": self.windowed,
+            "windows_metadata": self.windows_metadata,
+            "total_windows": self.n_windows
+        }
+
+    @classmethod
+    def from_document(cls, features: Dict[str, Any], schema: FeatureSchema = FEATURE_SCHEMA) -> "FeatureMatrix":
+        """Читает и новую форму, и старые документы со словарями окон"""
+        if "matrix" in features:
+            if features.get("schema_version") != schema.version:
+                log(f"Stored features use schema {features.get('schema_version')}, current is {schema.version}",
+                    MODULE, level="WARN")
+            values = np.frombuffer(features["matrix"], dtype=features.get("dtype", "float32"))
+            values = values.reshape(features["shape"]).astype(np.float32, copy=False)
+            return cls(values, np.asarray(features["valid"], dtype=bool), features.get("windows_metadata"), schema)
+
+        if "windows" in features:
+            windows = features["windows"]
+            return cls.from_rows([schema.row(w) for w in windows], [w.get("window_metadata") for w in windows], schema)
+        return cls.from_rows([schema.row(features)], None, schema)
+
+    def to_dicts(self) -> Dict[str, Any]:
+        """Словари в прежнем формате ответа API; строятся, только когда их просит клиент"""
+        if not self.windowed:
+            return self.schema.to_groups(self.values[0])
+        return {
+            "windows": [
+                {**self.schema.to_groups(row), "window_metadata": metadata, "valid": bool(valid)}
+                for row, metadata, valid in zip(self.values, self.windows_metadata, self.valid)
+            ],
+            "total_windows": self.n_windows
+        }
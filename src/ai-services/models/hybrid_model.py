@@ -1,19 +1,27 @@
+import asyncio
+import threading
 import tensorflow as tf
 from tensorflow.keras import layers, models, regularizers # type: ignore
 import numpy as np
 import pandas as pd
 import pickle
-import tempfile
 import os
 import time
 from typing import Dict, List, Any, Tuple
 from datetime import datetime
-from database.database import get_minio_client
-from contextlib import contextmanager
+from database.artifact_cache import artifact_cache
+from models.inference_batcher import MicroBatcher
+from models.model_registry import keras_model_bytes, model_registry
+from models.model_slot import ModelSlot
+from models.scaling import AffineScaler
+from models.tflite_backend import load_tflite_backend
+from utils.metrics import MODEL_BATCH_SIZE, MODEL_CALL_MS
 
 SEQUENCE_LENGTH = 10
 ORIGINAL_FEATURES = 119
 ENHANCED_FEATURES = 187
+
+DEFAULT_MODEL_VERSION = os.getenv("HYBRID_LSTM_MODEL_VERSION", "enhanced_hybrid_20250806_213456")
 CONTEXT_FEATURES = 68
 
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
@@ -110,97 +118,185 @@ def build_hybrid_model():
     return model
 
 
-@contextmanager
-def download_hybrid_model_files_temp(bucket_name: str, model_prefix: str):
-    client = get_minio_client()
-    temp_dir = tempfile.gettempdir()
-    
-    weights_object_name = f"{model_prefix}.keras"
-    scalers_object_name = f"{model_prefix}.pkl"
-    
-    weights_local_path = os.path.join(temp_dir, weights_object_name)
-    scalers_local_path = os.path.join(temp_dir, scalers_object_name)
-    
-    client.fget_object(bucket_name, weights_object_name, weights_local_path)
-    client.fget_object(bucket_name, scalers_object_name, scalers_local_path)
-    
-    try:
-        yield weights_local_path, scalers_local_path
-    finally:
-        for path in [weights_local_path, scalers_local_path]:
-            if os.path.exists(path):
-                os.remove(path)
-
-
 class HybridLSTMPredictor:
-    def __init__(self, bucket_name: str = "models", model_prefix: str = "enhanced_hybrid_20250806_213456"):
+    def __init__(self, bucket_name: str = "models", model_prefix: str = DEFAULT_MODEL_VERSION):
         self.bucket_name = bucket_name
         self.model_prefix = model_prefix
         self.model = None
-        self.attention_model = None
+        self.serving_model = None
         self.scaler_enhanced = None
         self.scaler_original = None
+        self.affine_enhanced = None
+        self.affine_original = None
         self.energy_features = None
+        self.tflite_runner = None
+        self.is_loaded = False
+        self._load_lock = threading.Lock()
+        batcher_name = "hybrid_lstm" if model_prefix == DEFAULT_MODEL_VERSION else f"hybrid_lstm@{model_prefix}"
+        self.batcher = MicroBatcher(batcher_name, self._forward_batch)
     
-    def load_model(self):
-        with download_hybrid_model_files_temp(self.bucket_name, self.model_prefix) as (weights_path, scalers_path):
-            with open(scalers_path, 'rb') as f:
-                scalers_data = pickle.load(f)
-            
-            self.scaler_enhanced = scalers_data['enhanced']
-            self.scaler_original = scalers_data['original']
-            self.energy_features = scalers_data['energy_features']
-            
-            self.model = build_hybrid_model()
-            self.model.load_weights(weights_path)
-            
-            self.attention_model = models.Model(
-                inputs=self.model.input,
-                outputs=self.model.get_layer(index=-8).output
-            )
+    def ensure_loaded(self):
+        """Загружает модель один раз, даже при параллельных первых запросах"""
+        with self._load_lock:
+            if not self.is_loaded:
+                self.load_model()
     
-    def preprocess_data(self, input_data: np.ndarray) -> np.ndarray:
-        data_processed = input_data.copy()
+    def warm_up(self):
+        self._forward_batch([np.zeros((SEQUENCE_LENGTH, ENHANCED_FEATURES), dtype=np.float32)])
+    
+    def close(self):
+        """Останавливает батчер и отпускает модель после горячей перезагрузки"""
+        self.batcher.close()
+        self.model = None
+        self.serving_model = None
+        self.tflite_runner = None
+        self.is_loaded = False
+    
+    def load_model(self):
+        weights_path, scalers_path = artifact_cache.fetch_many(
+            self.bucket_name, [f"{self.model_prefix}.keras", f"{self.model_prefix}.pkl"]
+        )
+        
+        with open(scalers_path, 'rb') as f:
+            scalers_data = pickle.load(f)
         
-        for i, feature in enumerate(self.energy_features):
-            if i < data_processed.shape[1]:
-                data_processed[:, i] = np.log1p(data_processed[:, i])
+        self.scaler_enhanced = scalers_data['enhanced']
+        self.scaler_original = scalers_data['original']
+        self.energy_features = scalers_data['energy_features']
+        self.affine_enhanced = AffineScaler(self.scaler_enhanced, ENHANCED_FEATURES)
+        self.affine_original = AffineScaler(self.scaler_original, ORIGINAL_FEATURES)
         
-        return self.scaler_enhanced.transform(data_processed)
+        self.model = build_hybrid_model()
+        self.model.load_weights(weights_path)
+        
+        # Прогноз и веса attention за один проход: оба выхода — из одного графа
+        self.serving_model = models.Model(
+            inputs=self.model.input,
+            outputs=[self.model.output, self.model.get_layer(index=-8).output]
+        )
+        
+        self.tflite_runner = load_tflite_backend("hybrid_lstm", self.model_prefix)
+        self.is_loaded = True
+    
+    def preprocess_data(self, input_data: np.ndarray) -> np.ndarray:
+        """log1p энергетических признаков и масштабирование; работает и для (10, 187), и для (k, 10, 187)"""
+        data_processed = np.array(input_data, dtype=np.float64)
+        n_energy = min(len(self.energy_features), data_processed.shape[-1])
+        data_processed[..., :n_energy] = np.log1p(data_processed[..., :n_energy])
+        return self.affine_enhanced.transform(data_processed)
+    
+    def _forward_batch(self, sequences: List[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Проход прогноза и attention по набору нормализованных последовательностей (10, 187)"""
+        predictions, attention = self._forward_array(np.stack(sequences), with_attention=True)
+        return [(predictions[i:i + 1], attention[i:i + 1]) for i in range(len(sequences))]
+    
+    def _forward_array(self, batch: np.ndarray, with_attention: bool = True):
+        """Один проход по (k, 10, 187): прогноз (k, 119) и attention (или None)"""
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        started = time.perf_counter()
+        try:
+            return self._run_model(batch, with_attention)
+        finally:
+            backend = "tflite" if self.tflite_runner is not None else "keras"
+            MODEL_CALL_MS.labels("hybrid_lstm", backend).observe((time.perf_counter() - started) * 1000)
+            MODEL_BATCH_SIZE.labels("hybrid_lstm").observe(len(batch))
+    
+    def _run_model(self, batch: np.ndarray, with_attention: bool):
+        """Проход через TFLite или Keras без замеров"""
+        if self.tflite_runner is not None:
+            outputs = self.tflite_runner.run(batch)
+            return outputs["prediction"], outputs["attention"] if with_attention else None
+        if not with_attention:
+            return np.asarray(self.model(batch, training=False)), None
+        predictions, attention = self.serving_model(batch, training=False)
+        return np.asarray(predictions), np.asarray(attention)
+    
+    def predict_multistep(self, input_data: np.ndarray, n_steps: int,
+                          with_attention: bool = True) -> Dict[str, Any]:
+        return self.predict_multistep_batch(input_data[None], n_steps, with_attention)[0]
     
-    def predict_multistep(self, input_data: np.ndarray, n_steps: int) -> Dict[str, Any]:
-        if self.model is None:
-            self.load_model()
+    def predict_multistep_batch(self, sequences, n_steps: int,
+                                with_attention: bool = True) -> List[Dict[str, Any]]:
+        """
+        Авторегрессионный прогноз сразу для k последовательностей (k, 10, 187):
+        n_steps проходов модели, каждый возвращает и прогноз, и attention.
         
-        start_time = time.time()
+        Окна лежат в буфере (k, 10 + n_steps, 187): новая строка шага — прогноз
+        (119) и контекст последней строки окна, пропущенные через scaler_enhanced,
+        как и раньше; окно шага s — срез [s:s + 10].
+        """
+        if not self.is_loaded:
+            self.ensure_loaded()
         
-        test_sequence_norm = self.preprocess_data(input_data)
-        current_sequence = test_sequence_norm.copy()
+        start_time = time.time()
         
-        all_predictions = []
-        all_attention_weights = []
+        normalized = self.preprocess_data(sequences)
+        k = normalized.shape[0]
+        buffer = np.empty((k, SEQUENCE_LENGTH + n_steps, ENHANCED_FEATURES), dtype=np.float64)
+        buffer[:, :SEQUENCE_LENGTH] = normalized
+        predictions_norm = np.empty((k, n_steps, ORIGINAL_FEATURES), dtype=np.float64)
+        attention_steps = []
         
         for step in range(n_steps):
-            test_input = current_sequence.reshape(1, SEQUENCE_LENGTH, ENHANCED_FEATURES)
-            
-            prediction_norm = self.model.predict(test_input, verbose=0)
-            attention_weights = self.attention_model.predict(test_input, verbose=0)
-            
-            prediction_full = np.zeros((1, ENHANCED_FEATURES))
-            prediction_full[0, :ORIGINAL_FEATURES] = prediction_norm[0]
-            prediction_full[0, ORIGINAL_FEATURES:] = test_input[0, -1, ORIGINAL_FEATURES:]
-            
-            prediction = self.scaler_original.inverse_transform(prediction_norm)
-            
-            all_predictions.append(prediction.flatten())
-            all_attention_weights.append(attention_weights.tolist())
+            prediction_norm, attention = self._forward_array(
+                buffer[:, step:step + SEQUENCE_LENGTH], with_attention
+            )
+            predictions_norm[:, step] = prediction_norm
+            if with_attention:
+                attention_steps.append(attention)
             
-            current_sequence = np.roll(current_sequence, -1, axis=0)
-            current_sequence[-1] = self.scaler_enhanced.transform(prediction_full)[0]
+            next_row = buffer[:, SEQUENCE_LENGTH + step]
+            next_row[:, :ORIGINAL_FEATURES] = prediction_norm
+            next_row[:, ORIGINAL_FEATURES:] = buffer[:, SEQUENCE_LENGTH + step - 1, ORIGINAL_FEATURES:]
+            next_row[:] = self.affine_enhanced.transform(next_row)
         
+        predictions = self.affine_original.inverse_transform(predictions_norm)
         inference_time = time.time() - start_time
         
-        predictions_array = np.array(all_predictions)
+        results = []
+        for i in range(k):
+            attention_weights = (
+                [attention[i:i + 1].tolist() for attention in attention_steps] if with_attention else None
+            )
+            results.append(self._build_result(predictions[i], attention_weights, n_steps,
+                                              inference_time, batch_size=k))
+        return results
+    
+    async def predict_multistep_batch_async(self, sequences, n_steps: int,
+                                            with_attention: bool = True) -> List[Dict[str, Any]]:
+        if not self.is_loaded:
+            await asyncio.to_thread(self.ensure_loaded)
+        return await asyncio.to_thread(self.predict_multistep_batch, sequences, n_steps, with_attention)
+    
+    async def predict_multistep_async(self, input_data: np.ndarray, n_steps: int,
+                                      with_attention: bool = True) -> Dict[str, Any]:
+        """Прогноз, шаги которого объединяются с параллельными запросами через батчер"""
+        if not self.is_loaded:
+            await asyncio.to_thread(self.ensure_loaded)
+        
+        start_time = time.time()
+        
+        buffer = np.empty((SEQUENCE_LENGTH + n_steps, ENHANCED_FEATURES), dtype=np.float64)
+        buffer[:SEQUENCE_LENGTH] = self.preprocess_data(input_data)
+        predictions_norm = np.empty((n_steps, ORIGINAL_FEATURES), dtype=np.float64)
+        attention_weights = []
+        
+        for step in range(n_steps):
+            prediction_norm, attention = await self.batcher.infer(buffer[step:step + SEQUENCE_LENGTH])
+            predictions_norm[step] = prediction_norm[0]
+            attention_weights.append(attention.tolist())
+            
+            next_row = buffer[SEQUENCE_LENGTH + step]
+            next_row[:ORIGINAL_FEATURES] = prediction_norm[0]
+            next_row[ORIGINAL_FEATURES:] = buffer[SEQUENCE_LENGTH + step - 1, ORIGINAL_FEATURES:]
+            next_row[:] = self.affine_enhanced.transform(next_row)
+        
+        predictions = self.affine_original.inverse_transform(predictions_norm)
+        return self._build_result(predictions, attention_weights if with_attention else None,
+                                  n_steps, time.time() - start_time)
+    
+    def _build_result(self, predictions_array: np.ndarray, all_attention_weights, n_steps: int,
+                      inference_time: float, batch_size: int = 1) -> Dict[str, Any]:
         
         return {
             "predictions": {
@@ -216,12 +312,15 @@ class HybridLSTMPredictor:
                     "input_features": ENHANCED_FEATURES,
                     "output_features": ORIGINAL_FEATURES,
                     "energy_features_count": len(self.energy_features),
-                    "source": f"S3: {self.bucket_name}/{self.model_prefix}"
+                    "source": f"S3: {self.bucket_name}/{self.model_prefix}",
+                    "version": self.model_prefix,
+                    "backend": f"tflite_{self.tflite_runner.variant}" if self.tflite_runner else "keras"
                 },
                 "inference_stats": {
                     "prediction_steps": n_steps,
                     "inference_time_ms": round(inference_time * 1000, 1),
                     "avg_time_per_step_ms": round(inference_time * 1000 / n_steps, 1),
+                    "rollout_batch_size": batch_size,
                     "preprocessing_applied": ["log1p_energy_features", "robust_scaling"]
                 },
                 "attention_analysis": {
@@ -229,10 +328,28 @@ class HybridLSTMPredictor:
                     "mean_attention": [float(np.mean(w)) for w in all_attention_weights],
                     "max_attention": [float(np.max(w)) for w in all_attention_weights],
                     "attention_std": [float(np.std(w)) for w in all_attention_weights]
-                },
+                } if all_attention_weights is not None else None,
                 "timestamp": datetime.utcnow().isoformat()
             }
         }
 
 
-predictor = HybridLSTMPredictor()
+def build_hybrid_predictor(model_prefix: str = DEFAULT_MODEL_VERSION) -> HybridLSTMPredictor:
+    """Собирает и прогревает новый экземпляр для горячей подмены или реестра версий"""
+    instance = HybridLSTMPredictor(model_prefix=model_prefix)
+    instance.load_model()
+    instance.warm_up()
+    return instance
+
+
+predictor_slot = ModelSlot("hybrid_lstm", HybridLSTMPredictor())
+
+model_registry.register(
+    "hybrid_lstm",
+    DEFAULT_MODEL_VERSION,
+    build_hybrid_predictor,
+    predictor_slot.acquire,
+    lambda instance: keras_model_bytes(instance.model)
+    + (instance.tflite_runner.size_bytes if instance.tflite_runner else 0),
+    ".keras"
+)
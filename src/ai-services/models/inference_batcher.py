@@ -0,0 +1,152 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+from utils.logger import log
+from utils.metrics import Histogram
+
+MODULE = "inference_batcher"
+
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_MAX_SIZE", 64))
+MAX_WAIT_MS = float(os.getenv("INFERENCE_BATCH_MAX_WAIT_MS", 5))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+WAIT_MS_BUCKETS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+_BATCHERS = {}
+_BATCHERS_LOCK = threading.Lock()
+
+
+class MicroBatcher:
+    """
+    Копит одиночные запросы к модели и выполняет их одним батчевым проходом.
+
+    Батч закрывается при достижении max_batch_size или по истечении max_wait_ms
+    с момента поступления первого запроса. batch_fn получает список элементов и
+    должен вернуть список результатов той же длины и в том же порядке.
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = MAX_BATCH_SIZE, max_wait_ms: float = MAX_WAIT_MS):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.batch_size_histogram = Histogram(
+            f"{name}_batch_size", "Размер батча модели", BATCH_SIZE_BUCKETS
+        )
+        self.wait_histogram = Histogram(
+            f"{name}_batch_wait_ms", "Ожидание запроса в очереди батчера, мс", WAIT_MS_BUCKETS
+        )
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._closed = False
+
+        with _BATCHERS_LOCK:
+            _BATCHERS[name] = self
+
+    def submit(self, item: Any) -> Future:
+        """Ставит элемент в очередь, результат придёт в concurrent.futures.Future"""
+        if self._closed:
+            raise RuntimeError(f"Batcher {self.name} is closed")
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    async def infer(self, item: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(item))
+
+    async def infer_many(self, items: List[Any]) -> List[Any]:
+        futures = [asyncio.wrap_future(self.submit(item)) for item in items]
+        return list(await asyncio.gather(*futures))
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self._queue.qsize(),
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "wait_ms": self.wait_histogram.snapshot()
+        }
+
+    def close(self):
+        """Останавливает воркер после обработки уже поставленных запросов"""
+        self._closed = True
+        self._queue.put(None)
+        with _BATCHERS_LOCK:
+            if _BATCHERS.get(self.name) is self:
+                del _BATCHERS[self.name]
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name=f"batcher-{self.name}", daemon=True
+                )
+                self._worker.start()
+                log(f"Batcher started: {self.name}, max_batch={self.max_batch_size}, "
+                    f"max_wait={self.max_wait_ms}ms", MODULE)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            pending = [first]
+            deadline = first[2] + self.max_wait_ms / 1000
+
+            stop = False
+            while len(pending) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                pending.append(entry)
+
+            self._execute(pending)
+            if stop:
+                return
+
+    def _execute(self, pending):
+        started = time.perf_counter()
+        for _, _, enqueued_at in pending:
+            self.wait_histogram.observe((started - enqueued_at) * 1000)
+
+        live = [entry for entry in pending if entry[1].set_running_or_notify_cancel()]
+        if not live:
+            return
+        self.batch_size_histogram.observe(len(live))
+
+        try:
+            results = self.batch_fn([item for item, _, _ in live])
+            if len(results) != len(live):
+                raise RuntimeError(
+                    f"Batch function returned {len(results)} results for {len(live)} inputs"
+                )
+        except Exception as e:
+            log(f"Batch inference failed in {self.name}: {e}", MODULE, level="ERROR")
+            for _, future, _ in live:
+                future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(live, results):
+            future.set_result(result)
+
+
+def get_batching_stats() -> dict:
+    with _BATCHERS_LOCK:
+        batchers = list(_BATCHERS.values())
+    return {batcher.name: batcher.stats() for batcher in batchers}
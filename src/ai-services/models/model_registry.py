@@ -0,0 +1,222 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from database.database import get_minio_client
+from models.model_slot import ModelSlot
+from utils.logger import log
+from utils.metrics import Histogram
+
+MODULE = "model_registry"
+
+MODEL_REGISTRY_MAX_MB = int(os.getenv("MODEL_REGISTRY_MAX_MB", 1024))
+
+LOAD_MS_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_VERSION_PATTERN = re.compile(r"^[A-Za-z0-9_.\-]+$")
+
+
+def keras_model_bytes(model) -> int:
+    """Оценка памяти под веса Keras-модели"""
+    if model is None:
+        return 0
+    total = 0
+    for weight in model.weights:
+        dtype = getattr(weight.dtype, "name", weight.dtype)
+        total += int(np.prod(weight.shape)) * np.dtype(dtype).itemsize
+    return total
+
+
+class ModelRegistry:
+    """
+    Реестр версий моделей.
+
+    Версия по умолчанию каждого типа живёт в своём слоте (горячая перезагрузка,
+    не вытесняется). Остальные версии загружаются по запросу и держатся в LRU,
+    ограниченном суммарным объёмом весов; вытесненная версия освобождается,
+    когда завершатся использующие её запросы.
+    """
+
+    def __init__(self, max_bytes: int = MODEL_REGISTRY_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._types: Dict[str, Dict[str, Any]] = {}
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[tuple, threading.Lock] = {}
+        self.load_histograms: Dict[str, Histogram] = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def register(self, model_type: str, default_version: str, builder: Callable[[str], Any],
+                 default_acquire: Callable, size_fn: Callable[[Any], int], artifact_suffix: str):
+        """
+        builder(version) собирает и прогревает экземпляр, default_acquire() —
+        контекстный менеджер, выдающий экземпляр версии по умолчанию
+        """
+        self._types[model_type] = {
+            "default_version": default_version,
+            "builder": builder,
+            "default_acquire": default_acquire,
+            "size_fn": size_fn,
+            "artifact_suffix": artifact_suffix
+        }
+        self.load_histograms[model_type] = Histogram(
+            f"{model_type}_model_load_ms", "Время загрузки версии модели, мс", LOAD_MS_BUCKETS
+        )
+
+    def resolve_version(self, model_type: str, version: Optional[str] = None) -> str:
+        spec = self._spec(model_type)
+        if not version:
+            return spec["default_version"]
+        if not _VERSION_PATTERN.match(version):
+            raise ValueError(f"Invalid model version: {version}")
+        return version
+
+    @contextmanager
+    def acquire(self, model_type: str, version: Optional[str] = None):
+        """Выдаёт экземпляр нужной версии на время запроса, при необходимости загружая его"""
+        spec = self._spec(model_type)
+        version = self.resolve_version(model_type, version)
+        if version == spec["default_version"]:
+            with spec["default_acquire"]() as instance:
+                yield instance
+            return
+
+        with ExitStack() as stack:
+            instance = self._enter(model_type, version, stack)
+            while instance is None:
+                self._load(model_type, version)
+                instance = self._enter(model_type, version, stack)
+            yield instance
+
+    @asynccontextmanager
+    async def acquire_async(self, model_type: str, version: Optional[str] = None):
+        """
+        То же, что acquire, но холодная загрузка идёт в потоке, не блокируя event loop.
+        Версия фиксируется в слоте той же проверкой, что нашла её загруженной, поэтому
+        вытеснение между проверкой и выдачей не приводит к загрузке в event loop
+        """
+        spec = self._spec(model_type)
+        resolved = self.resolve_version(model_type, version)
+        if resolved == spec["default_version"]:
+            with spec["default_acquire"]() as instance:
+                yield instance
+            return
+
+        with ExitStack() as stack:
+            instance = self._enter(model_type, resolved, stack)
+            while instance is None:
+                await asyncio.to_thread(self._load, model_type, resolved)
+                instance = self._enter(model_type, resolved, stack)
+            yield instance
+
+    def list_versions(self, model_type: str, bucket: str = "models") -> List[str]:
+        """Версии, для которых в бакете есть артефакты"""
+        suffix = self._spec(model_type)["artifact_suffix"]
+        objects = get_minio_client().list_objects(bucket)
+        return sorted(
+            obj.object_name[:-len(suffix)] for obj in objects
+            if obj.object_name.endswith(suffix) and "/" not in obj.object_name
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = [
+                {
+                    "model_type": model_type,
+                    "version": version,
+                    "size_bytes": entry["size_bytes"],
+                    "load_time_ms": entry["load_time_ms"],
+                    "loaded_at": entry["loaded_at"],
+                    "last_used": entry["last_used"],
+                    "uses": entry["uses"],
+                    "in_flight": entry["slot"].status()["in_flight"]
+                }
+                for (model_type, version), entry in self._entries.items()
+            ]
+        return {
+            "max_bytes": self.max_bytes,
+            "used_bytes": sum(e["size_bytes"] for e in entries),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "defaults": {name: spec["default_version"] for name, spec in self._types.items()},
+            "loaded": entries,
+            "load_time_ms": {name: hist.snapshot() for name, hist in self.load_histograms.items()}
+        }
+
+    def _spec(self, model_type: str) -> Dict[str, Any]:
+        spec = self._types.get(model_type)
+        if spec is None:
+            raise ValueError(f"Unknown model type: {model_type}")
+        return spec
+
+    def _enter(self, model_type: str, version: str, stack: ExitStack):
+        """Под блокировкой реестра: найти версию и зафиксировать её в слоте, чтобы вытеснение не вклинилось"""
+        with self._lock:
+            entry = self._entries.get((model_type, version))
+            if entry is None:
+                return None
+            self._entries.move_to_end((model_type, version))
+            entry["uses"] += 1
+            entry["last_used"] = datetime.utcnow().isoformat()
+            return stack.enter_context(entry["slot"].acquire())
+
+    def _load(self, model_type: str, version: str):
+        key = (model_type, version)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if key in self._entries:
+                    return
+            spec = self._spec(model_type)
+            started = time.perf_counter()
+            instance = spec["builder"](version)
+            load_time_ms = (time.perf_counter() - started) * 1000
+            size_bytes = spec["size_fn"](instance)
+            self.load_histograms[model_type].observe(load_time_ms)
+
+            with self._lock:
+                self.loads += 1
+                self._entries[key] = {
+                    "slot": ModelSlot(f"{model_type}@{version}", instance),
+                    "size_bytes": size_bytes,
+                    "load_time_ms": round(load_time_ms, 1),
+                    "loaded_at": datetime.utcnow().isoformat(),
+                    "last_used": None,
+                    "uses": 0
+                }
+                evicted = self._evict(protect=key)
+
+            log(f"Loaded {model_type}@{version}: {size_bytes / 1024 / 1024:.1f}MB in {load_time_ms:.0f}ms", MODULE)
+            if size_bytes > self.max_bytes:
+                log(f"{model_type}@{version} alone exceeds MODEL_REGISTRY_MAX_MB", MODULE, level="WARN")
+            for evicted_key, slot in evicted:
+                slot.retire()
+                log(f"Evicted {evicted_key[0]}@{evicted_key[1]}", MODULE)
+
+    def _evict(self, protect: tuple):
+        total = sum(entry["size_bytes"] for entry in self._entries.values())
+        evicted = []
+        for key in list(self._entries.keys()):
+            if total <= self.max_bytes:
+                break
+            if key == protect:
+                continue
+            entry = self._entries.pop(key)
+            total -= entry["size_bytes"]
+            self.evictions += 1
+            evicted.append((key, entry["slot"]))
+        return evicted
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,118 @@
+import asyncio
+import gc
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from utils.logger import log
+
+MODULE = "model_slot"
+
+
+class ModelSlot:
+    """
+    Слот с текущим экземпляром предиктора.
+
+    Новый экземпляр собирается и прогревается в фоне, затем подменяется
+    одной операцией присваивания. Запросы, взявшие экземпляр через acquire(),
+    дорабатывают на старом; старый освобождается, когда они завершатся.
+    """
+
+    def __init__(self, name: str, instance: Any):
+        self.name = name
+        self._current = instance
+        self._in_flight: Dict[int, int] = {}
+        self._retired: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+        self._reload_lock: Optional[asyncio.Lock] = None
+        self.generation = 1
+        self.reloading = False
+        self.last_reload: Optional[Dict[str, Any]] = None
+
+    @property
+    def current(self) -> Any:
+        return self._current
+
+    @contextmanager
+    def acquire(self):
+        """Фиксирует текущий экземпляр на время запроса"""
+        with self._lock:
+            instance = self._current
+            key = id(instance)
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        try:
+            yield instance
+        finally:
+            release = None
+            with self._lock:
+                self._in_flight[key] -= 1
+                if self._in_flight[key] == 0:
+                    del self._in_flight[key]
+                    release = self._retired.pop(key, None)
+            if release is not None:
+                self._release(release)
+
+    async def reload(self, factory: Callable[[], Any]) -> Dict[str, Any]:
+        """Собирает новый экземпляр вне event loop и атомарно подменяет текущий"""
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+
+        async with self._reload_lock:
+            self.reloading = True
+            started = time.perf_counter()
+            try:
+                instance = await asyncio.to_thread(factory)
+            finally:
+                self.reloading = False
+
+            with self._lock:
+                old = self._current
+                self._current = instance
+                self.generation += 1
+                old_in_flight = self._in_flight.get(id(old), 0)
+                if old_in_flight:
+                    self._retired[id(old)] = old
+
+            if not old_in_flight:
+                self._release(old)
+
+            self.last_reload = {
+                "generation": self.generation,
+                "build_time_ms": round((time.perf_counter() - started) * 1000, 1),
+                "old_in_flight": old_in_flight,
+                "completed_at": datetime.utcnow().isoformat()
+            }
+            log(f"{self.name} swapped to generation {self.generation}, "
+                f"{old_in_flight} request(s) finishing on previous model", MODULE)
+            return self.last_reload
+
+    def retire(self):
+        """Выводит экземпляр из обслуживания; освобождение — после завершения запросов"""
+        with self._lock:
+            instance = self._current
+            self._current = None
+            in_flight = self._in_flight.get(id(instance), 0)
+            if in_flight:
+                self._retired[id(instance)] = instance
+        if instance is not None and not in_flight:
+            self._release(instance)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "generation": self.generation,
+                "reloading": self.reloading,
+                "in_flight": sum(self._in_flight.values()),
+                "retired_pending_release": len(self._retired),
+                "last_reload": self.last_reload
+            }
+
+    def _release(self, instance: Any):
+        close = getattr(instance, "close", None)
+        if close is not None:
+            close()
+        del instance
+        gc.collect()
+        log(f"Previous {self.name} model released", MODULE)
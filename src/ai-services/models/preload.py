@@ -0,0 +1,89 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+
+from utils.logger import log
+
+MODULE = "preload"
+
+PRELOAD_MODELS = [
+    name.strip() for name in os.getenv("PRELOAD_MODELS", "autoencoder,dual_lstm").split(",")
+    if name.strip()
+]
+
+MODEL_STATE: Dict[str, Dict] = {
+    name: {"state": "pending", "error": None, "load_time_ms": None, "loaded_at": None}
+    for name in PRELOAD_MODELS
+}
+
+
+def _warm_autoencoder():
+    from models.autoencoder_model import _get_model_bundle, _score_samples
+    _score_samples(np.zeros((1, 119), dtype=np.float32), ["warmup"], ["warmup"],
+                   features=True, bundle=_get_model_bundle())
+
+
+def _warm_dual_lstm():
+    from models.dual_lstm_model import predictor_slot
+    predictor = predictor_slot.current
+    predictor.ensure_loaded()
+    predictor.warm_up()
+
+
+def _warm_hybrid_lstm():
+    from models.hybrid_model import predictor_slot
+    predictor = predictor_slot.current
+    predictor.ensure_loaded()
+    predictor.warm_up()
+
+
+_LOADERS = {
+    "autoencoder": _warm_autoencoder,
+    "dual_lstm": _warm_dual_lstm,
+    "hybrid_lstm": _warm_hybrid_lstm,
+}
+
+
+async def _preload_one(name: str):
+    state = MODEL_STATE[name]
+    loader = _LOADERS.get(name)
+    if loader is None:
+        state.update(state="failed", error=f"Unknown model: {name}")
+        log(f"Unknown model in PRELOAD_MODELS: {name}", MODULE, level="ERROR")
+        return
+
+    state.update(state="loading", error=None)
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(loader)
+        state.update(
+            state="ready",
+            load_time_ms=round((time.perf_counter() - started) * 1000, 1),
+            loaded_at=datetime.utcnow().isoformat()
+        )
+        log(f"Model ready: {name} in {state['load_time_ms']:.0f}ms", MODULE)
+    except Exception as e:
+        state.update(state="failed", error=str(e))
+        log(f"Model preload failed: {name}: {e}", MODULE, level="ERROR")
+
+
+async def preload_models():
+    """Загружает и прогревает модели из PRELOAD_MODELS в фоне, не блокируя event loop"""
+    log(f"Preloading models: {', '.join(PRELOAD_MODELS) or 'none'}", MODULE)
+    await asyncio.gather(*[_preload_one(name) for name in PRELOAD_MODELS])
+
+
+def get_model_states() -> Dict[str, Dict]:
+    return {name: dict(state) for name, state in MODEL_STATE.items()}
+
+
+def is_model_ready(name: str) -> bool:
+    return MODEL_STATE.get(name, {}).get("state") == "ready"
+
+
+def not_ready_models() -> List[str]:
+    return [name for name, state in MODEL_STATE.items() if state["state"] != "ready"]
@@ -0,0 +1,22 @@
+import numpy as np
+
+
+class AffineScaler:
+    """
+    Покомпонентный аффинный скейлер sklearn (Standard/MinMax/Robust), сведённый
+    к двум векторам: transform(x) == (x - offset) * gain. Коэффициенты
+    считаются через сам скейлер, поэтому тип скейлера не важен; дальше
+    преобразования — векторные операции numpy над массивами любой формы (..., n).
+    """
+
+    def __init__(self, scaler, n_features: int):
+        zero = scaler.transform(np.zeros((1, n_features)))[0]
+        gain = scaler.transform(np.ones((1, n_features)))[0] - zero
+        self.gain = np.where(gain == 0, 1.0, gain)
+        self.offset = -zero / self.gain
+
+    def transform(self, data: np.ndarray) -> np.ndarray:
+        return (data - self.offset) * self.gain
+
+    def inverse_transform(self, data: np.ndarray) -> np.ndarray:
+        return data / self.gain + self.offset
@@ -0,0 +1,364 @@
+"""
+TFLite-бэкенд для моделей инференса.
+
+Сборка:     python -m models.tflite_backend build --model dual_lstm --variant float16
+Валидация:  python -m models.tflite_backend validate --model dual_lstm --variant float16
+
+Артефакты кладутся в бакет моделей под tflite/<модель>.<вариант>.tflite рядом с
+отчётом валидации <модель>.<вариант>.validation.json. Предиктор переключается
+на TFLite только если в его *_BACKEND указан вариант и отчёт валидации имеет
+passed=true; иначе остаётся Keras.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
+
+import tensorflow as tf
+
+from database.artifact_cache import artifact_cache
+from database.database import get_minio_client
+from utils.logger import log
+
+MODULE = "tflite_backend"
+
+MODEL_BUCKET = "models"
+TFLITE_PREFIX = "tflite"
+VARIANTS = ("float16", "int8")
+MODEL_TYPES = ("autoencoder", "dual_lstm", "hybrid_lstm")
+
+BACKEND_ENV = {
+    "autoencoder": "AUTOENCODER_BACKEND",
+    "dual_lstm": "DUAL_LSTM_BACKEND",
+    "hybrid_lstm": "HYBRID_LSTM_BACKEND",
+}
+
+TFLITE_NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", os.cpu_count() or 1))
+
+# Допуски валидации: доля несовпавших флагов аномалий и относительная ошибка
+MAX_FLAG_MISMATCH_RATE = float(os.getenv("TFLITE_MAX_FLAG_MISMATCH_RATE", 0.0))
+MAX_RELATIVE_ERROR = float(os.getenv("TFLITE_MAX_RELATIVE_ERROR", 0.05))
+VALIDATION_SAMPLES = int(os.getenv("TFLITE_VALIDATION_SAMPLES", 200))
+
+
+class TFLiteRunner:
+    """Обёртка над tf.lite.Interpreter с сигнатурой serving_default"""
+
+    def __init__(self, model_content: bytes, variant: str, source: str):
+        self.variant = variant
+        self.source = source
+        self.size_bytes = len(model_content)
+        self._interpreter = tf.lite.Interpreter(
+            model_content=model_content, num_threads=TFLITE_NUM_THREADS
+        )
+        self._runner = self._interpreter.get_signature_runner()
+        self._lock = threading.Lock()
+
+    def run(self, x: np.ndarray) -> Dict[str, np.ndarray]:
+        """Возвращает выходы модели по именам; интерпретатор не потокобезопасен"""
+        with self._lock:
+            outputs = self._runner(x=np.ascontiguousarray(x, dtype=np.float32))
+        return {name: np.array(value) for name, value in outputs.items()}
+
+
+def object_stem(model_type: str, source_object: str) -> str:
+    if model_type == "autoencoder":
+        return source_object.replace(".weights.h5", "")
+    return source_object
+
+
+def tflite_object_name(model_type: str, source_object: str, variant: str) -> str:
+    return f"{TFLITE_PREFIX}/{object_stem(model_type, source_object)}.{variant}.tflite"
+
+
+def validation_object_name(model_type: str, source_object: str, variant: str) -> str:
+    return f"{TFLITE_PREFIX}/{object_stem(model_type, source_object)}.{variant}.validation.json"
+
+
+def requested_variant(model_type: str) -> Optional[str]:
+    """Читает *_BACKEND: keras (по умолчанию), tflite_float16 или tflite_int8"""
+    backend = os.getenv(BACKEND_ENV[model_type], "keras").lower()
+    if backend == "keras":
+        return None
+    variant = backend.replace("tflite_", "")
+    if variant not in VARIANTS:
+        log(f"Unknown backend {backend} for {model_type}, using keras", MODULE, level="WARN")
+        return None
+    return variant
+
+
+def load_tflite_backend(model_type: str, source_object: str) -> Optional[TFLiteRunner]:
+    """Загружает TFLite-модель, если она выбрана и прошла валидацию"""
+    variant = requested_variant(model_type)
+    if variant is None:
+        return None
+
+    report_name = validation_object_name(model_type, source_object, variant)
+    try:
+        report = json.loads(artifact_cache.read_bytes(MODEL_BUCKET, report_name))
+    except Exception as e:
+        log(f"No validation report {report_name} ({e}), {model_type} stays on keras", MODULE, level="WARN")
+        return None
+
+    if not report.get("passed"):
+        log(f"Validation of {model_type}/{variant} did not pass, staying on keras", MODULE, level="WARN")
+        return None
+
+    model_name = tflite_object_name(model_type, source_object, variant)
+    runner = TFLiteRunner(artifact_cache.read_bytes(MODEL_BUCKET, model_name), variant, model_name)
+    log(f"TFLite backend enabled for {model_type}: {model_name} ({runner.size_bytes} bytes)", MODULE)
+    return runner
+
+
+def _put_object_bytes(minio, object_name: str, payload: bytes, content_type: str):
+    minio.put_object(MODEL_BUCKET, object_name, io.BytesIO(payload), len(payload),
+                     content_type=content_type)
+
+
+def _export_function(model_type: str):
+    """Возвращает (tf.function для экспорта, keras-модель, имя исходного объекта)"""
+    if model_type == "autoencoder":
+        from models.autoencoder_model import COMPONENTS, MODEL_OBJECT, _load_model_and_stats
+        model, _, _ = _load_model_and_stats()
+
+        @tf.function(input_signature=[tf.TensorSpec([None, 119], tf.float32)])
+        def serve(x):
+            predictions, attention = model(x, training=False, return_attention=True)
+            outputs = {comp: pred for comp, pred in zip(COMPONENTS, predictions)}
+            outputs.update({f"attention_{comp}": attention[comp] for comp in COMPONENTS})
+            return outputs
+
+        return serve, model, MODEL_OBJECT
+
+    if model_type == "dual_lstm":
+        from models.dual_lstm_model import ORIGINAL_FEATURES, SEQUENCE_LENGTH, predictor_slot
+        predictor = predictor_slot.current
+        predictor.ensure_loaded()
+        model = predictor.model
+
+        @tf.function(input_signature=[tf.TensorSpec([None, SEQUENCE_LENGTH, ORIGINAL_FEATURES], tf.float32)])
+        def serve(x):
+            return {"prediction": model(x, training=False)}
+
+        return serve, model, predictor.model_prefix
+
+    if model_type == "hybrid_lstm":
+        from models.hybrid_model import ENHANCED_FEATURES, SEQUENCE_LENGTH, predictor_slot
+        predictor = predictor_slot.current
+        predictor.ensure_loaded()
+        model, serving_model = predictor.model, predictor.serving_model
+
+        @tf.function(input_signature=[tf.TensorSpec([None, SEQUENCE_LENGTH, ENHANCED_FEATURES], tf.float32)])
+        def serve(x):
+            prediction, attention = serving_model(x, training=False)
+            return {"prediction": prediction, "attention": attention}
+
+        return serve, model, predictor.model_prefix
+
+    raise ValueError(f"Unknown model type: {model_type}")
+
+
+def convert(model_type: str, variant: str) -> Dict[str, Any]:
+    """Конвертирует Keras-модель в TFLite и загружает результат в MinIO"""
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown variant: {variant}")
+
+    serve, model, source_object = _export_function(model_type)
+    converter = tf.lite.TFLiteConverter.from_concrete_functions(
+        [serve.get_concrete_function()], trackable_obj=model
+    )
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    # LSTM-слои с dropout не всегда сворачиваются в встроенные ops
+    converter.target_spec.supported_ops = [
+        tf.lite.OpsSet.TFLITE_BUILTINS,
+        tf.lite.OpsSet.SELECT_TF_OPS
+    ]
+    converter._experimental_lower_tensor_list_ops = False
+
+    content = converter.convert()
+    object_name = tflite_object_name(model_type, source_object, variant)
+    _put_object_bytes(get_minio_client(), object_name, content, "application/octet-stream")
+
+    log(f"Converted {model_type} to {variant}: {object_name}, {len(content)} bytes", MODULE)
+    return {
+        "model_type": model_type,
+        "variant": variant,
+        "object": object_name,
+        "size_bytes": len(content),
+        "keras_parameters": int(model.count_params())
+    }
+
+
+async def _load_validation_inputs(model_type: str, limit: int) -> np.ndarray:
+    """Берёт последние сохранённые входы из MongoDB как валидационный набор"""
+    from database.database import connect_to_mongo, get_database
+
+    if get_database() is None:
+        await connect_to_mongo()
+    database = get_database()
+
+    if model_type == "hybrid_lstm":
+        cursor = database.hybrid_lstm_results.find(
+            {"input_data.values": {"$type": "array"}}, {"input_data.values": 1}
+        ).sort("created_at", -1).limit(limit)
+        sequences = [doc["input_data"]["values"] async for doc in cursor]
+        return np.array(sequences, dtype=np.float32)
+
+    from models.feature_schema import FeatureMatrix
+
+    matrices = []
+    cursor = database.feature_extractions.find(
+        {"$or": [{"features.windows": {"$exists": True}}, {"features.windowed": True}]}, {"features": 1}
+    ).sort("created_at", -1).limit(limit)
+    async for doc in cursor:
+        rows = FeatureMatrix.from_document(doc["features"]).valid_rows()
+        if len(rows):
+            matrices.append(rows)
+
+    if not matrices:
+        return np.empty((0,))
+
+    if model_type == "autoencoder":
+        return np.concatenate(matrices)[:limit]
+
+    sequences = []
+    for matrix in matrices:
+        for start in range(len(matrix) - 10 + 1):
+            sequences.append(matrix[start:start + 10])
+    return np.array(sequences[:limit], dtype=np.float32)
+
+
+def _relative_error(reference: np.ndarray, candidate: np.ndarray) -> float:
+    scale = np.maximum(np.abs(reference), 1e-6)
+    return float(np.median(np.abs(candidate - reference) / scale))
+
+
+def _compare_autoencoder(inputs: np.ndarray, runner: TFLiteRunner) -> Dict[str, Any]:
+    from models.autoencoder_model import COMPONENTS, FEATURE_RANGES, _load_model_and_stats
+
+    model, stats, thresholds = _load_model_and_stats()
+    normalized = ((inputs - stats["mean"]) / stats["std"]).astype(np.float32)
+    keras_predictions, _ = model(normalized, training=False, return_attention=True)
+    tflite_outputs = runner.run(normalized)
+
+    per_component = {}
+    mismatches, total = 0, 0
+    worst_error = 0.0
+    for i, (comp, (start, end)) in enumerate(zip(COMPONENTS, FEATURE_RANGES)):
+        truth = normalized[:, start:end]
+        keras_err = np.mean((truth - np.asarray(keras_predictions[i])) ** 2, axis=1)
+        tflite_err = np.mean((truth - tflite_outputs[comp]) ** 2, axis=1)
+        threshold = thresholds[comp]["threshold"]
+        flag_mismatch = int(np.sum((keras_err > threshold) != (tflite_err > threshold)))
+        rel_error = _relative_error(keras_err, tflite_err)
+
+        per_component[comp] = {
+            "flag_mismatches": flag_mismatch,
+            "median_relative_error": round(rel_error, 6),
+            "max_abs_error_diff": float(np.max(np.abs(keras_err - tflite_err)))
+        }
+        mismatches += flag_mismatch
+        total += len(inputs)
+        worst_error = max(worst_error, rel_error)
+
+    return {
+        "components": per_component,
+        "flag_mismatch_rate": mismatches / total if total else 0.0,
+        "median_relative_error": worst_error
+    }
+
+
+def _compare_sequences(model_type: str, inputs: np.ndarray, runner: TFLiteRunner) -> Dict[str, Any]:
+    if model_type == "dual_lstm":
+        from models.dual_lstm_model import predictor_slot
+        predictor = predictor_slot.current
+        normalized = np.stack([predictor.scaler.transform(seq) for seq in inputs]).astype(np.float32)
+        keras_out = np.asarray(predictor.model(normalized, training=False)).reshape(len(inputs), -1)
+    else:
+        from models.hybrid_model import predictor_slot
+        predictor = predictor_slot.current
+        normalized = predictor.preprocess_data(inputs).astype(np.float32)
+        keras_out = np.asarray(predictor.model(normalized, training=False))
+
+    tflite_out = runner.run(normalized)["prediction"].reshape(keras_out.shape)
+    return {
+        "flag_mismatch_rate": 0.0,
+        "median_relative_error": _relative_error(keras_out, tflite_out),
+        "max_abs_diff": float(np.max(np.abs(keras_out - tflite_out)))
+    }
+
+
+def validate(model_type: str, variant: str, limit: int = VALIDATION_SAMPLES) -> Dict[str, Any]:
+    """Сравнивает TFLite-вариант с Keras-моделью и сохраняет отчёт валидации"""
+    inputs = asyncio.run(_load_validation_inputs(model_type, limit))
+    if len(inputs) == 0:
+        raise RuntimeError(f"No stored inputs available to validate {model_type}")
+
+    _, _, source_object = _export_function(model_type)
+    minio = get_minio_client()
+    model_name = tflite_object_name(model_type, source_object, variant)
+    runner = TFLiteRunner(artifact_cache.read_bytes(MODEL_BUCKET, model_name), variant, model_name)
+
+    if model_type == "autoencoder":
+        comparison = _compare_autoencoder(inputs, runner)
+    else:
+        comparison = _compare_sequences(model_type, inputs, runner)
+
+    passed = (comparison["flag_mismatch_rate"] <= MAX_FLAG_MISMATCH_RATE
+              and comparison["median_relative_error"] <= MAX_RELATIVE_ERROR)
+    report = {
+        "model_type": model_type,
+        "variant": variant,
+        "source_object": source_object,
+        "samples": int(len(inputs)),
+        "tolerances": {
+            "max_flag_mismatch_rate": MAX_FLAG_MISMATCH_RATE,
+            "max_relative_error": MAX_RELATIVE_ERROR
+        },
+        "comparison": comparison,
+        "passed": bool(passed),
+        "validated_at": datetime.utcnow().isoformat()
+    }
+    _put_object_bytes(
+        minio,
+        validation_object_name(model_type, source_object, variant),
+        json.dumps(report, indent=2).encode("utf-8"),
+        "application/json"
+    )
+    log(f"Validation {model_type}/{variant}: passed={passed}, "
+        f"rel_error={comparison['median_relative_error']:.5f}, "
+        f"flag_mismatch={comparison['flag_mismatch_rate']:.4f}", MODULE)
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="TFLite conversion and validation")
+    parser.add_argument("command", choices=["build", "validate"])
+    parser.add_argument("--model", choices=MODEL_TYPES, action="append", required=True)
+    parser.add_argument("--variant", choices=VARIANTS, action="append", required=True)
+    parser.add_argument("--samples", type=int, default=VALIDATION_SAMPLES)
+    args = parser.parse_args(argv)
+
+    for model_type in args.model:
+        for variant in args.variant:
+            if args.command == "build":
+                result = convert(model_type, variant)
+            else:
+                result = validate(model_type, variant, args.samples)
+            print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@
 FastAPI роуты автокодировщика:
 - /predict — 1 сэмпл, аналитика и признаки
 - /batch_predict — список сэмплов, групповая аналитика
+- /reload — горячая перезагрузка модели из S3
 """
 
 from datetime import datetime
@@ -13,8 +14,10 @@ from models.autoencoder_model import (
     AutoencoderBatchInferenceOutput,
     AutoencoderInferenceInput,
     AutoencoderInferenceOutput,
-    run_autoencoder_batch_inference,
-    run_autoencoder_inference
+    get_autoencoder_reload_status,
+    reload_autoencoder_model,
+    run_autoencoder_batch_inference_async,
+    run_autoencoder_inference_async
 )
 from uuid import uuid4
 from database.autoencoder_storage import save_one_result, save_batch_result
@@ -44,11 +47,12 @@ async def autoencoder_predict(request: AutoencoderInferenceInput):
         request_id = str(uuid4())
         sample_id = request.data_id or str(uuid4())
         log(f"Обработка sample_id={sample_id}, request_id={request_id}", MODULE)
-        result = run_autoencoder_inference(
+        result = await run_autoencoder_inference_async(
             request.input,
             sample_id,
             request_id,
-            features=request.features
+            features=request.features,
+            model_version=request.model_version
         )
         await save_one_result(result.dict() if hasattr(result, "dict") else result)
         log(f"Инференс успешно завершён для sample_id={sample_id}", MODULE)
@@ -62,10 +66,11 @@ async def autoencoder_predict(request: AutoencoderInferenceInput):
 async def autoencoder_batch_predict(request: AutoencoderBatchInferenceInput):
     log(f"Batch запрос на инференс, размер: {len(request.input)}", MODULE)
     try:
-        results = run_autoencoder_batch_inference(
+        results = await run_autoencoder_batch_inference_async(
             request.input,
             normalization_stats=getattr(request, "normalization_stats", None),
-            features=request.features
+            features=request.features,
+            model_version=request.model_version
         )
         batch_doc = {
             "batch_id": request.batch_id,
@@ -93,3 +98,18 @@ async def get_batch_results_endpoint(batch_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/reload")
+async def autoencoder_reload():
+    """Перезагрузка модели из S3 без остановки обслуживания"""
+    try:
+        reload_info = await reload_autoencoder_model()
+        return {"status": "reloaded", **reload_info, "message": "Autoencoder successfully reloaded from S3"}
+    except Exception as e:
+        log(f"Ошибка перезагрузки модели: {e}", MODULE, level="ERROR")
+        raise HTTPException(status_code=500, detail=f"Reload failed: {str(e)}")
+
+
+@router.get("/reload/status")
+async def autoencoder_reload_status():
+    return get_autoencoder_reload_status()
@@ -0,0 +1,339 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from datetime import datetime
+import asyncio
+import hashlib
+import os
+import uuid
+
+from database import backfill_storage
+from database.database import get_minio_client
+from database.feature_storage import feature_storage
+from database.lease_queue import WORKER_ID
+from models.combined_inference import forecast_sequences, score_matrices
+from models.dual_lstm_model import DEFAULT_MODEL_VERSION, SEQUENCE_LENGTH, window_sequences
+from models.feature_schema import FeatureMatrix
+from routers.backfill_worker import extract_recording, init_worker
+from routers.pipeline import pipeline_processor
+from utils.logger import log
+from utils.metrics import Counter
+
+MODULE = 'backfill'
+router = APIRouter(prefix="/pipeline/backfill", tags=["Backfill"])
+
+# Процессы для DSP; по умолчанию — все ядра, под пониженным приоритетом ОС
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 0)) or os.cpu_count() or 1
+BACKFILL_NICE = int(os.getenv("BACKFILL_NICE", 10))
+# Записей в пачке: признаки пачки считаются, пока модели обрабатывают предыдущую
+BACKFILL_CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", 32))
+# Строк признаков в одном вызове автоэнкодера
+BACKFILL_INFERENCE_BATCH = int(os.getenv("BACKFILL_INFERENCE_BATCH", 4096))
+
+BACKFILL_ITEMS = Counter("backfill_items_total", "Записи, обработанные перерасчётом", ("status",))
+BACKFILL_WINDOWS = Counter("backfill_windows_total", "Окна, обработанные перерасчётом")
+
+class BackfillRequest(BaseModel):
+    recordings: List[str] = Field(default_factory=list,
+                                  description="Записи: путь к CSV/JSON на узле или minio://bucket/object")
+    batch_ids: List[str] = Field(default_factory=list,
+                                 description="Батчи, которые пересчитываются из сохранённых признаков (без DSP)")
+    result_version: str = Field(..., description="Версия результатов перерасчёта; прежние результаты не трогаются")
+    user_id: str = Field(default="backfill", description="Владелец батчей из recordings")
+    window_size: int = Field(default=16384, gt=0, description="Размер окна")
+    dual_lstm_steps: int = Field(default=5, description="Количество шагов прогноза LSTM")
+    autoencoder_version: Optional[str] = Field(default=None, description="Версия автоэнкодера, по умолчанию — текущая")
+    dual_lstm_version: Optional[str] = Field(default=None, description="Версия Dual LSTM, по умолчанию — текущая")
+    run_lstm: bool = Field(default=True, description="Считать прогноз Dual LSTM")
+
+
+def recording_batch_id(source: str, result_version: str) -> str:
+    """Стабильный batch_id записи: одинаков при продолжении прогона"""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f"backfill_{stem}_{hashlib.blake2b(f'{source}:{result_version}'.encode(), digest_size=4).hexdigest()}"
+
+
+def _read_minio(source: str) -> bytes:
+    bucket, _, object_name = source[len("minio://"):].partition("/")
+    response = get_minio_client().get_object(bucket, object_name)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+class BackfillRunner:
+    """
+    Перерасчёт сохранённых данных после смены экстрактора или модели.
+
+    Прогон хранится в backfill_runs: элементы, готовые batch_id и ошибки.
+    Записи идут пачками: DSP — в пуле процессов, пока модели считают
+    предыдущую пачку; автоэнкодер — одним большим батчем на пачку, LSTM —
+    все последовательности пачки одним прокатом. Результаты пишутся одной
+    групповой записью с result_version рядом с прежними. Модели занимают
+    слот пайплайна классом backfill, поэтому интерактивные запросы идут
+    первыми. Прерванный прогон продолжается с первой неготовой записи.
+    """
+
+    def __init__(self, workers: int = BACKFILL_WORKERS, chunk_size: int = BACKFILL_CHUNK_SIZE):
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def create(self, request: BackfillRequest) -> Dict[str, Any]:
+        if not request.recordings and not request.batch_ids:
+            raise ValueError("Nothing to backfill: pass recordings or batch_ids")
+        items = [{"kind": "batch", "batch_id": batch_id} for batch_id in dict.fromkeys(request.batch_ids)]
+        items += [
+            {"kind": "recording", "source": source, "batch_id": recording_batch_id(source, request.result_version)}
+            for source in dict.fromkeys(request.recordings)
+        ]
+        options = request.dict(exclude={"recordings", "batch_ids", "result_version"})
+        return await backfill_storage.create_run(str(uuid.uuid4()), items, request.result_version, options)
+
+    async def start(self, run_id: str) -> Dict[str, Any]:
+        """Забирает прогон и выполняет его в фоне; RuntimeError — его выполняет живой процесс"""
+        doc = await backfill_storage.claim_run(run_id, WORKER_ID)
+        if doc is None:
+            raise RuntimeError(f"Backfill {run_id} is running elsewhere")
+        self.tasks[run_id] = asyncio.create_task(self._run(doc))
+        return doc
+
+    def cancel(self, run_id: str) -> bool:
+        task = self.tasks.get(run_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def run(self, run_id: str) -> str:
+        """Выполняет или продолжает прогон в текущей задаче (CLI); возвращает итоговое состояние"""
+        doc = await backfill_storage.claim_run(run_id, WORKER_ID)
+        if doc is None:
+            log(f"Backfill {run_id} not found or running elsewhere", MODULE, level="WARN")
+            return "not_claimed"
+        return await self._run(doc)
+
+    async def _run(self, doc: Dict[str, Any]) -> str:
+        """Готовые записи пропускаются; прогресс пишется после каждой пачки"""
+        run_id = doc["_id"]
+        completed = set(doc["completed"])
+        pending = [item for item in doc["items"] if item["batch_id"] not in completed]
+        chunks = [pending[i:i + self.chunk_size] for i in range(0, len(pending), self.chunk_size)]
+        log(f"Backfill {run_id} started: {len(pending)} of {doc['total']} item(s) left, "
+            f"version {doc['result_version']}, {self.workers} worker process(es)", MODULE)
+
+        loaded = None
+        try:
+            loaded = asyncio.create_task(self._load(chunks[0], doc["options"])) if chunks else None
+            for ix in range(len(chunks)):
+                features, failed = await loaded
+                # следующая пачка считается в пуле, пока эта занята моделями
+                loaded = asyncio.create_task(self._load(chunks[ix + 1], doc["options"])) if ix + 1 < len(chunks) else None
+                try:
+                    windows = await self._process(doc, features)
+                    done = [item["batch_id"] for item, _, _ in features]
+                except Exception as e:
+                    log(f"Backfill {run_id} chunk {ix + 1}/{len(chunks)} failed: {e}", MODULE, level="ERROR")
+                    failed.update({item["batch_id"]: str(e) for item, _, _ in features})
+                    windows, done = 0, []
+                await backfill_storage.record_progress(run_id, done, failed, windows)
+                BACKFILL_ITEMS.labels("completed").inc(len(done))
+                BACKFILL_ITEMS.labels("failed").inc(len(failed))
+                BACKFILL_WINDOWS.inc(windows)
+                log(f"Backfill {run_id}: chunk {ix + 1}/{len(chunks)}, {len(done)} done, {len(failed)} failed", MODULE)
+        except asyncio.CancelledError:
+            if loaded is not None:
+                loaded.cancel()
+            await backfill_storage.finish_run(run_id, "cancelled")
+            log(f"Backfill {run_id} cancelled, resume continues from the last recorded chunk", MODULE, level="WARN")
+            raise
+        except Exception as e:
+            await backfill_storage.finish_run(run_id, "failed", str(e))
+            log(f"Backfill {run_id} failed: {e}", MODULE, level="ERROR")
+            return "failed"
+
+        result = await backfill_storage.get_run(run_id, with_items=False)
+        state = "completed" if not result["failed"] else "completed_with_errors"
+        await backfill_storage.finish_run(run_id, state)
+        log(f"Backfill {run_id} {state}: {len(result['completed'])} done, {len(result['failed'])} failed", MODULE)
+        return state
+
+    async def progress(self, run_id: str) -> Optional[Dict[str, Any]]:
+        doc = await backfill_storage.get_run(run_id, with_items=False)
+        if doc is None:
+            return None
+        done, failed = len(doc["completed"]), len(doc["failed"])
+        status = {
+            "backfill_id": doc["_id"],
+            "state": doc["state"],
+            "result_version": doc["result_version"],
+            "total": doc["total"],
+            "completed": done,
+            "failed": failed,
+            "fraction": round(done / doc["total"], 4) if doc["total"] else 1.0,
+            "windows_processed": doc["windows_processed"],
+            "errors": dict(list(doc["failed"].items())[:20]),
+            "owner": doc.get("owner"),
+            "running_here": run_id in self.tasks and not self.tasks[run_id].done(),
+            "created_at": doc["created_at"].isoformat(),
+            "started_at": doc["started_at"].isoformat() if doc.get("started_at") else None,
+            "finished_at": doc["finished_at"].isoformat() if doc.get("finished_at") else None
+        }
+        if doc["state"] == "running" and doc.get("started_at"):
+            elapsed = (doc["updated_at"] - doc["started_at"]).total_seconds()
+            status["windows_per_second"] = round(doc["windows_processed"] / elapsed, 1) if elapsed > 0 else None
+        return status
+
+    async def shutdown(self):
+        for run_id in list(self.tasks):
+            self.cancel(run_id)
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, а не fork: к этому моменту в процессе уже работают потоки TF, батчеров и Motor,
+            # и копия чужой захваченной блокировки в дочернем процессе повисла бы навсегда
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=init_worker, initargs=(BACKFILL_NICE,))
+        return self._pool
+
+    async def _load(self, items: List[Dict[str, Any]], options: Dict[str, Any]):
+        """Признаки пачки: записи — через пул процессов, батчи — из feature_extractions"""
+        loop = asyncio.get_running_loop()
+
+        async def load(item):
+            if item["kind"] == "batch":
+                matrix = await feature_storage.get_feature_matrix_by_batch_id(item["batch_id"])
+                if matrix is None:
+                    raise LookupError(f"No stored features for batch {item['batch_id']}")
+                return matrix, None
+            source = item["source"]
+            content = await asyncio.to_thread(_read_minio, source) if source.startswith("minio://") else None
+            values, valid, windows_metadata, data_length = await loop.run_in_executor(
+                self._executor(), extract_recording, source, content, options["window_size"]
+            )
+            metadata = {"use_windowing": True, "window_size": options["window_size"], "data_length": data_length,
+                        "source": source}
+            return FeatureMatrix(values, valid, windows_metadata), metadata
+
+        outcomes = await asyncio.gather(*(load(item) for item in items), return_exceptions=True)
+        features, failed = [], {}
+        for item, outcome in zip(items, outcomes):
+            if isinstance(outcome, Exception):
+                failed[item["batch_id"]] = str(outcome)
+            else:
+                features.append((item, *outcome))
+        return features, failed
+
+    async def _process(self, doc: Dict[str, Any], features: List[Tuple[Dict[str, Any], FeatureMatrix, Any]]) -> int:
+        """Модели на всю пачку сразу и групповая запись; возвращает число окон"""
+        if not features:
+            return 0
+        options, version = doc["options"], doc["result_version"]
+        matrices = [matrix for _, matrix, _ in features]
+        windows = sum(matrix.n_windows for matrix in matrices)
+        now = datetime.utcnow()
+
+        scheduler = pipeline_processor.scheduler
+        await scheduler.acquire("backfill", f"backfill:{doc['_id']}", windows)
+        try:
+            autoencoder = await score_matrices(matrices, options["autoencoder_version"],
+                                               batch_rows=BACKFILL_INFERENCE_BATCH)
+            dual_lstm = [None] * len(matrices)
+            if options["run_lstm"]:
+                dual_lstm = await forecast_sequences([
+                    window_sequences(matrix.values)
+                    if matrix.windowed and matrix.n_windows >= SEQUENCE_LENGTH and matrix.valid.all() else None
+                    for matrix in matrices
+                ], options["dual_lstm_steps"], options["dual_lstm_version"])
+        finally:
+            scheduler.release("backfill")
+
+        feature_docs, autoencoder_docs, dual_lstm_docs = [], [], []
+        for (item, matrix, metadata), results, predictions in zip(features, autoencoder, dual_lstm):
+            batch_id = item["batch_id"]
+            if metadata is not None:
+                feature_docs.append({
+                    "batch_id": batch_id, "result_version": version, "user_id": options["user_id"],
+                    "features": matrix.to_document(), "metadata": metadata, "created_at": now,
+                    "feature_count": matrix.schema.size
+                })
+            autoencoder_docs.append({
+                "batch_id": batch_id, "result_version": version, "timestamp": now.isoformat(),
+                "count": len(results), "results": results, "backfill_id": doc["_id"]
+            })
+            if predictions is not None:
+                dual_lstm_docs.append({
+                    "batch_id": batch_id, "result_version": version, "predictions": predictions,
+                    "metadata": {"batch_size": len(predictions), "steps_predicted": options["dual_lstm_steps"],
+                                 "sequence_length": SEQUENCE_LENGTH, "backfill_id": doc["_id"]},
+                    "created_at": now, "model_version": options["dual_lstm_version"] or DEFAULT_MODEL_VERSION
+                })
+
+        await backfill_storage.bulk_upsert_results("feature_extractions", feature_docs)
+        await backfill_storage.bulk_upsert_results("autoencoder_results", autoencoder_docs)
+        await backfill_storage.bulk_upsert_results("dual_lstm_results", dual_lstm_docs)
+        return windows
+
+
+backfill_runner = BackfillRunner()
+
+
+@router.post("", status_code=202)
+async def start_backfill(request: BackfillRequest):
+    """Создаёт и запускает перерасчёт записей или батчей под новой версией результатов"""
+    try:
+        doc = await backfill_runner.create(request)
+        await backfill_runner.start(doc["_id"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "backfill_id": doc["_id"],
+        "total": doc["total"],
+        "result_version": doc["result_version"],
+        "status_url": f"/pipeline/backfill/{doc['_id']}"
+    }
+
+
+@router.get("")
+async def list_backfills(limit: int = 20):
+    runs = await backfill_storage.list_runs(limit)
+    return {"backfills": runs, "timestamp": datetime.now().isoformat()}
+
+
+@router.get("/{backfill_id}")
+async def get_backfill_progress(backfill_id: str):
+    """Прогресс: готово, с ошибками, окна и скорость"""
+    status = await backfill_runner.progress(backfill_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Backfill not found")
+    return status
+
+
+@router.post("/{backfill_id}/resume", status_code=202)
+async def resume_backfill(backfill_id: str):
+    """Продолжает остановленный или упавший прогон с первой неготовой записи"""
+    status = await backfill_runner.progress(backfill_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Backfill not found")
+    try:
+        await backfill_runner.start(backfill_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"backfill_id": backfill_id, "state": "running", "completed": status["completed"], "total": status["total"]}
+
+
+@router.delete("/{backfill_id}")
+async def cancel_backfill(backfill_id: str):
+    """Останавливает прогон на этом узле; готовые пачки сохраняются, продолжение — через /resume"""
+    if not backfill_runner.cancel(backfill_id):
+        raise HTTPException(status_code=404, detail="Backfill is not running on this node")
+    return {"backfill_id": backfill_id, "state": "cancelling"}
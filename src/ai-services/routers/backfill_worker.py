@@ -0,0 +1,43 @@
+# src\ai-services\routers\backfill_worker.py
+"""
+Код процессов пула перерасчёта. Процессы запускаются через spawn и импортируют
+только этот модуль: без TensorFlow, батчеров и клиента Mongo родительского процесса.
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from models.motor_features import MotorDefectFeatures
+from routers.features import create_windowed_features, extract_phase_data, parse_input_data
+
+_CONTENT_TYPES = {".csv": "text/csv", ".json": "application/json"}
+_extractor = None
+
+
+def init_worker(nice: int):
+    """Процессы перерасчёта уступают CPU интерактивным запросам"""
+    try:
+        os.nice(nice)
+    except (AttributeError, OSError):
+        pass
+
+
+def extract_recording(source: str, content: Optional[bytes], window_size: int
+                      ) -> Tuple[np.ndarray, np.ndarray, List[Dict[str, int]], int]:
+    """Признаки записи в процессе пула; возвращает части FeatureMatrix и длину записи"""
+    global _extractor
+    if _extractor is None:
+        _extractor = MotorDefectFeatures()
+    content_type = _CONTENT_TYPES.get(os.path.splitext(source)[1].lower())
+    if content_type is None:
+        raise ValueError(f"Unsupported recording format: {source}")
+    if content is None:
+        with open(source, "rb") as f:
+            content = f.read()
+    if content_type == "application/json":
+        content = content.decode("utf-8")
+    phases = extract_phase_data(parse_input_data(content, content_type))
+    matrix = create_windowed_features(*phases, _extractor, window_size)
+    return matrix.values, matrix.valid, matrix.windows_metadata, len(phases[0])
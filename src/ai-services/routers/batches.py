@@ -1,18 +1,18 @@
 from fastapi import APIRouter, HTTPException, Query
+import numpy as np
 from typing import List, Dict, Any, Optional
 from utils.data_cleaner import safe_json_response  
 from datetime import datetime, timezone
 from database.batch_storage import batch_storage
-from database.feature_storage import FeatureStorage
+from database.feature_storage import feature_storage
 from database.autoencoder_storage import get_batch_result as get_autoencoder_batch
 from database.dual_lstm_storage import get_batch_results as get_lstm_batch
+from models.autoencoder_model import explain_autoencoder_async
 from utils.logger import log
 
 MODULE = 'batches'
 router = APIRouter(prefix="/batches", tags=["Batch Management"])
 
-feature_storage = FeatureStorage()
-
 @router.get("/user/{user_id}")
 async def get_user_batches(
     user_id: str, 
@@ -212,7 +212,10 @@ async def get_batch_metadata(batch_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{batch_id}/complete")
-async def get_complete_batch_results(batch_id: str):
+async def get_complete_batch_results(
+    batch_id: str,
+    result_version: Optional[str] = Query(None, description="Версия перерасчёта, по умолчанию — результаты пайплайна")
+):
     """Получает все результаты батча (работает для всех типов)"""
     try:
         
@@ -240,21 +243,24 @@ async def get_complete_batch_results(batch_id: str):
         
         
         try:
-            features = await feature_storage.get_features_by_batch_id(batch_id)
-            results["features"] = features
+            features = None
+            if result_version is not None:
+                features = await feature_storage.get_features_by_batch_id(batch_id, result_version)
+            # перерасчёт из сохранённых признаков новых признаков не пишет
+            results["features"] = features or await feature_storage.get_features_by_batch_id(batch_id)
         except Exception as e:
             log(f"Features not found for {batch_id}: {e}", MODULE, level="WARN")
         
         
         try:
-            autoencoder_results = await get_autoencoder_batch(batch_id)
+            autoencoder_results = await get_autoencoder_batch(batch_id, result_version)
             results["autoencoder"] = autoencoder_results
         except Exception as e:
             log(f"Autoencoder not found for {batch_id}: {e}", MODULE, level="WARN")
         
         
         try:
-            lstm_results = await get_lstm_batch(batch_id)
+            lstm_results = await get_lstm_batch(batch_id, result_version)
             results["dual_lstm"] = {
                 "count": len(lstm_results),
                 "results": lstm_results
@@ -279,3 +285,62 @@ async def get_complete_batch_results(batch_id: str):
     except Exception as e:
         log(f"Error getting complete batch: {e}", MODULE, level="ERROR")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _explain_windows(batch_id: str, window_indices: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    Пересчитывает латенты и attention по сохранённым признакам батча.
+    Индекс окна — как в результатах автоэнкодера: среди полных окон, неполные пропущены
+    """
+    features = await feature_storage.get_feature_matrix_by_batch_id(batch_id)
+    if features is None:
+        raise HTTPException(status_code=404, detail="Features not found for batch")
+
+    valid_rows = np.flatnonzero(features.valid)
+    if window_indices is None:
+        window_indices = list(range(len(valid_rows)))
+    for ix in window_indices:
+        if ix < 0 or ix >= len(valid_rows):
+            raise HTTPException(status_code=404, detail=f"Window {ix} not found")
+
+    # Та же версия модели, что дала сохранённый вердикт
+    model_version = None
+    stored = await get_autoencoder_batch(batch_id)
+    if stored and stored.get("results"):
+        model_version = stored["results"][0].get("overall", {}).get("model_version")
+
+    explanations = await explain_autoencoder_async(features.values[valid_rows[window_indices]],
+                                                   model_version=model_version)
+    return {
+        "batch_id": batch_id,
+        "model_version": model_version,
+        "windows": [
+            {"window_index": ix, **explanation}
+            for ix, explanation in zip(window_indices, explanations)
+        ]
+    }
+
+
+@router.get("/{batch_id}/explain")
+async def explain_batch(batch_id: str, window: Optional[List[int]] = Query(None, description="Индексы окон, по умолчанию все")):
+    """Объяснения автоэнкодера (латенты, attention) для окон батча — считаются по запросу"""
+    try:
+        return safe_json_response(await _explain_windows(batch_id, window))
+    except HTTPException:
+        raise
+    except Exception as e:
+        log(f"Error explaining batch {batch_id}: {e}", MODULE, level="ERROR")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{batch_id}/windows/{window_index}/explain")
+async def explain_window(batch_id: str, window_index: int):
+    """Объяснение автоэнкодера для одного окна: открытие детального просмотра"""
+    try:
+        result = await _explain_windows(batch_id, [window_index])
+        return safe_json_response({"batch_id": batch_id, "model_version": result["model_version"], **result["windows"][0]})
+    except HTTPException:
+        raise
+    except Exception as e:
+        log(f"Error explaining window {batch_id}/{window_index}: {e}", MODULE, level="ERROR")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,409 @@
+from fastapi import APIRouter, File, Form, HTTPException, Query, Request, UploadFile
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import io
+import time
+import uuid
+
+import numpy as np
+
+from database.autoencoder_storage import save_batch_result as save_autoencoder_batch
+from database.batch_storage import batch_storage
+from database.dual_lstm_storage import save_inference_result as save_dual_lstm_result
+from database.write_behind import write_behind
+from models.combined_inference import forecast_sequences, score_matrices
+from models.dual_lstm_model import SEQUENCE_LENGTH, window_sequences
+from models.feature_schema import FeatureMatrix
+from routers.pipeline import (RUN_CONFIG_FIELDS, PipelineResult, PipelineStageResult, _overall_status,
+                              cancelled_response, pipeline_processor)
+from utils.deadline import WorkCancelled, check, ensure_feasible, from_headers, run_with_deadline
+from utils.degradation import PipelineOverloaded, degradation_policy
+from utils.logger import log
+from utils.profiling import to_thread
+
+MODULE = 'bulk_analysis'
+router = APIRouter(prefix="/pipeline/analyze/bulk", tags=["Full Pipeline"])
+
+Phases = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class RecordingInput(BaseModel):
+    current_R: List[float] = Field(..., description="Ток фазы R")
+    current_S: List[float] = Field(..., description="Ток фазы S")
+    current_T: List[float] = Field(..., description="Ток фазы T")
+    batch_id: Optional[str] = Field(default=None, description="ID батча записи")
+
+
+class BulkAnalysisInput(BaseModel):
+    recordings: List[RecordingInput] = Field(default_factory=list, description="Записи; у каждой свой batch_id")
+    user_id: str = Field(default="anonymous", description="ID пользователя")
+    use_windowing: bool = Field(default=True, description="Использовать оконную обработку")
+    window_size: int = Field(default=16384, gt=0, description="Размер окна")
+    dual_lstm_steps: int = Field(default=5, description="Количество шагов прогноза LSTM")
+    autoencoder_version: Optional[str] = Field(default=None, description="Версия автоэнкодера, по умолчанию — текущая")
+    dual_lstm_version: Optional[str] = Field(default=None, description="Версия Dual LSTM, по умолчанию — текущая")
+    explain: bool = Field(default=False, description="Сохранять латенты и attention для каждого окна")
+
+
+class BulkAnalysisResult(BaseModel):
+    bulk_id: str
+    user_id: str
+    timestamp: str
+    total_execution_time_ms: float
+    overall_status: str
+    recordings: List[PipelineResult]
+    data_summary: Dict[str, Any]
+    degradation: Optional[Dict[str, Any]] = None
+
+
+class _Recording:
+    """Запись внутри пачки: признаки, результаты и этапы, как у одиночного запуска"""
+
+    def __init__(self, batch_id: str, phases: Phases):
+        self.batch_id = batch_id
+        self.phases = phases
+        self.features: Optional[FeatureMatrix] = None
+        self.metadata: Optional[Dict[str, Any]] = None
+        self.stages: List[PipelineStageResult] = []
+        self.outputs: Dict[str, Optional[str]] = {}
+
+
+class BulkAnalyzer:
+    """
+    Анализ многих записей одним запросом.
+
+    Признаки всех окон всех записей считаются одним вызовом вне event loop,
+    автоэнкодер и LSTM — по общей матрице окон большими батчами, запись —
+    одной волной в отложенную запись, которая группирует документы в bulk_write.
+    Слот пайплайна один на весь запрос (класс interactive, цена — все окна),
+    а результаты и контрольные точки — у каждой записи под своим batch_id,
+    так что /batches/* читает их как результаты /pipeline/analyze.
+    """
+
+    def __init__(self, processor=pipeline_processor):
+        self.processor = processor
+
+    async def analyze(self, options: BulkAnalysisInput, recordings: List[Tuple[Optional[str], Phases]]
+                      ) -> BulkAnalysisResult:
+        if not recordings:
+            raise ValueError("No recordings provided")
+        bulk_id = str(uuid.uuid4())
+        stamp = int(datetime.now().timestamp())
+        items = [
+            _Recording(batch_id or f"batch_{options.user_id}_{stamp}_{ix}", phases)
+            for ix, (batch_id, phases) in enumerate(recordings)
+        ]
+        if len({item.batch_id for item in items}) != len(items):
+            raise ValueError("batch_id of recordings must be unique")
+
+        processor = self.processor
+        tier = degradation_policy.select(processor.waiting, processor.max_concurrency)
+        if tier.reject:
+            raise PipelineOverloaded(degradation_policy.retry_after(processor.waiting, processor.max_concurrency))
+        windows_hint = sum(max(1, len(item.phases[0]) // options.window_size) if options.use_windowing else 1
+                           for item in items)
+        ensure_feasible("queue", degradation_policy.expected_ms(windows_hint))
+        queue_wait_ms = await processor.scheduler.acquire("interactive", options.user_id, windows_hint)
+        start_time = datetime.now()
+        started = time.perf_counter()
+        try:
+            log(f"Bulk analysis started: {bulk_id}, {len(items)} recording(s), user: {options.user_id}, "
+                f"queued {queue_wait_ms:.0f}ms", MODULE)
+            ensure_feasible("queue", degradation_policy.expected_ms(windows_hint))
+            await self._extract(items, options, started)
+            extracted = [item for item in items if item.features is not None]
+            check("autoencoder_analysis")
+            await self._autoencoder(extracted, options, tier, started)
+            if tier.run_lstm:
+                check("dual_lstm_analysis")
+                await self._dual_lstm(extracted, options, tier, started)
+        finally:
+            processor.scheduler.release("interactive")
+            processor.completed += 1
+
+        total_ms = (time.perf_counter() - started) * 1000
+        degradation_policy.observe(total_ms, windows_hint)
+        results = [self._result(item, options, tier, start_time, total_ms, bulk_id, queue_wait_ms) for item in items]
+        await self._checkpoint(items, results, options)
+
+        persisted = await asyncio.gather(*(write_behind.wait_for_batch(item.batch_id) for item in items))
+        if not all(persisted):
+            log(f"Some results of bulk {bulk_id} are not persisted yet", MODULE, level="WARN")
+        for result, ok in zip(results, persisted):
+            result.persist_pending = not ok
+
+        statuses = {result.overall_status for result in results}
+        overall_status = statuses.pop() if len(statuses) == 1 else "partial_failure"
+        windows = sum(item.features.n_windows for item in items if item.features is not None)
+        log(f"Bulk analysis completed: {bulk_id}, {len(items)} recording(s), {windows} window(s), "
+            f"status: {overall_status}, time: {total_ms:.0f}ms", MODULE)
+        return BulkAnalysisResult(
+            bulk_id=bulk_id,
+            user_id=options.user_id,
+            timestamp=start_time.isoformat(),
+            total_execution_time_ms=total_ms,
+            overall_status=overall_status,
+            recordings=results,
+            data_summary={
+                "recordings": len(items),
+                "windows": windows,
+                "queue_wait_ms": round(queue_wait_ms, 1),
+                "priority_class": "interactive",
+                "degradation_tier": tier.level
+            },
+            degradation=tier.to_dict()
+        )
+
+    async def _extract(self, items: List[_Recording], options: BulkAnalysisInput, started: float):
+        """Признаки всех записей одним переходом в рабочий поток"""
+        service = self.processor.feature_service
+
+        def extract_all():
+            outcomes = []
+            for item in items:
+                try:
+                    outcomes.append(service._compute(item.phases, "bulk", options.use_windowing, options.window_size))
+                except WorkCancelled:
+                    raise
+                except Exception as e:
+                    outcomes.append(e)
+            return outcomes
+
+        stage_started = time.perf_counter()
+        outcomes = await to_thread(extract_all)
+        compute_ms = (time.perf_counter() - stage_started) * 1000
+        for item, outcome in zip(items, outcomes):
+            if isinstance(outcome, Exception):
+                log(f"feature_extraction failed for batch {item.batch_id}: {outcome}", MODULE, level="ERROR")
+                item.stages.append(self._stage(item, "feature_extraction", stage_started, started, compute_ms,
+                                               error=str(outcome)))
+                continue
+            item.features, item.metadata = outcome
+            item.outputs["feature_extraction"] = await self.processor.feature_service.storage.save_features(
+                options.user_id, item.features, item.metadata, item.batch_id
+            )
+            item.stages.append(self._stage(item, "feature_extraction", stage_started, started, compute_ms,
+                                           windows=item.features.n_windows))
+
+    async def _autoencoder(self, items: List[_Recording], options: BulkAnalysisInput, tier, started: float):
+        """Автоэнкодер по полным окнам всех записей разом"""
+        stage_started = time.perf_counter()
+        scored = [item for item in items if item.features.valid.any()]
+        try:
+            results = await score_matrices([item.features for item in scored], options.autoencoder_version,
+                                           tier.mc_passes, options.explain and tier.explain)
+        except WorkCancelled:
+            raise
+        except Exception as e:
+            log(f"autoencoder_analysis failed for bulk of {len(scored)} recording(s): {e}", MODULE, level="ERROR")
+            compute_ms = (time.perf_counter() - stage_started) * 1000
+            for item in items:
+                item.stages.append(self._stage(item, "autoencoder_analysis", stage_started, started, compute_ms,
+                                               error=str(e)))
+            return
+        compute_ms = (time.perf_counter() - stage_started) * 1000
+
+        by_batch = {item.batch_id: batch_results for item, batch_results in zip(scored, results)}
+        for item in items:
+            batch_results = by_batch.get(item.batch_id)
+            if batch_results is None:
+                item.stages.append(self._stage(item, "autoencoder_analysis", stage_started, started, compute_ms,
+                                               error="No valid feature vectors for autoencoder processing"))
+                continue
+            batch_doc = {
+                "batch_id": item.batch_id,
+                "timestamp": datetime.utcnow().isoformat(),
+                "count": len(batch_results),
+                "results": batch_results,
+                "degradation": tier.to_dict()
+            }
+            item.outputs["autoencoder_analysis"] = await save_autoencoder_batch(batch_doc)
+            item.stages.append(self._stage(item, "autoencoder_analysis", stage_started, started, compute_ms,
+                                           windows=len(batch_results)))
+
+    async def _dual_lstm(self, items: List[_Recording], options: BulkAnalysisInput, tier, started: float):
+        """Последовательности всех записей одним прокатом LSTM; формы — как в одиночном пайплайне"""
+        stage_started = time.perf_counter()
+        steps = options.dual_lstm_steps if tier.lstm_steps is None else min(options.dual_lstm_steps, tier.lstm_steps)
+        sequence_sets, first_sequences, kinds = [], [], []
+        for item in items:
+            features = item.features
+            sequences, kind = None, None
+            if features.windowed and features.n_windows >= SEQUENCE_LENGTH:
+                kind = "inter_window"
+                if features.valid.all():
+                    sequences = window_sequences(features.values)
+            elif features.windowed:
+                kind = "intra_window"
+                sequences = self.processor._create_intra_window_sequences(features)
+            first_sequence = 0
+            if sequences is not None and tier.lstm_max_sequences is not None:
+                first_sequence = max(0, len(sequences) - tier.lstm_max_sequences)
+                sequences = sequences[first_sequence:]
+            sequence_sets.append(sequences)
+            first_sequences.append(first_sequence)
+            kinds.append(kind)
+
+        try:
+            forecasts = await forecast_sequences(sequence_sets, steps, options.dual_lstm_version)
+            error = None
+        except WorkCancelled:
+            raise
+        except Exception as e:
+            log(f"dual_lstm_analysis failed for bulk of {len(items)} recording(s): {e}", MODULE, level="ERROR")
+            forecasts, error = [None] * len(items), str(e)
+        compute_ms = (time.perf_counter() - stage_started) * 1000
+
+        for item, predictions, first_sequence, kind in zip(items, forecasts, first_sequences, kinds):
+            if predictions is None:
+                reason = error or ("LSTM requires windowed data" if kind is None
+                                   else "No valid sequences for LSTM processing")
+                item.stages.append(self._stage(item, "dual_lstm_analysis", stage_started, started, compute_ms,
+                                               error=reason))
+                continue
+            for prediction in predictions:
+                prediction["window_index"] += first_sequence
+            item.outputs["dual_lstm_analysis"] = await save_dual_lstm_result(
+                inference_id=str(uuid.uuid4()),
+                batch_id=item.batch_id,
+                input_data=f"batch_of_{len(predictions)}_sequences",
+                predictions=predictions,
+                metadata={
+                    "batch_size": len(predictions),
+                    "steps_predicted": steps,
+                    "sequence_length": SEQUENCE_LENGTH,
+                    "sequence_type": kind,
+                    "degradation_tier": tier.level
+                },
+                model_version=predictions[0]["metadata"]["model_info"]["version"]
+            )
+            item.stages.append(self._stage(item, "dual_lstm_analysis", stage_started, started, compute_ms,
+                                           windows=len(predictions)))
+
+    def _stage(self, item: _Recording, stage: str, stage_started: float, started: float, compute_ms: float,
+               windows: Optional[int] = None, error: Optional[str] = None) -> PipelineStageResult:
+        """Время этапа — общее для всей пачки: записи обрабатываются вместе"""
+        return PipelineStageResult(
+            stage=stage,
+            status="failed" if error else "completed",
+            execution_time_ms=compute_ms,
+            batch_id=item.batch_id,
+            windows_processed=windows,
+            success=error is None,
+            error_message=error,
+            started_at_ms=round((stage_started - started) * 1000, 1),
+            compute_time_ms=round(compute_ms, 1)
+        )
+
+    def _result(self, item: _Recording, options: BulkAnalysisInput, tier, start_time: datetime, total_ms: float,
+                bulk_id: str, queue_wait_ms: float) -> PipelineResult:
+        return PipelineResult(
+            pipeline_id=bulk_id,
+            user_id=options.user_id,
+            batch_id=item.batch_id,
+            timestamp=start_time.isoformat(),
+            total_execution_time_ms=total_ms,
+            stages=item.stages,
+            overall_status=_overall_status([stage.dict() for stage in item.stages]),
+            data_summary={
+                "data_length": len(item.phases[0]),
+                "phases": ["R", "S", "T"],
+                "use_windowing": options.use_windowing,
+                "window_size": options.window_size if options.use_windowing else None,
+                "batch_id": item.batch_id,
+                "bulk_id": bulk_id,
+                "queue_wait_ms": round(queue_wait_ms, 1),
+                "degradation_tier": tier.level
+            },
+            degradation=tier.to_dict()
+        )
+
+    async def _checkpoint(self, items: List[_Recording], results: List[PipelineResult], options: BulkAnalysisInput):
+        """Контрольные точки батчей, как у одиночного запуска: по ним работает /pipeline/rerun"""
+        run_config = options.dict(include=set(RUN_CONFIG_FIELDS))
+        for item, result in zip(items, results):
+            stages = [
+                {**stage.dict(), "pipeline_id": result.pipeline_id, "output_id": item.outputs.get(stage.stage),
+                 "degradation_tier": result.data_summary["degradation_tier"]}
+                for stage in item.stages
+            ]
+            try:
+                await batch_storage.save_checkpoint(
+                    item.batch_id, options.user_id, result.overall_status, stages, run_config,
+                    result.data_summary, result.total_execution_time_ms
+                )
+            except Exception as e:
+                log(f"Checkpoint for batch {item.batch_id} not saved: {e}", MODULE, level="WARN")
+
+
+bulk_analyzer = BulkAnalyzer()
+
+
+def _phases_from_array(name: str, array: np.ndarray) -> Phases:
+    """Запись из .npz: массив (n, 3) или (3, n) в порядке R, S, T"""
+    if array.ndim != 2 or 3 not in array.shape:
+        raise ValueError(f"Recording {name} must be an (n, 3) or (3, n) array, got {array.shape}")
+    array = np.asarray(array, dtype=np.float64)
+    if array.shape[1] == 3:
+        array = array.T
+    return array[0], array[1], array[2]
+
+
+async def _run(request: Request, timeout_ms: Optional[float], options: BulkAnalysisInput,
+               recordings: List[Tuple[Optional[str], Phases]]) -> BulkAnalysisResult:
+    try:
+        return await run_with_deadline(
+            request, from_headers(request.headers, timeout_ms), bulk_analyzer.analyze(options, recordings)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PipelineOverloaded as e:
+        log(f"Pipeline overloaded, bulk request rejected: {e}", MODULE, level="WARN")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after_s)})
+    except WorkCancelled as e:
+        raise cancelled_response(e)
+    except Exception as e:
+        log(f"Bulk analysis failed: {e}", MODULE, level="ERROR")
+        raise HTTPException(status_code=500, detail=f"Bulk analysis failed: {str(e)}")
+
+
+@router.post("", response_model=BulkAnalysisResult)
+async def run_bulk_analysis(data: BulkAnalysisInput, request: Request,
+                            timeout_ms: Optional[float] = Query(None, gt=0)):
+    """Анализ многих записей одним запросом (JSON); у каждой записи свой batch_id"""
+    recordings = [
+        (recording.batch_id, (np.asarray(recording.current_R), np.asarray(recording.current_S),
+                              np.asarray(recording.current_T)))
+        for recording in data.recordings
+    ]
+    return await _run(request, timeout_ms, data, recordings)
+
+
+@router.post("/npz", response_model=BulkAnalysisResult)
+async def run_bulk_analysis_npz(
+    request: Request,
+    file: UploadFile = File(..., description=".npz: массив (n, 3) на запись, имя массива — batch_id"),
+    user_id: str = Form("anonymous"),
+    use_windowing: bool = Form(True),
+    window_size: int = Form(16384, gt=0),
+    dual_lstm_steps: int = Form(5),
+    autoencoder_version: Optional[str] = Form(None),
+    dual_lstm_version: Optional[str] = Form(None),
+    explain: bool = Form(False),
+    timeout_ms: Optional[float] = Form(None, gt=0)
+):
+    """Анализ многих записей одним бинарным файлом без разбора JSON-чисел"""
+    options = BulkAnalysisInput(user_id=user_id, use_windowing=use_windowing, window_size=window_size,
+                                dual_lstm_steps=dual_lstm_steps, autoencoder_version=autoencoder_version,
+                                dual_lstm_version=dual_lstm_version, explain=explain)
+    try:
+        content = await file.read()
+        with np.load(io.BytesIO(content), allow_pickle=False) as archive:
+            recordings = [(name, _phases_from_array(name, archive[name])) for name in archive.files]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid .npz upload: {e}")
+    return await _run(request, timeout_ms, options, recordings)
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import numpy as np
-from models.dual_lstm_model import predictor
+from models.dual_lstm_model import build_dual_lstm_predictor, predictor_slot
+from models.model_registry import model_registry
+from models.preload import get_model_states
 from database.dual_lstm_storage import get_batch_results, get_inference_result, save_inference_result
 import uuid
 
@@ -13,6 +15,7 @@ class PredictionRequest(BaseModel):
     data: List[List[float]] = Field(..., description="Input sequence data (10 x 119 features)")
     n_steps: int = Field(default=5, ge=1, le=50, description="Number of prediction steps")
     batch_id: str = Field(..., description="Unique ID for the input batch")
+    model_version: Optional[str] = Field(default=None, description="Model version (artifact prefix), defaults to the current one")
 
     class Config:
         schema_extra = {
@@ -58,7 +61,9 @@ async def predict_multistep(request: PredictionRequest):
         input_data = validate_input_data(request.data)
         
         
-        result = predictor.predict_multistep(input_data, request.n_steps)
+        async with model_registry.acquire_async("dual_lstm", request.model_version) as predictor:
+            result = await predictor.predict_multistep_async(input_data, request.n_steps)
+            model_version = predictor.model_prefix
         
         
         inference_id = str(uuid.uuid4())
@@ -69,7 +74,8 @@ async def predict_multistep(request: PredictionRequest):
             batch_id=request.batch_id,
             input_data=request.data,
             predictions=result["predictions"],
-            metadata=result["metadata"]
+            metadata=result["metadata"],
+            model_version=model_version
         )
         
         return PredictionResponse(
@@ -85,32 +91,32 @@ async def predict_multistep(request: PredictionRequest):
 
 @router.get("/health")
 async def health_check():
-    """Проверка состояния модели"""
-    try:
-        if predictor.model is None:
-            predictor.load_model()
-        
-        return {
-            "status": "healthy",
-            "model_loaded": predictor.model is not None,
-            "scaler_loaded": predictor.scaler is not None,
-            "parameters": int(predictor.model.count_params()) if predictor.model else 0
-        }
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "error": str(e)
-        }
+    """Проверка состояния модели (без загрузки, только текущее состояние в памяти)"""
+    state = get_model_states().get("dual_lstm", {"state": "not_preloaded"})
+    predictor = predictor_slot.current
+    model_loaded = predictor.model is not None
+    
+    return {
+        "status": "healthy" if model_loaded else "unhealthy",
+        "load_state": state["state"],
+        "error": state.get("error"),
+        "model_loaded": model_loaded,
+        "scaler_loaded": predictor.scaler is not None,
+        "parameters": int(predictor.model.count_params()) if model_loaded else 0,
+        "slot": predictor_slot.status()
+    }
 
 
 @router.post("/reload")
 async def reload_model():
-    """Перезагрузка модели из S3"""
+    """Перезагрузка модели из S3: новая модель собирается в фоне, текущая обслуживает запросы до подмены"""
     try:
-        predictor.load_model()
+        reload_info = await predictor_slot.reload(build_dual_lstm_predictor)
         return {
             "status": "reloaded",
-            "parameters": int(predictor.model.count_params()),
+            "parameters": int(predictor_slot.current.model.count_params()),
+            "generation": reload_info["generation"],
+            "build_time_ms": reload_info["build_time_ms"],
             "message": "Model successfully reloaded from S3"
         }
     except Exception as e:
@@ -1,14 +1,18 @@
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Form
 from fastapi.responses import Response
 from models.motor_features import MotorDefectFeatures
 from database.feature_storage import FeatureStorage
+from database.window_cache import FEATURE_EXTRACTOR_VERSION, window_cache, window_key
+from models.feature_schema import FEATURE_SCHEMA, FeatureMatrix
+from utils.deadline import WorkCancelled, check, check_windows, from_headers, run_with_deadline
+from utils.profiling import to_thread
 
 import pandas as pd
 import numpy as np
 import json
 import io
-from typing import Dict, Any, Union, Tuple
+from typing import Dict, Any, Optional, Union, Tuple
 
 def parse_input_data(data: Union[str, bytes, dict], content_type: str) -> pd.DataFrame:
     if content_type == "application/json":
@@ -58,32 +62,52 @@ def format_output(features: Dict[str, Any], output_format: str) -> Union[Dict, s
     else:
         raise ValueError(f"Unsupported output format: {output_format}")
 
-def create_windowed_features(current_a, current_b, current_c, extractor, window_size=16384, overlap_ratio=0.75):
+def window_starts(data_length, window_size=16384, overlap_ratio=0.75):
     step_size = int(window_size * (1 - overlap_ratio))
-    all_features = []
+    return range(0, data_length - window_size + 1, step_size)
+
+def window_feature_keys(current_a, current_b, current_c, window_size=16384, overlap_ratio=0.75):
+    """Ключи кэша признаков по сырым отсчётам каждого окна"""
+    salt = f"features:{FEATURE_EXTRACTOR_VERSION}:{FEATURE_SCHEMA.version}:{window_size}"
+    return [
+        window_key(current_a[start:start + window_size], current_b[start:start + window_size],
+                   current_c[start:start + window_size], salt=salt)
+        for start in window_starts(len(current_a), window_size, overlap_ratio)
+    ]
+
+def create_windowed_features(current_a, current_b, current_c, extractor, window_size=16384, overlap_ratio=0.75,
+                             cache_keys=None) -> FeatureMatrix:
+    """Матрица признаков (окна × 119); словарь групп экстрактора сразу сворачивается в строку"""
+    rows = []
+    windows_metadata = []
+    starts = window_starts(len(current_a), window_size, overlap_ratio)
     
-    for window_idx, start_idx in enumerate(range(0, len(current_a) - window_size + 1, step_size)):
+    for window_idx, start_idx in enumerate(starts):
+        # запрос, который больше не ждут, не досчитывает оставшиеся окна
+        check_windows("feature_extraction", len(starts) - window_idx)
         end_idx = start_idx + window_size
         
-        feature_groups = extractor.extract_all_features(
-            current_a[start_idx:end_idx],
-            current_b[start_idx:end_idx],
-            current_c[start_idx:end_idx]
-        )
-        
-        
-        window_result = {
-            **feature_groups,  
-            'window_metadata': {  
-                'window_index': window_idx,
-                'window_start_sample': start_idx,
-                'window_end_sample': end_idx
-            }
-        }
+        key = cache_keys[window_idx] if cache_keys is not None else None
+        cached = window_cache.get("features", key) if key is not None else None
+        if cached is not None:
+            row = np.frombuffer(cached, dtype=np.float32)
+        else:
+            row = FEATURE_SCHEMA.row(extractor.extract_all_features(
+                current_a[start_idx:end_idx],
+                current_b[start_idx:end_idx],
+                current_c[start_idx:end_idx]
+            ))
+            if key is not None and row is not None:
+                window_cache.put("features", key, row.tobytes())
         
-        all_features.append(window_result)
+        rows.append(row)
+        windows_metadata.append({
+            'window_index': window_idx,
+            'window_start_sample': start_idx,
+            'window_end_sample': end_idx
+        })
     
-    return all_features
+    return FeatureMatrix.from_rows(rows, windows_metadata)
 
 
 router = APIRouter(prefix="/features", tags=["Motor Features"])
@@ -93,24 +117,21 @@ class FeatureExtractionService:
         self.extractor = MotorDefectFeatures()
         self.storage = FeatureStorage()
     
-    async def process_data(self, content, content_type, use_windowing, window_size):
-        df = parse_input_data(content, content_type)
-        current_a, current_b, current_c = extract_phase_data(df)
-        
-        if use_windowing:
-            features_list = create_windowed_features(current_a, current_b, current_c, self.extractor, window_size)
-            return {"windows": features_list, "total_windows": len(features_list)}
-        return self.extractor.extract_all_features(current_a, current_b, current_c)
+    def _extract(self, content, content_type, use_windowing, window_size):
+        """Разбор входа и расчёт признаков — CPU-работа, выполняется вне event loop"""
+        phases = extract_phase_data(parse_input_data(content, content_type))
+        return self._compute(phases, content_type, use_windowing, window_size)
     
-    async def process_and_save(self, content, content_type, use_windowing, window_size, user_id: str, batch_id: str = None):
-        df = parse_input_data(content, content_type)
-        current_a, current_b, current_c = extract_phase_data(df)
+    def _compute(self, phases, content_type, use_windowing, window_size, cache_keys=None):
+        current_a, current_b, current_c = phases
         
         if use_windowing:
-            features_list = create_windowed_features(current_a, current_b, current_c, self.extractor, window_size)
-            result = {"windows": features_list, "total_windows": len(features_list)}
+            result = create_windowed_features(current_a, current_b, current_c, self.extractor, window_size,
+                                              cache_keys=cache_keys)
         else:
-            result = self.extractor.extract_all_features(current_a, current_b, current_c)
+            result = FeatureMatrix.from_rows([FEATURE_SCHEMA.row(self.extractor.extract_all_features(
+                current_a, current_b, current_c
+            ))])
         
         metadata = {
             "use_windowing": use_windowing,
@@ -118,12 +139,36 @@ class FeatureExtractionService:
             "data_length": len(current_a),
             "content_type": content_type
         }
+        return result, metadata
+    
+    async def process_data(self, content, content_type, use_windowing, window_size):
+        result, _ = await self.extract(content, content_type, use_windowing, window_size)
+        return result.to_dicts()
+    
+    async def extract(self, content, content_type, use_windowing, window_size):
+        """
+        FeatureMatrix и метаданные без сохранения; запись — через storage.save_features.
+        Окна, уже посчитанные для тех же отсчётов, берутся из кэша окон.
+        """
+        if not (use_windowing and window_cache.enabled):
+            return await to_thread(self._extract, content, content_type, use_windowing, window_size)
+        
+        phases = await to_thread(lambda: extract_phase_data(parse_input_data(content, content_type)))
+        cache_keys = await to_thread(window_feature_keys, *phases, window_size)
+        await window_cache.prefetch("features", cache_keys)
+        result = await to_thread(self._compute, phases, content_type, use_windowing, window_size, cache_keys)
+        await window_cache.persist_pending()
+        return result
+    
+    async def process_and_save(self, content, content_type, use_windowing, window_size, user_id: str, batch_id: str = None):
+        result, metadata = await self.extract(content, content_type, use_windowing, window_size)
+        check("feature_extraction")
         
         extraction_id = await self.storage.save_features(user_id, result, metadata, batch_id)
         
         return {
             "extraction_id": extraction_id,
-            "features": result,
+            "features": result.to_dicts(),
             "metadata": metadata
         }
     
@@ -135,20 +180,25 @@ class FeatureExtractionService:
 
 @router.post("/extract")
 async def extract_features(
+    request: Request,
     file: UploadFile = File(None),
     raw_data: str = Form(None),
     output_format: str = Form("json"),
     use_windowing: bool = Form(False),
-    window_size: int = Form(16384),
+    window_size: int = Form(16384, gt=0),
     user_id: str = Form("anonymous"),
-    save_results: bool = Form(True)
+    save_results: bool = Form(True),
+    timeout_ms: Optional[float] = Form(None, gt=0)
 ):
     try:
         content, content_type = await _resolve_input(file, raw_data)
         service = FeatureExtractionService()
+        deadline = from_headers(request.headers, timeout_ms)
         
         if save_results:
-            result = await service.process_and_save(content, content_type, use_windowing, window_size, user_id)
+            result = await run_with_deadline(
+                request, deadline, service.process_and_save(content, content_type, use_windowing, window_size, user_id)
+            )
             response_data = {
                 "extraction_id": result["extraction_id"],
                 "metadata": result["metadata"],
@@ -156,9 +206,13 @@ async def extract_features(
             }
             return _format_response(response_data, output_format)
         else:
-            features = await service.process_data(content, content_type, use_windowing, window_size)
+            features = await run_with_deadline(
+                request, deadline, service.process_data(content, content_type, use_windowing, window_size)
+            )
             return _format_response(features, output_format)
         
+    except WorkCancelled as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -213,86 +267,9 @@ async def get_batch_features(batch_id: str):
 @router.get("/schema")
 async def get_features_schema():
     """Возвращает полную схему всех признаков для dashboard visualization"""
-    
-    
-    feature_schema = {
-        "total_features": 119,  
-        "categories": {
-            "common": {
-                "description": "Basic statistical features",
-                "features": [
-                    "rms_A", "mean_A", "std_A", "rms_B", "mean_B", "std_B", 
-                    "rms_C", "mean_C", "std_C", "total_imbalance", "rms_imbalance",
-                    "imbalance_ab", "imbalance_bc", "imbalance_ca", 
-                    "park_ellipticity", "park_mag_mean", "park_mag_std"
-                ]
-            },
-            "rotor": {
-                "description": "Rotor fault indicators",
-                "features": [
-                    "rotor_sb1_lower_ratio_A", "rotor_sb1_upper_ratio_A", "rotor_sb2_lower_ratio_A",
-                    "rotor_sb1_lower_amp_A", "rotor_sb1_upper_amp_A", "rotor_sb1_lower_ratio_B",
-                    "rotor_sb1_upper_ratio_B", "rotor_sb1_upper_ratio_C", "rotor_sb1_lower_ratio_combined",
-                    "rotor_stft_ratio_A", "rotor_stft_main_energy_A", "rotor_stft_sb1_energy_A",
-                    "rotor_stft_energy_var_A", "rotor_stft_ratio_B", "rotor_stft_ratio_C"
-                ]
-            },
-            "stator": {
-                "description": "Stator winding analysis",
-                "features": [
-                    "k2_asymmetry", "thd_A", "thd_B", "thd_C",
-                    "h3_ratio_A", "h5_ratio_A", "h7_ratio_A", "h3_ratio_B", "h5_ratio_B", "h7_ratio_B",
-                    "h3_ratio_C", "h5_ratio_C", "h7_ratio_C", "phase_deviation_ab", "phase_deviation_bc", "phase_deviation_ca",
-                    "modulation_coeff_A", "modulation_coeff_B", "modulation_coeff_C",
-                    "rel_energy_low_band_A", "rel_energy_medium_band_A", "rel_energy_high_band_A",
-                    "rel_energy_low_band_B", "rel_energy_medium_band_B", "rel_energy_high_band_B",
-                    "rel_energy_low_band_C", "rel_energy_medium_band_C", "rel_energy_high_band_C"
-                ]
-            },
-            "bearing": {
-                "description": "Bearing fault detection",
-                "features": [
-                    "bearing_bpfo_amp_A", "bearing_bpfi_amp_A", "bearing_bpfo_amp_B", "bearing_bpfi_amp_B",
-                    "bearing_bpfo_amp_C", "bearing_bpfi_amp_C", "bearing_bsf_amp_A", "bearing_ftf_amp_A",
-                    "bearing_bpfo_2h_amp_A", "bearing_bpfi_2h_amp_A", "bearing_bpfo_band_rms_A", "bearing_bpfi_band_rms_A",
-                    "bearing_env_kurtosis_A", "bearing_env_rms_A", "bearing_env_peak_factor_A", 
-                    "bearing_env_bpfo_A", "bearing_env_bpfi_A", "bearing_hf_energy_A", "bearing_crest_factor_A",
-                    "bearing_env_kurtosis_B", "bearing_env_rms_B", "bearing_env_peak_factor_B", 
-                    "bearing_hf_energy_B", "bearing_crest_factor_B", "bearing_env_kurtosis_C",
-                    "bearing_env_rms_C", "bearing_env_peak_factor_C", "bearing_hf_energy_C",
-                    "bearing_env_kurtosis_max", "bearing_hf_energy_max"
-                ]
-            },
-            "eccentricity": {
-                "description": "Rotor eccentricity analysis", 
-                "features": [
-                    "ecc_current_asymmetry", "ecc_max_deviation", "ecc_rms_variance", "ecc_max_min_ratio",
-                    "ecc_corr_ab", "ecc_corr_bc", "ecc_corr_ca", "ecc_mean_correlation", "ecc_correlation_variance", "ecc_min_correlation",
-                    "ecc_main_1_lower_amp_A", "ecc_main_1_lower_ratio_A", "ecc_main_1_upper_amp_A", "ecc_main_1_upper_ratio_A",
-                    "ecc_main_1_lower_amp_B", "ecc_main_1_upper_amp_B", "ecc_main_1_lower_amp_C", "ecc_main_1_upper_amp_C",
-                    "ecc_main_2_lower_ratio_A", "ecc_rotor_freq_modulation_A", "ecc_2rotor_freq_modulation_A", "ecc_envelope_modulation_A",
-                    "ecc_rotor_freq_modulation_B", "ecc_envelope_modulation_B", "ecc_rotor_freq_modulation_C",
-                    "ecc_harmonic_ratio_A", "ecc_total_harmonic_energy_A", "ecc_harmonic_ratio_B", "ecc_harmonic_ratio_C"
-                ]
-            }
-        }
-    }
-    
-    
-    flat_mapping = {}
-    index = 0
-    
-    for category_name, category_data in feature_schema["categories"].items():
-        for feature_name in category_data["features"]:
-            flat_mapping[index] = feature_name
-            index += 1
-    
-    
-    feature_schema["total_features"] = len(flat_mapping)
-    
     return {
-        "schema_version": "1.0",
+        "schema_version": FEATURE_SCHEMA.version,
         "generated_at": datetime.utcnow().isoformat(),
-        "feature_mapping": flat_mapping,
-        "categorized_schema": feature_schema
-    }
\ No newline at end of file
+        "feature_mapping": dict(enumerate(FEATURE_SCHEMA.names)),
+        "categorized_schema": FEATURE_SCHEMA.describe()
+    }
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import numpy as np
-from models.hybrid_model import predictor
+from models.hybrid_model import build_hybrid_predictor, predictor_slot
+from models.model_registry import model_registry
+from models.preload import get_model_states
 from database.hybrid_storage import get_hybrid_batch_results, get_hybrid_inference_result, save_hybrid_inference_result
 import uuid
 
@@ -13,6 +15,8 @@ class HybridPredictionRequest(BaseModel):
     data: List[List[float]] = Field(..., description="Input sequence data (10 x 187 features)")
     n_steps: int = Field(default=5, ge=1, le=50, description="Number of prediction steps")
     batch_id: str = Field(..., description="Unique ID for the input batch")
+    model_version: Optional[str] = Field(default=None, description="Model version (artifact prefix), defaults to the current one")
+    include_attention: bool = Field(default=True, description="Return cross-attention weights per step")
 
     class Config:
         schema_extra = {
@@ -31,6 +35,20 @@ class HybridPredictionResponse(BaseModel):
     status: str
 
 
+class HybridBatchPredictionRequest(BaseModel):
+    sequences: List[List[List[float]]] = Field(..., description="Input sequences, each 10 x 187 features")
+    n_steps: int = Field(default=5, ge=1, le=50, description="Number of prediction steps")
+    batch_id: str = Field(..., description="Unique ID for the input batch")
+    model_version: Optional[str] = Field(default=None, description="Model version (artifact prefix), defaults to the current one")
+    include_attention: bool = Field(default=True, description="Return cross-attention weights per step")
+
+
+class HybridBatchPredictionResponse(BaseModel):
+    results: List[HybridPredictionResponse]
+    batch_id: str
+    count: int
+
+
 def validate_hybrid_input_data(data: List[List[float]]) -> np.ndarray:
     try:
         data_array = np.array(data)
@@ -51,7 +69,10 @@ def validate_hybrid_input_data(data: List[List[float]]) -> np.ndarray:
 async def predict_hybrid_multistep(request: HybridPredictionRequest):
     try:
         input_data = validate_hybrid_input_data(request.data)
-        result = predictor.predict_multistep(input_data, request.n_steps)
+        async with model_registry.acquire_async("hybrid_lstm", request.model_version) as predictor:
+            result = await predictor.predict_multistep_async(
+                input_data, request.n_steps, with_attention=request.include_attention
+            )
         inference_id = str(uuid.uuid4())
         
         await save_hybrid_inference_result(
@@ -73,35 +94,71 @@ async def predict_hybrid_multistep(request: HybridPredictionRequest):
         raise HTTPException(status_code=500, detail=f"Hybrid prediction failed: {str(e)}")
 
 
-@router.get("/health")
-async def hybrid_health_check():
+@router.post("/predict_batch", response_model=HybridBatchPredictionResponse)
+async def predict_hybrid_batch(request: HybridBatchPredictionRequest):
+    """Прогноз для набора последовательностей за n_steps проходов модели"""
+    if not request.sequences:
+        raise HTTPException(status_code=400, detail="No sequences provided")
+    sequences = np.stack([validate_hybrid_input_data(seq) for seq in request.sequences])
     try:
-        if predictor.model is None:
-            predictor.load_model()
+        async with model_registry.acquire_async("hybrid_lstm", request.model_version) as predictor:
+            results = await predictor.predict_multistep_batch_async(
+                sequences, request.n_steps, with_attention=request.include_attention
+            )
+        
+        responses = []
+        for seq, result in zip(request.sequences, results):
+            inference_id = str(uuid.uuid4())
+            await save_hybrid_inference_result(
+                inference_id=inference_id,
+                batch_id=request.batch_id,
+                input_data=seq,
+                predictions=result["predictions"],
+                metadata=result["metadata"]
+            )
+            responses.append(HybridPredictionResponse(
+                predictions=result["predictions"],
+                inference_id=inference_id,
+                batch_id=request.batch_id,
+                status="success"
+            ))
+        
+        return HybridBatchPredictionResponse(results=responses, batch_id=request.batch_id, count=len(responses))
         
-        return {
-            "status": "healthy",
-            "model_loaded": predictor.model is not None,
-            "attention_model_loaded": predictor.attention_model is not None,
-            "scalers_loaded": predictor.scaler_enhanced is not None and predictor.scaler_original is not None,
-            "parameters": int(predictor.model.count_params()) if predictor.model else 0,
-            "energy_features": len(predictor.energy_features) if predictor.energy_features else 0
-        }
     except Exception as e:
-        return {
-            "status": "unhealthy",
-            "error": str(e)
-        }
+        raise HTTPException(status_code=500, detail=f"Hybrid batch prediction failed: {str(e)}")
+
+
+@router.get("/health")
+async def hybrid_health_check():
+    state = get_model_states().get("hybrid_lstm", {"state": "not_preloaded"})
+    predictor = predictor_slot.current
+    model_loaded = predictor.model is not None
+    
+    return {
+        "status": "healthy" if model_loaded else "unhealthy",
+        "load_state": state["state"],
+        "error": state.get("error"),
+        "model_loaded": model_loaded,
+        "attention_model_loaded": predictor.serving_model is not None,
+        "scalers_loaded": predictor.scaler_enhanced is not None and predictor.scaler_original is not None,
+        "parameters": int(predictor.model.count_params()) if model_loaded else 0,
+        "energy_features": len(predictor.energy_features) if predictor.energy_features else 0,
+        "slot": predictor_slot.status()
+    }
 
 
 @router.post("/reload")
 async def reload_hybrid_model():
     try:
-        predictor.load_model()
+        reload_info = await predictor_slot.reload(build_hybrid_predictor)
+        predictor = predictor_slot.current
         return {
             "status": "reloaded",
             "parameters": int(predictor.model.count_params()),
             "energy_features": len(predictor.energy_features),
+            "generation": reload_info["generation"],
+            "build_time_ms": reload_info["build_time_ms"],
             "message": "Hybrid model successfully reloaded from S3"
         }
     except Exception as e:
@@ -0,0 +1,52 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException
+from datetime import datetime
+
+from database.artifact_cache import artifact_cache
+from database.window_cache import window_cache
+from models.inference_batcher import get_batching_stats
+from models.model_registry import model_registry
+
+router = APIRouter(prefix="/inference", tags=["Inference"])
+
+
+@router.get("/batching")
+async def get_inference_batching_stats():
+    """Гистограммы размера батча и ожидания в очереди для каждого батчера моделей"""
+    return {
+        "batchers": get_batching_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@router.get("/artifacts")
+async def get_artifact_cache_stats():
+    """Содержимое и попадания локального кэша артефактов моделей"""
+    return artifact_cache.stats()
+
+
+@router.get("/window-cache")
+async def get_window_cache_stats():
+    """Заполнение кэша окон и попадания по пространствам имён"""
+    return window_cache.stats()
+
+
+@router.get("/models")
+async def get_model_registry_stats():
+    """Загруженные версии моделей, занятая память и время загрузки"""
+    return model_registry.stats()
+
+
+@router.get("/models/{model_type}/versions")
+async def list_model_versions(model_type: str):
+    """Версии модели, доступные в бакете моделей"""
+    try:
+        versions = await asyncio.to_thread(model_registry.list_versions, model_type)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {
+        "model_type": model_type,
+        "default": model_registry.resolve_version(model_type),
+        "versions": versions
+    }
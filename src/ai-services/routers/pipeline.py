@@ -1,23 +1,60 @@
 
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
 import numpy as np
-import json
+import os
+import time
 from datetime import datetime
 import uuid
 
 from routers.features import FeatureExtractionService
-from models.autoencoder_model import run_autoencoder_batch_inference, AutoencoderBatchInferenceInput
-from models.dual_lstm_model import predictor as dual_lstm_predictor
+from models.feature_schema import FeatureMatrix
+from models.autoencoder_model import run_autoencoder_batch_inference_async, AutoencoderBatchInferenceInput
+from models.dual_lstm_model import window_sequences  # импорт регистрирует dual_lstm в реестре
+from models.model_registry import model_registry
 from database.autoencoder_storage import save_batch_result as save_autoencoder_batch
+from database.autoencoder_storage import delete_superseded as delete_superseded_autoencoder
+from database.batch_storage import batch_storage
 from database.dual_lstm_storage import save_inference_result as save_dual_lstm_result
+from database.dual_lstm_storage import delete_superseded as delete_superseded_dual_lstm
+from database.feature_storage import feature_storage
+from database.profile_storage import get_pipeline_profile, save_pipeline_profile
+from database.write_behind import write_behind
+from models.preload import get_model_states, is_model_ready
 from utils.logger import log
+from utils.metrics import MS_BUCKETS, CallbackMetric, Counter, Gauge, Histogram, LabeledHistogram
+from utils.profiling import RunProfiler, section
+from utils.degradation import TIERS, DegradationTier, PipelineOverloaded, degradation_policy
+from utils.fair_scheduler import PRIORITY_CLASSES, QUEUE_WAIT_MS_BUCKETS, FairScheduler
+from utils.deadline import WorkCancelled, check, ensure_feasible, from_headers, run_with_deadline
 
 MODULE = 'pipeline'
 router = APIRouter(prefix="/pipeline", tags=["Full Pipeline"])
 
+PIPELINE_MAX_CONCURRENCY = int(os.getenv("PIPELINE_MAX_CONCURRENCY", 2))
+
+# Параметры запуска, которые сохраняются в контрольной точке батча для перезапуска этапов
+RUN_CONFIG_FIELDS = ("user_id", "use_windowing", "window_size", "dual_lstm_steps",
+                     "autoencoder_version", "dual_lstm_version", "explain")
+# Этапы, которые можно перезапустить из сохранённых признаков, и очистка их прежних результатов
+RERUNNABLE_STAGES = {
+    "autoencoder_analysis": delete_superseded_autoencoder,
+    "dual_lstm_analysis": delete_superseded_dual_lstm,
+}
+
+STAGE_MS = LabeledHistogram(
+    "pipeline_stage_ms", "Длительность этапа пайплайна по фазам, мс", MS_BUCKETS, ("stage", "phase", "status")
+)
+STAGE_WINDOWS = Counter(
+    "pipeline_stage_windows_total", "Окон, обработанных этапом (rate() — окна в секунду)", ("stage",)
+)
+STAGE_WINDOWS_PER_SECOND = Gauge(
+    "pipeline_stage_windows_per_second", "Пропускная способность последнего запуска этапа, окон/с", ("stage",)
+)
+
 class MotorDataInput(BaseModel):
     current_R: List[float] = Field(..., description="Ток фазы R")
     current_S: List[float] = Field(..., description="Ток фазы S") 
@@ -25,8 +62,13 @@ class MotorDataInput(BaseModel):
     user_id: str = Field(default="anonymous", description="ID пользователя")
     batch_id: Optional[str] = Field(default=None, description="ID батча")
     use_windowing: bool = Field(default=True, description="Использовать оконную обработку")
-    window_size: int = Field(default=16384, description="Размер окна")
+    window_size: int = Field(default=16384, gt=0, description="Размер окна")
     dual_lstm_steps: int = Field(default=5, description="Количество шагов прогноза LSTM")
+    autoencoder_version: Optional[str] = Field(default=None, description="Версия автоэнкодера, по умолчанию — текущая")
+    dual_lstm_version: Optional[str] = Field(default=None, description="Версия Dual LSTM, по умолчанию — текущая")
+    explain: bool = Field(default=False, description="Сохранять латенты и attention для каждого окна")
+    profile: bool = Field(default=False, description="Выполнить под профилировщиком и вернуть разбивку времени")
+    profile_stacks: bool = Field(default=False, description="Добавить к профилю свёрнутые стеки для flame graph")
 
 class PipelineStageResult(BaseModel):
     stage: str
@@ -36,6 +78,9 @@ class PipelineStageResult(BaseModel):
     windows_processed: Optional[int] = None
     success: bool
     error_message: Optional[str] = None
+    started_at_ms: Optional[float] = None
+    compute_time_ms: Optional[float] = None
+    persist_time_ms: Optional[float] = None
 
 class PipelineResult(BaseModel):
     pipeline_id: str
@@ -46,48 +91,163 @@ class PipelineResult(BaseModel):
     stages: List[PipelineStageResult]
     overall_status: str
     data_summary: Dict[str, Any]
+    profile: Optional[Dict[str, Any]] = None
+    degradation: Optional[Dict[str, Any]] = None
+    persist_pending: bool = Field(default=False, description="Результаты ещё не подтверждены записью в Mongo")
+
+class StageRerunRequest(BaseModel):
+    stages: Optional[List[str]] = Field(default=None, description="Этапы для перезапуска, по умолчанию — упавшие и недошедшие")
+    autoencoder_version: Optional[str] = Field(default=None, description="Версия автоэнкодера, по умолчанию — из исходного запуска")
+    dual_lstm_version: Optional[str] = Field(default=None, description="Версия Dual LSTM, по умолчанию — из исходного запуска")
+    dual_lstm_steps: Optional[int] = Field(default=None, description="Количество шагов прогноза LSTM")
+    explain: Optional[bool] = Field(default=None, description="Сохранять латенты и attention для каждого окна")
+
+class PipelineRun:
+    """Состояние одного запуска пайплайна: этапы читают признаки отсюда, а не из общего процессора"""
+    
+    def __init__(self, data: MotorDataInput):
+        self.data = data
+        self.pipeline_id = str(uuid.uuid4())
+        self.batch_id = data.batch_id or f"batch_{data.user_id}_{int(datetime.now().timestamp())}"
+        self.features: Optional[FeatureMatrix] = None
+        self.queue_wait_ms: float = 0.0
+        self.started: float = 0.0
+        self.running_stages: Set[str] = set()
+        self.stages: List[PipelineStageResult] = []
+        self.tier: DegradationTier = TIERS[0]
+        self.priority: str = PRIORITY_CLASSES[0]
+        # Перезапуск: только эти этапы, признаки уже в features, прежние контрольные точки — в checkpoints
+        self.rerun: Optional[List[str]] = None
+        self.checkpoints: Dict[str, Dict[str, Any]] = {}
+        self.previous: Dict[str, Any] = {}
+
+
+class PipelineStage:
+    """
+    Узел графа пайплайна. compute(run) возвращает (windows_processed, persist),
+    где persist — корутина записи результата или None.
+    """
+    
+    def __init__(self, name: str, compute: Callable[[PipelineRun], Awaitable[Tuple[int, Optional[Awaitable]]]],
+                 depends_on: List[str]):
+        self.name = name
+        self.compute = compute
+        self.depends_on = depends_on
+
 
 class PipelineProcessor:
     
-    def __init__(self):
+    def __init__(self, max_concurrency: int = PIPELINE_MAX_CONCURRENCY):
         self.feature_service = FeatureExtractionService()
+        self.max_concurrency = max(1, max_concurrency)
+        self.scheduler = FairScheduler(self.max_concurrency)
+        self.completed = 0
+        self.queue_wait_histogram = Histogram(
+            "pipeline_queue_wait_ms", "Ожидание свободного слота пайплайна, мс", QUEUE_WAIT_MS_BUCKETS
+        )
     
-    async def run_full_pipeline(self, data: MotorDataInput) -> PipelineResult:
-        """Выполняет полный пайплайн обработки данных двигателя"""
-        pipeline_id = str(uuid.uuid4())
-        batch_id = data.batch_id or f"batch_{data.user_id}_{int(datetime.now().timestamp())}"
-        start_time = datetime.now()
-        stages = []
-        
-        log(f"Pipeline started: {pipeline_id}, batch: {batch_id}, user: {data.user_id}", MODULE)
-        
-        data_summary = {
-            "data_length": len(data.current_R),
-            "phases": ["R", "S", "T"],
-            "use_windowing": data.use_windowing,
-            "window_size": data.window_size if data.use_windowing else None,
-            "batch_id": batch_id
+    @property
+    def waiting(self) -> int:
+        return self.scheduler.waiting
+    
+    @property
+    def running(self) -> int:
+        return self.scheduler.running
+    
+    async def run_full_pipeline(self, data: MotorDataInput, run: Optional[PipelineRun] = None,
+                                allow_reject: bool = True, priority: str = "interactive") -> PipelineResult:
+        """
+        Выполняет полный пайплайн; одновременно работает не больше max_concurrency запусков.
+        Слоты раздаёт FairScheduler: по классу priority (interactive — запросы
+        /analyze, jobs — задания /pipeline/jobs, streaming — потоки, backfill —
+        фоновый перерасчёт), внутри класса —
+        поровну между пользователями с учётом числа окон записи.
+        run можно передать снаружи, чтобы следить за этапами (задания /pipeline/jobs).
+        Объём работы урезается по уровню деградации; PipelineOverloaded — только
+        на последнем уровне и только при allow_reject (потоки и задания не отклоняются).
+        Под дедлайном запроса (utils.deadline) запуск, который уже не успеет, не занимает
+        слот, а истёкший или брошенный клиентом — останавливается между окнами и этапами.
+        """
+        run = run or PipelineRun(data)
+        run.priority = priority
+        run.tier = degradation_policy.select(self.waiting, self.max_concurrency, allow_reject)
+        if run.tier.reject:
+            raise PipelineOverloaded(degradation_policy.retry_after(self.waiting, self.max_concurrency))
+        if run.rerun is not None and "dual_lstm_analysis" in run.rerun and not run.tier.run_lstm:
+            # перезапуск LSTM не пропускается: самый глубокий уровень, на котором LSTM ещё идёт
+            run.tier = max((tier for tier in TIERS if tier.run_lstm), key=lambda tier: tier.level)
+        cost = max(1, len(data.current_R) // data.window_size) if data.use_windowing else 1
+        ensure_feasible("queue", degradation_policy.expected_ms(cost))
+        run.queue_wait_ms = await self.scheduler.acquire(priority, data.user_id, cost)
+        self.queue_wait_histogram.observe(run.queue_wait_ms)
+        try:
+            # за время в очереди дедлайн мог стать недостижимым
+            ensure_feasible("queue", degradation_policy.expected_ms(cost))
+            if data.profile:
+                return await self._execute_profiled(run)
+            return await self._execute(run)
+        finally:
+            self.completed += 1
+            self.scheduler.release(priority)
+    
+    def concurrency_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "completed": self.completed,
+            "queue_wait_ms": self.queue_wait_histogram.snapshot(),
+            "scheduler": self.scheduler.stats()
         }
+    
+    async def _execute(self, run: PipelineRun) -> PipelineResult:
+        data = run.data
+        pipeline_id, batch_id = run.pipeline_id, run.batch_id
+        start_time = datetime.now()
+        run.started = time.perf_counter()
         
-        features_result = await self._run_feature_extraction(data, batch_id)
-        stages.append(features_result)
+        log(f"Pipeline started: {pipeline_id}, batch: {batch_id}, user: {data.user_id}, "
+            f"class: {run.priority}, queued {run.queue_wait_ms:.0f}ms", MODULE)
         
-        autoencoder_result = None
-        if features_result.success:
-            autoencoder_result = await self._run_autoencoder_batch_analysis(features_result, data, batch_id)
-            stages.append(autoencoder_result)
+        if run.rerun is None:
+            data_summary = {
+                "data_length": len(data.current_R),
+                "phases": ["R", "S", "T"],
+                "use_windowing": data.use_windowing,
+                "window_size": data.window_size if data.use_windowing else None,
+                "batch_id": batch_id,
+                "priority_class": run.priority,
+                "queue_wait_ms": round(run.queue_wait_ms, 1)
+            }
+        else:
+            data_summary = {
+                "batch_id": batch_id,
+                "rerun_stages": run.rerun,
+                "windows": run.features.n_windows,
+                "priority_class": run.priority,
+                "queue_wait_ms": round(run.queue_wait_ms, 1)
+            }
         
-        dual_lstm_result = None
-        if features_result.success and (autoencoder_result is None or autoencoder_result.success):
-            dual_lstm_result = await self._run_dual_lstm_batch_analysis(features_result, data, batch_id)
-            stages.append(dual_lstm_result)
+        try:
+            await self._run_dag(run)
+        except WorkCancelled as e:
+            log(f"Pipeline {pipeline_id} cancelled ({e.reason}) during {e.stage}", MODULE, level="WARN")
+            # готовые этапы остаются в контрольной точке, недошедшие подберёт /pipeline/rerun
+            await self._checkpoint(run, "cancelled" if run.rerun is None else run.previous.get("status", "cancelled"))
+            raise
         
         end_time = datetime.now()
         total_time = (end_time - start_time).total_seconds() * 1000
+        stages = run.stages
+        
+        overall_status = _overall_status([s.dict() for s in stages])
         
-        overall_status = "success" if all(s.success for s in stages) else "partial_failure"
-        if not any(s.success for s in stages):
-            overall_status = "failure"
+        data_summary["critical_path_ms"] = round(total_time, 1)
+        data_summary["sum_of_stages_ms"] = round(sum(s.execution_time_ms for s in stages), 1)
+        data_summary["degradation_tier"] = run.tier.level
+        # объём запуска в окнах window_size, в том числе без оконной обработки
+        windows = max(len(data.current_R) // data.window_size, run.features.n_windows if run.features is not None else 1)
+        degradation_policy.observe(total_time, windows)
         
         result = PipelineResult(
             pipeline_id=pipeline_id,
@@ -97,352 +257,456 @@ class PipelineProcessor:
             total_execution_time_ms=total_time,
             stages=stages,
             overall_status=overall_status,
-            data_summary=data_summary
+            data_summary=data_summary,
+            degradation=run.tier.to_dict()
         )
+        await self._checkpoint(run, overall_status, result)
         
         log(f"Pipeline completed: {pipeline_id}, status: {overall_status}, time: {total_time:.0f}ms", MODULE)
         return result
     
-    async def _run_feature_extraction(self, data: MotorDataInput, batch_id: str) -> PipelineStageResult:
-        """Извлекает признаки из данных тока"""
-        stage_start = datetime.now()
+    async def _execute_profiled(self, run: PipelineRun) -> PipelineResult:
+        """Запуск под cProfile; профиль возвращается в результате и сохраняется рядом с батчем"""
+        profiler = RunProfiler(stacks=run.data.profile_stacks)
+        if not profiler.start():
+            log(f"Another profiled run is in progress, batch {run.batch_id} runs without profile", MODULE,
+                level="WARN")
+            result = await self._execute(run)
+            result.profile = {"skipped": "another profiled run is in progress"}
+            return result
         
         try:
-            log(f"Feature extraction started for batch: {batch_id}", MODULE)
-            
-            df_data = {
-                'current_R': data.current_R,
-                'current_S': data.current_S,
-                'current_T': data.current_T
-            }
-            content = json.dumps(df_data)
-            
-            result = await self.feature_service.process_and_save(
-                content=content,
-                content_type="application/json",
-                use_windowing=data.use_windowing,
-                window_size=data.window_size,
-                user_id=data.user_id,
-                batch_id=batch_id,
-            )
-            
-            self._features_data = result["features"]
-            windows_count = len(self._features_data.get("windows", [])) if data.use_windowing else 1
-            
-            stage_end = datetime.now()
-            execution_time = (stage_end - stage_start).total_seconds() * 1000
+            result = await self._execute(run)
+        finally:
+            profiler.stop()
+        
+        result.profile = profiler.report()
+        await save_pipeline_profile(run.batch_id, run.pipeline_id, result.profile)
+        log(f"Profile for batch {run.batch_id}: {result.profile['breakdown_ms']}", MODULE)
+        return result
+    
+    def _stage_graph(self, run: PipelineRun) -> List[PipelineStage]:
+        """Этапы и их входы; этапы без общей зависимости выполняются параллельно"""
+        graph = [
+            PipelineStage("feature_extraction", self._compute_features, []),
+            PipelineStage("autoencoder_analysis", self._compute_autoencoder, ["feature_extraction"]),
+        ]
+        if run.tier.run_lstm:
+            graph.append(PipelineStage("dual_lstm_analysis", self._compute_dual_lstm, ["feature_extraction"]))
+        if run.rerun is not None:
+            graph = [stage for stage in graph if stage.name in run.rerun]
+        return graph
+    
+    async def _run_dag(self, run: PipelineRun):
+        """
+        Запускает этапы по готовности входов. Этап считается готовым для зависимых,
+        как только посчитан; его запись в Mongo идёт параллельно со следующими
+        этапами, а в результат этап попадает после завершения записи.
+        Этапы с упавшей зависимостью не запускаются и в результат не входят.
+        Зависимость вне графа (перезапуск) уже посчитана в прежнем запуске.
+        После каждого этапа обновляется контрольная точка батча.
+        """
+        graph = self._stage_graph(run)
+        computed = {stage.name: asyncio.get_running_loop().create_future() for stage in graph}
+        results: Dict[str, Optional[PipelineStageResult]] = {}
+        
+        async def run_stage(stage: PipelineStage):
+            for dependency in stage.depends_on:
+                if dependency in computed and not await computed[dependency]:
+                    computed[stage.name].set_result(False)
+                    results[stage.name] = None
+                    run.checkpoints[stage.name] = {"stage": stage.name, "status": "skipped", "success": False,
+                                                   "pipeline_id": run.pipeline_id, "error_message": f"{dependency} failed"}
+                    await self._checkpoint(run)
+                    return
+            check(stage.name)
+            results[stage.name] = await self._run_stage(run, stage, computed[stage.name])
+            await self._checkpoint(run)
+        
+        tasks = [asyncio.create_task(run_stage(stage)) for stage in graph]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        run.stages[:] = [results[stage.name] for stage in graph if results.get(stage.name) is not None]
+    
+    async def _run_stage(self, run: PipelineRun, stage: PipelineStage,
+                         computed: asyncio.Future) -> PipelineStageResult:
+        """Вычисление этапа, сигнал зависимым, затем ожидание его записи; тайминги по частям"""
+        batch_id = run.batch_id
+        started = time.perf_counter()
+        run.running_stages.add(stage.name)
+        compute_ms = persist_ms = None
+        output_id = None
+        try:
+            windows_processed, persist = await stage.compute(run)
+            compute_ms = (time.perf_counter() - started) * 1000
+            computed.set_result(True)
+            STAGE_MS.labels(stage.name, "compute", "completed").observe(compute_ms)
+            STAGE_WINDOWS.labels(stage.name).inc(windows_processed)
+            if compute_ms > 0:
+                STAGE_WINDOWS_PER_SECOND.labels(stage.name).set(windows_processed * 1000 / compute_ms)
             
-            log(f"Feature extraction completed: {windows_count} windows, batch: {batch_id}", MODULE)
+            if persist is not None:
+                # результат, который никто не прочитает, не пишется
+                try:
+                    check(stage.name)
+                except WorkCancelled:
+                    persist.close()
+                    raise
+                persist_started = time.perf_counter()
+                with section("mongo_write"):
+                    output_id = await persist
+                persist_ms = (time.perf_counter() - persist_started) * 1000
+                STAGE_MS.labels(stage.name, "persist", "completed").observe(persist_ms)
             
-            return PipelineStageResult(
-                stage="feature_extraction",
+            execution_ms = (time.perf_counter() - started) * 1000
+            STAGE_MS.labels(stage.name, "total", "completed").observe(execution_ms)
+            result = PipelineStageResult(
+                stage=stage.name,
                 status="completed",
-                execution_time_ms=execution_time,
+                execution_time_ms=execution_ms,
                 batch_id=batch_id,
-                windows_processed=windows_count,
-                success=True
+                windows_processed=windows_processed,
+                success=True,
+                started_at_ms=round((started - run.started) * 1000, 1),
+                compute_time_ms=round(compute_ms, 1),
+                persist_time_ms=round(persist_ms, 1) if persist_ms is not None else None
             )
-            
+            run.checkpoints[stage.name] = {**result.dict(), "pipeline_id": run.pipeline_id, "output_id": output_id,
+                                           "degradation_tier": run.tier.level}
+            return result
+        except WorkCancelled:
+            if not computed.done():
+                computed.set_result(False)
+            STAGE_MS.labels(stage.name, "total", "cancelled").observe((time.perf_counter() - started) * 1000)
+            raise
         except Exception as e:
-            stage_end = datetime.now()
-            execution_time = (stage_end - stage_start).total_seconds() * 1000
-            
-            log(f"Feature extraction failed for batch {batch_id}: {e}", MODULE, level="ERROR")
-            return PipelineStageResult(
-                stage="feature_extraction",
+            if not computed.done():
+                computed.set_result(False)
+            log(f"{stage.name} failed for batch {batch_id}: {e}", MODULE, level="ERROR")
+            execution_ms = (time.perf_counter() - started) * 1000
+            STAGE_MS.labels(stage.name, "total", "failed").observe(execution_ms)
+            result = PipelineStageResult(
+                stage=stage.name,
                 status="failed",
-                execution_time_ms=execution_time,
+                execution_time_ms=execution_ms,
                 batch_id=batch_id,
                 success=False,
-                error_message=str(e)
+                error_message=str(e),
+                started_at_ms=round((started - run.started) * 1000, 1),
+                compute_time_ms=round(compute_ms, 1) if compute_ms is not None else None
             )
+            run.checkpoints[stage.name] = {**result.dict(), "pipeline_id": run.pipeline_id,
+                                           "degradation_tier": run.tier.level}
+            return result
+        finally:
+            run.running_stages.discard(stage.name)
     
-    async def _run_autoencoder_batch_analysis(self, features_result: PipelineStageResult,
-                                            data: MotorDataInput, batch_id: str) -> PipelineStageResult:
-        """Выполняет батчевый анализ автоэнкодером"""
-        stage_start = datetime.now()
+    async def _checkpoint(self, run: PipelineRun, status: str = "running", result: Optional[PipelineResult] = None):
+        """
+        Контрольная точка батча в batch_metadata (отложенная запись, замены одного
+        батча схлопываются). Этапы перезапуска дописываются поверх прежних.
+        """
+        previous = run.previous
+        stage_order = ["feature_extraction", "autoencoder_analysis", "dual_lstm_analysis"]
+        stages = [run.checkpoints[name] for name in stage_order if name in run.checkpoints]
+        data_summary = dict(previous.get("data_summary") or {})
+        reruns = list(previous.get("reruns") or [])
+        total_ms = previous.get("total_execution_time_ms", 0)
         
-        try:
-            log(f"Autoencoder analysis started for batch: {batch_id}", MODULE)
-            
-            features_data = self._features_data
-            
-            if data.use_windowing and "windows" in features_data:
-                windows = features_data["windows"]
-                
-                batch_input_vectors = []
-                for i, window in enumerate(windows):
-                    feature_vector = self._extract_feature_vector(window)
-                    if len(feature_vector) == 119:
-                        batch_input_vectors.append(feature_vector)
-                    else:
-                        log(f"Invalid feature vector length in window {i}: {len(feature_vector)}", MODULE, level="WARN")
-                
-                if not batch_input_vectors:
-                    raise ValueError("No valid feature vectors for autoencoder processing")
-                
-                batch_results = run_autoencoder_batch_inference(
-                    batch_input_vectors,
-                    normalization_stats=None,
-                    features=True
-                )
-                
-                batch_doc = {
-                    "batch_id": batch_id,
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "count": len(batch_results.results),
-                    "normalization_stats": None,
-                    "results": [res.dict() if hasattr(res, "dict") else res for res in batch_results.results]
-                }
-                await save_autoencoder_batch(batch_doc)
-                
-                stage_end = datetime.now()
-                execution_time = (stage_end - stage_start).total_seconds() * 1000
-                
-                log(f"Autoencoder analysis completed: {len(batch_input_vectors)} windows, batch: {batch_id}", MODULE)
-                
-                return PipelineStageResult(
-                    stage="autoencoder_analysis",
-                    status="completed",
-                    execution_time_ms=execution_time,
-                    batch_id=batch_id,
-                    windows_processed=len(batch_input_vectors),
-                    success=True
-                )
-                
+        if result is not None:
+            if run.rerun is None:
+                data_summary, total_ms = result.data_summary, result.total_execution_time_ms
             else:
-                feature_vector = self._extract_feature_vector(features_data)
-                if len(feature_vector) != 119:
-                    raise ValueError(f"Expected 119 features, got {len(feature_vector)}")
-                
-                batch_results = run_autoencoder_batch_inference([feature_vector], features=True)
-                
-                batch_doc = {
-                    "batch_id": batch_id,
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "count": 1,
-                    "results": [res.dict() if hasattr(res, "dict") else res for res in batch_results.results]
-                }
-                await save_autoencoder_batch(batch_doc)
-                
-                stage_end = datetime.now()
-                execution_time = (stage_end - stage_start).total_seconds() * 1000
-                
-                return PipelineStageResult(
-                    stage="autoencoder_analysis",
-                    status="completed",
-                    execution_time_ms=execution_time,
-                    batch_id=batch_id,
-                    windows_processed=1,
-                    success=True
-                )
-                
+                status = _overall_status(stages)
+                reruns.append({"pipeline_id": run.pipeline_id, "stages": run.rerun, "status": result.overall_status,
+                               "timestamp": result.timestamp})
+        
+        run_config = previous.get("run_config") or {}
+        run_config = {**run_config, **run.data.dict(include=set(RUN_CONFIG_FIELDS))}
+        try:
+            await batch_storage.save_checkpoint(
+                run.batch_id, run.data.user_id, status, stages, run_config, data_summary,
+                total_ms, reruns, previous.get("created_at")
+            )
         except Exception as e:
-            stage_end = datetime.now()
-            execution_time = (stage_end - stage_start).total_seconds() * 1000
-            
-            log(f"Autoencoder analysis failed for batch {batch_id}: {e}", MODULE, level="ERROR")
-            return PipelineStageResult(
-                stage="autoencoder_analysis", 
-                status="failed",
-                execution_time_ms=execution_time,
-                batch_id=batch_id,
-                success=False,
-                error_message=str(e)
+            log(f"Checkpoint for batch {run.batch_id} not saved: {e}", MODULE, level="WARN")
+    
+    async def rerun_stages(self, batch_id: str, request: StageRerunRequest) -> PipelineResult:
+        """
+        Перезапускает этапы батча из сохранённых признаков, без повторного DSP.
+        По умолчанию — этапы, которые упали, были пропущены или не дошли до
+        контрольной точки. Прежние результаты перезапущенных этапов удаляются
+        после записи новых. LookupError — нет признаков, ValueError — неверные этапы.
+        """
+        previous = await batch_storage.get_batch_metadata(batch_id) or {}
+        checkpoints = {stage["stage"]: stage for stage in previous.get("stages", [])}
+        
+        stages = request.stages
+        if stages is not None and not stages:
+            raise ValueError(f"No stages to rerun, allowed: {list(RERUNNABLE_STAGES)}")
+        if stages is None:
+            stages = [name for name in RERUNNABLE_STAGES if not checkpoints.get(name, {}).get("success")]
+            if not stages:
+                raise ValueError("All stages of this batch succeeded, pass stages explicitly to rerun them")
+        unknown = [name for name in stages if name not in RERUNNABLE_STAGES]
+        if unknown:
+            raise ValueError(f"Stages can not be rerun from stored features: {unknown}, "
+                             f"allowed: {list(RERUNNABLE_STAGES)}")
+        
+        features = await feature_storage.get_feature_matrix_by_batch_id(batch_id)
+        if features is None:
+            raise LookupError(f"No stored features for batch {batch_id}")
+        
+        config = dict(previous.get("run_config") or {})
+        overrides = request.dict(exclude={"stages"}, exclude_none=True)
+        data = MotorDataInput(current_R=[], current_S=[], current_T=[],
+                              **{**config, **overrides, "batch_id": batch_id})
+        run = PipelineRun(data)
+        run.features = features
+        run.rerun = [name for name in RERUNNABLE_STAGES if name in stages]
+        run.checkpoints = checkpoints
+        run.previous = previous
+        log(f"Rerunning {run.rerun} for batch {batch_id} from stored features", MODULE)
+        
+        result = await self.run_full_pipeline(data, run)
+        if not await write_behind.wait_for_batch(batch_id):
+            log(f"Some rerun results for batch {batch_id} were not persisted, previous kept", MODULE, level="ERROR")
+            return result
+        
+        for stage in result.stages:
+            output_id = run.checkpoints.get(stage.stage, {}).get("output_id")
+            if stage.success and output_id is not None:
+                removed = await RERUNNABLE_STAGES[stage.stage](batch_id, output_id)
+                log(f"{stage.stage} rerun for batch {batch_id}: {removed} superseded result(s) removed", MODULE)
+        return result
+    
+    async def _compute_features(self, run: PipelineRun):
+        """Извлекает признаки из данных тока; сохранение признаков — отдельной записью"""
+        data, batch_id = run.data, run.batch_id
+        log(f"Feature extraction started for batch: {batch_id}", MODULE)
+        
+        df_data = {
+            'current_R': data.current_R,
+            'current_S': data.current_S,
+            'current_T': data.current_T
+        }
+        
+        features, metadata = await self.feature_service.extract(
+            content=df_data,
+            content_type="application/json",
+            use_windowing=data.use_windowing,
+            window_size=data.window_size
+        )
+        
+        run.features = features
+        windows_count = features.n_windows
+        log(f"Feature extraction completed: {windows_count} windows, batch: {batch_id}", MODULE)
+        
+        persist = self.feature_service.storage.save_features(data.user_id, features, metadata, batch_id)
+        return windows_count, persist
+    
+    async def _compute_autoencoder(self, run: PipelineRun):
+        """Выполняет батчевый анализ автоэнкодером"""
+        data, batch_id = run.data, run.batch_id
+        log(f"Autoencoder analysis started for batch: {batch_id}", MODULE)
+        
+        features = run.features
+        windowed = features.windowed
+        
+        batch_input_vectors = features.valid_rows()
+        if not len(batch_input_vectors):
+            raise ValueError("No valid feature vectors for autoencoder processing")
+        
+        tier = run.tier
+        with section("model_call"):
+            batch_results = await run_autoencoder_batch_inference_async(
+                batch_input_vectors,
+                normalization_stats=None,
+                features=data.explain and tier.explain,
+                model_version=data.autoencoder_version,
+                mc_passes=tier.mc_passes
             )
+        
+        batch_doc = {
+            "batch_id": batch_id,
+            "timestamp": datetime.utcnow().isoformat(),
+            "count": len(batch_results.results),
+            "results": [res.dict() if hasattr(res, "dict") else res for res in batch_results.results],
+            "degradation": tier.to_dict()
+        }
+        if windowed:
+            batch_doc["normalization_stats"] = None
+        
+        log(f"Autoencoder analysis completed: {len(batch_input_vectors)} windows, batch: {batch_id}", MODULE)
+        return len(batch_input_vectors), save_autoencoder_batch(batch_doc)
     
-    async def _run_dual_lstm_batch_analysis(self, features_result: PipelineStageResult,
-                                          data: MotorDataInput, batch_id: str) -> PipelineStageResult:
+    async def _compute_dual_lstm(self, run: PipelineRun):
         """Выполняет батчевый анализ Dual LSTM"""
-        stage_start = datetime.now()
+        data, batch_id = run.data, run.batch_id
+        log(f"LSTM analysis started for batch: {batch_id}", MODULE)
         
-        try:
-            log(f"LSTM analysis started for batch: {batch_id}", MODULE)
-            
-            features_data = self._features_data
-            
-            if data.use_windowing and "windows" in features_data:
-                windows = features_data["windows"]
-                
-                if len(windows) < 10:
-                    lstm_sequences = self._create_intra_window_sequences(windows)
-                else:
-                    lstm_sequences = self._create_inter_window_sequences(windows)
-                
-                if not lstm_sequences:
-                    raise ValueError("No valid sequences for LSTM processing")
-                
-                batch_predictions = []
-                for seq_idx, lstm_input in enumerate(lstm_sequences):
-                    result = dual_lstm_predictor.predict_multistep(lstm_input, data.dual_lstm_steps)
-                    batch_predictions.append({
-                        "window_index": seq_idx,
-                        "predictions": result["predictions"],
-                        "metadata": result["metadata"]
-                    })
-                
-                await save_dual_lstm_result(
-                    inference_id=str(uuid.uuid4()),
-                    batch_id=batch_id,
-                    input_data=f"batch_of_{len(lstm_sequences)}_sequences",
-                    predictions=batch_predictions,
-                    metadata={
-                        "batch_size": len(lstm_sequences),
-                        "steps_predicted": data.dual_lstm_steps,
-                        "sequence_length": 10,
-                        "sequence_type": "inter_window" if len(windows) >= 10 else "intra_window"
-                    }
-                )
-                
-                stage_end = datetime.now()
-                execution_time = (stage_end - stage_start).total_seconds() * 1000
-                
-                log(f"LSTM analysis completed: {len(lstm_sequences)} sequences, batch: {batch_id}", MODULE)
-                
-                return PipelineStageResult(
-                    stage="dual_lstm_analysis",
-                    status="completed",
-                    execution_time_ms=execution_time,
-                    batch_id=batch_id,
-                    windows_processed=len(lstm_sequences),
-                    success=True
-                )
-            else:
-                raise ValueError("LSTM requires windowed data")
-                
-        except Exception as e:
-            stage_end = datetime.now()
-            execution_time = (stage_end - stage_start).total_seconds() * 1000
-            
-            log(f"LSTM analysis failed for batch {batch_id}: {e}", MODULE, level="ERROR")
-            return PipelineStageResult(
-                stage="dual_lstm_analysis",
-                status="failed",
-                execution_time_ms=execution_time,
-                batch_id=batch_id,
-                success=False,
-                error_message=str(e)
-            )
-
-    def _create_inter_window_sequences(self, windows):
-        """Создает временные последовательности из разных окон"""
-        lstm_sequences = []
+        features = run.features
+        if not features.windowed:
+            raise ValueError("LSTM requires windowed data")
         
-        for i in range(len(windows) - 10 + 1):
-            sequence_windows = windows[i:i+10]
-            sequence_features = []
-            
-            for window in sequence_windows:
-                feature_vector = self._extract_feature_vector(window)
-                if len(feature_vector) == 119:
-                    sequence_features.append(feature_vector)
-                else:
-                    return []
-            
-            if len(sequence_features) == 10:
-                lstm_sequences.append(np.array(sequence_features))
+        n_windows = features.n_windows
+        inter_window = n_windows >= 10
         
-        return lstm_sequences
-
-    def _create_intra_window_sequences(self, windows):
-        """Создает временные последовательности внутри окон"""
-        lstm_sequences = []
+        if inter_window:
+            lstm_sequences = self._create_inter_window_sequences(features)
+        else:
+            lstm_sequences = self._create_intra_window_sequences(features)
         
-        for window_idx, window in enumerate(windows):
-            feature_vector = self._extract_feature_vector(window) 
-            
-            if len(feature_vector) == 119:
-                sequence = []
-                for t in range(10):
-                    variation_factor = 1.0 + 0.01 * np.sin(2 * np.pi * t / 10)
-                    varied_features = [f * variation_factor for f in feature_vector]
-                    sequence.append(varied_features)
-                
-                lstm_sequences.append(np.array(sequence))
-                
-                if len(lstm_sequences) >= 5:
-                    break
-        
-        return lstm_sequences
-
-    def _extract_feature_vector(self, features_data: Dict[str, Any]) -> List[float]:
-        """Извлекает признаки в правильном порядке для моделей"""
-        feature_vector = []
-        
-        feature_order = [
-            ('common', ['rms_A', 'mean_A', 'std_A', 'rms_B', 'mean_B', 'std_B', 'rms_C', 'mean_C', 'std_C', 
-                       'total_imbalance', 'rms_imbalance', 'imbalance_ab', 'imbalance_bc', 'imbalance_ca', 
-                       'park_ellipticity', 'park_mag_mean', 'park_mag_std']),
-            
-            ('bearing', ['bearing_bpfo_amp_A', 'bearing_bpfi_amp_A', 'bearing_bpfo_amp_B', 'bearing_bpfi_amp_B', 
-                        'bearing_bpfo_amp_C', 'bearing_bpfi_amp_C', 'bearing_bsf_amp_A', 'bearing_ftf_amp_A',
-                        'bearing_bpfo_2h_amp_A', 'bearing_bpfi_2h_amp_A', 'bearing_bpfo_band_rms_A', 
-                        'bearing_bpfi_band_rms_A', 'bearing_env_kurtosis_A', 'bearing_env_rms_A', 
-                        'bearing_env_peak_factor_A', 'bearing_env_bpfo_A', 'bearing_env_bpfi_A', 
-                        'bearing_hf_energy_A', 'bearing_crest_factor_A', 'bearing_env_kurtosis_B', 
-                        'bearing_env_rms_B', 'bearing_env_peak_factor_B', 'bearing_hf_energy_B', 
-                        'bearing_crest_factor_B', 'bearing_env_kurtosis_C', 'bearing_env_rms_C', 
-                        'bearing_env_peak_factor_C', 'bearing_hf_energy_C', 'bearing_env_kurtosis_max', 
-                        'bearing_hf_energy_max']),
-            
-            ('eccentricity', ['ecc_current_asymmetry', 'ecc_max_deviation', 'ecc_rms_variance', 'ecc_max_min_ratio',
-                             'ecc_corr_ab', 'ecc_corr_bc', 'ecc_corr_ca', 'ecc_mean_correlation', 
-                             'ecc_correlation_variance', 'ecc_min_correlation', 'ecc_main_1_lower_amp_A',
-                             'ecc_main_1_lower_ratio_A', 'ecc_main_1_upper_amp_A', 'ecc_main_1_upper_ratio_A',
-                             'ecc_main_1_lower_amp_B', 'ecc_main_1_upper_amp_B', 'ecc_main_1_lower_amp_C',
-                             'ecc_main_1_upper_amp_C', 'ecc_main_2_lower_ratio_A', 'ecc_rotor_freq_modulation_A',
-                             'ecc_2rotor_freq_modulation_A', 'ecc_envelope_modulation_A', 'ecc_rotor_freq_modulation_B',
-                             'ecc_envelope_modulation_B', 'ecc_rotor_freq_modulation_C', 'ecc_harmonic_ratio_A',
-                             'ecc_total_harmonic_energy_A', 'ecc_harmonic_ratio_B', 'ecc_harmonic_ratio_C']),
-            
-            ('rotor', ['rotor_sb1_lower_ratio_A', 'rotor_sb1_upper_ratio_A', 'rotor_sb2_lower_ratio_A',
-                      'rotor_sb1_lower_amp_A', 'rotor_sb1_upper_amp_A', 'rotor_sb1_lower_ratio_B',
-                      'rotor_sb1_upper_ratio_B', 'rotor_sb1_upper_ratio_C', 'rotor_sb1_lower_ratio_combined',
-                      'rotor_stft_ratio_A', 'rotor_stft_main_energy_A', 'rotor_stft_sb1_energy_A',
-                      'rotor_stft_energy_var_A', 'rotor_stft_ratio_B', 'rotor_stft_ratio_C']),
-            
-            ('stator', ['k2_asymmetry', 'thd_A', 'thd_B', 'thd_C', 'h3_ratio_A', 'h5_ratio_A', 'h7_ratio_A',
-                       'h3_ratio_B', 'h5_ratio_B', 'h7_ratio_B', 'h3_ratio_C', 'h5_ratio_C', 'h7_ratio_C',
-                       'phase_deviation_ab', 'phase_deviation_bc', 'phase_deviation_ca', 'modulation_coeff_A',
-                       'modulation_coeff_B', 'modulation_coeff_C', 'rel_energy_low_band_A', 
-                       'rel_energy_medium_band_A', 'rel_energy_high_band_A', 'rel_energy_low_band_B',
-                       'rel_energy_medium_band_B', 'rel_energy_high_band_B', 'rel_energy_low_band_C',
-                       'rel_energy_medium_band_C', 'rel_energy_high_band_C'])
-        ]
+        if not len(lstm_sequences):
+            raise ValueError("No valid sequences for LSTM processing")
+        
+        tier = run.tier
+        steps = data.dual_lstm_steps
+        if tier.lstm_steps is not None:
+            steps = min(steps, tier.lstm_steps)
+        first_sequence = 0
+        if tier.lstm_max_sequences is not None:
+            # под нагрузкой прогноз строится по последним окнам
+            first_sequence = max(0, len(lstm_sequences) - tier.lstm_max_sequences)
+            lstm_sequences = lstm_sequences[first_sequence:]
         
-        for group_name, feature_names in feature_order:
-            if group_name in features_data:
-                group_data = features_data[group_name]
-                for feature_name in feature_names:
-                    if feature_name in group_data and isinstance(group_data[feature_name], (int, float)):
-                        value = float(group_data[feature_name])
-                        feature_vector.append(value)
+        with section("model_call"):
+            async with model_registry.acquire_async("dual_lstm", data.dual_lstm_version) as dual_lstm_predictor:
+                model_version = dual_lstm_predictor.model_prefix
+                if inter_window:
+                    # последовательности строятся заново поверх отмасштабированной матрицы
+                    sequence_results = await dual_lstm_predictor.predict_window_sequences_async(
+                        features.values, steps, first_sequence
+                    )
+                else:
+                    sequence_results = await dual_lstm_predictor.predict_multistep_batch_async(
+                        lstm_sequences, steps
+                    )
         
-        if len(feature_vector) != 119:
-            log(f"Invalid feature vector length: {len(feature_vector)}, expected 119", MODULE, level="ERROR")
+        batch_predictions = []
+        for seq_idx, result in enumerate(sequence_results):
+            batch_predictions.append({
+                "window_index": first_sequence + seq_idx,
+                "predictions": result["predictions"],
+                "metadata": result["metadata"]
+            })
         
-        return feature_vector
+        persist = save_dual_lstm_result(
+            inference_id=str(uuid.uuid4()),
+            batch_id=batch_id,
+            input_data=f"batch_of_{len(lstm_sequences)}_sequences",
+            predictions=batch_predictions,
+            metadata={
+                "batch_size": len(lstm_sequences),
+                "steps_predicted": steps,
+                "sequence_length": 10,
+                "sequence_type": "inter_window" if inter_window else "intra_window",
+                "degradation_tier": tier.level
+            },
+            model_version=model_version
+        )
+        
+        log(f"LSTM analysis completed: {len(lstm_sequences)} sequences, batch: {batch_id}", MODULE)
+        return len(lstm_sequences), persist
+
+    def _create_inter_window_sequences(self, features: FeatureMatrix) -> np.ndarray:
+        """Последовательности из 10 соседних окон: представление (n - 9, 10, 119) без копии; пусто, если есть неполные окна"""
+        if not features.valid.all():
+            return np.empty((0, 10, features.schema.size), dtype=np.float32)
+        return window_sequences(features.values)
+
+    def _create_intra_window_sequences(self, features: FeatureMatrix) -> np.ndarray:
+        """Последовательности внутри окон: до 5 первых полных окон, 10 шагов с модуляцией ±1%"""
+        rows = features.valid_rows()[:5]
+        variation = 1.0 + 0.01 * np.sin(2 * np.pi * np.arange(10) / 10)
+        return (rows[:, None, :] * variation[None, :, None]).astype(np.float32)
+
+def _overall_status(stages: List[Dict[str, Any]]) -> str:
+    if not any(stage["success"] for stage in stages):
+        return "failure"
+    return "success" if all(stage["success"] for stage in stages) else "partial_failure"
 
 pipeline_processor = PipelineProcessor()
 
+CallbackMetric("pipeline_runs_running", "Выполняющиеся пайплайны", lambda: pipeline_processor.running)
+CallbackMetric("pipeline_runs_waiting", "Пайплайны в ожидании слота", lambda: pipeline_processor.waiting)
+CallbackMetric("pipeline_class_queue_depth", "Пайплайны в ожидании слота по классу приоритета",
+               lambda: [((priority,), pipeline_processor.scheduler.depth(priority)) for priority in PRIORITY_CLASSES],
+               labelnames=("class",))
+CallbackMetric("pipeline_class_running", "Выполняющиеся пайплайны по классу приоритета",
+               lambda: [((priority,), pipeline_processor.scheduler.running_by_class[priority])
+                        for priority in PRIORITY_CLASSES],
+               labelnames=("class",))
+
 @router.post("/analyze", response_model=PipelineResult)
-async def run_full_analysis_pipeline(data: MotorDataInput):
-    """Выполняет полный анализ данных двигателя через все этапы пайплайна"""
+async def run_full_analysis_pipeline(data: MotorDataInput, request: Request,
+                                     timeout_ms: Optional[float] = Query(None, gt=0)):
+    """
+    Выполняет полный анализ данных двигателя через все этапы пайплайна.
+    Дедлайн — timeout_ms, заголовок X-Request-Timeout-Ms или X-Request-Deadline
+    """
     try:
-        result = await pipeline_processor.run_full_pipeline(data)
+        result = await run_with_deadline(
+            request, from_headers(request.headers, timeout_ms), pipeline_processor.run_full_pipeline(data)
+        )
+        # ответ уходит после записи, чтобы /batches/{batch_id} сразу видел результаты
+        if not await write_behind.wait_for_batch(result.batch_id):
+            log(f"Results for batch {result.batch_id} are not persisted yet, answering without them",
+                MODULE, level="WARN")
+            result.persist_pending = True
         return result
         
+    except PipelineOverloaded as e:
+        log(f"Pipeline overloaded, request rejected: {e}", MODULE, level="WARN")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after_s)})
+    except WorkCancelled as e:
+        raise cancelled_response(e)
     except Exception as e:
         log(f"Pipeline execution failed: {e}", MODULE, level="ERROR")
         raise HTTPException(status_code=500, detail=f"Pipeline execution failed: {str(e)}")
 
+def cancelled_response(e: WorkCancelled) -> HTTPException:
+    log(f"Request cancelled: {e}", MODULE, level="WARN")
+    return HTTPException(status_code=e.status_code, detail=str(e))
+
+@router.post("/rerun/{batch_id}", response_model=PipelineResult)
+async def rerun_pipeline_stages(batch_id: str, request: Optional[StageRerunRequest] = None):
+    """
+    Перезапускает упавшие или выбранные этапы батча из сохранённых признаков:
+    например, LSTM после таймаута или пересчёт после обновления автоэнкодера
+    """
+    try:
+        return await pipeline_processor.rerun_stages(batch_id, request or StageRerunRequest())
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PipelineOverloaded as e:
+        log(f"Pipeline overloaded, rerun rejected: {e}", MODULE, level="WARN")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after_s)})
+    except Exception as e:
+        log(f"Stage rerun failed for batch {batch_id}: {e}", MODULE, level="ERROR")
+        raise HTTPException(status_code=500, detail=f"Stage rerun failed: {str(e)}")
+
+@router.get("/profile/{batch_id}")
+async def get_batch_profile(batch_id: str):
+    """Профиль запуска с profile=true: разбивка времени, топ функций, свёрнутые стеки"""
+    profile = await get_pipeline_profile(batch_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile for this batch")
+    return profile
+
 @router.get("/status")
 async def get_pipeline_status():
     """Проверяет состояние всех компонентов пайплайна"""
     try:
         features_ok = True
-        autoencoder_ok = True  
-        dual_lstm_ok = dual_lstm_predictor.model is not None
+        autoencoder_ok = is_model_ready("autoencoder")
+        dual_lstm_ok = is_model_ready("dual_lstm")
         
         return {
             "pipeline_status": "healthy" if all([features_ok, autoencoder_ok, dual_lstm_ok]) else "unhealthy",
@@ -451,6 +715,10 @@ async def get_pipeline_status():
                 "autoencoder": "healthy" if autoencoder_ok else "unhealthy", 
                 "dual_lstm": "healthy" if dual_lstm_ok else "unhealthy"
             },
+            "models": get_model_states(),
+            "concurrency": pipeline_processor.concurrency_stats(),
+            "degradation": degradation_policy.stats(),
+            "persistence": write_behind.stats(),
             "timestamp": datetime.now().isoformat()
         }
         
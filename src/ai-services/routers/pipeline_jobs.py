@@ -0,0 +1,340 @@
+from fastapi import APIRouter, HTTPException
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from datetime import datetime
+import asyncio
+import os
+import uuid
+
+from database.lease_queue import DISTRIBUTED, WORK_MAX_ATTEMPTS, Lease, lease_queue, poll_claim
+from database.write_behind import write_behind
+from routers.pipeline import MotorDataInput, PipelineRun, pipeline_processor
+from utils.logger import log
+
+MODULE = 'pipeline_jobs'
+router = APIRouter(prefix="/pipeline/jobs", tags=["Pipeline Jobs"])
+
+PIPELINE_JOB_QUEUE_SIZE = int(os.getenv("PIPELINE_JOB_QUEUE_SIZE", 100))
+PIPELINE_JOB_WORKERS = int(os.getenv("PIPELINE_JOB_WORKERS", 2))
+PIPELINE_JOB_RETENTION = int(os.getenv("PIPELINE_JOB_RETENTION", 500))
+
+PIPELINE_STAGES = ["feature_extraction", "autoencoder_analysis", "dual_lstm_analysis"]
+FINAL_STATES = ("completed", "failed", "cancelled")
+
+JOB_KIND = "pipeline_job"
+# Состояния элемента очереди аренд в терминах заданий
+_ITEM_STATES = {"pending": "queued", "leased": "running"}
+
+
+class PipelineJob:
+    def __init__(self, data: MotorDataInput, job_id: Optional[str] = None):
+        self.job_id = job_id or str(uuid.uuid4())
+        if data.batch_id is None:
+            # batch_id по секундам совпал бы у заданий, отправленных одним пользователем разом
+            data = data.copy(update={
+                "batch_id": f"batch_{data.user_id}_{int(datetime.now().timestamp())}_{self.job_id}"
+            })
+        self.data = data
+        self.run = PipelineRun(data)
+        self.state = "queued"
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_requested = False
+        self.lease: Optional[Lease] = None
+        self.submitted_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    @classmethod
+    def from_item(cls, item: Dict[str, Any]) -> "PipelineJob":
+        """Задание из элемента очереди аренд; batch_id зафиксирован при отправке и одинаков во всех попытках"""
+        job = cls(MotorDataInput(**item["payload"]), job_id=item["key"])
+        job.submitted_at = item["created_at"]
+        return job
+
+    def progress(self) -> Dict[str, Any]:
+        done = len(self.run.stages)
+        if self.state == "completed":
+            done = len(PIPELINE_STAGES)
+        return {
+            "running_stages": sorted(self.run.running_stages),
+            "completed_stages": [stage.stage for stage in self.run.stages],
+            "fraction": round(done / len(PIPELINE_STAGES), 2)
+        }
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "batch_id": self.run.batch_id,
+            "user_id": self.data.user_id,
+            "state": self.state,
+            "progress": self.progress(),
+            "error": self.error,
+            "submitted_at": self.submitted_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+def _item_status(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Статус задания, которое выполняется или выполнялось на другом узле"""
+    state = _ITEM_STATES.get(item["state"], item["state"])
+    status = item.get("status") or {}
+    progress = status.get("progress") or {"running_stages": [], "completed_stages": [],
+                                          "fraction": 1.0 if state == "completed" else 0.0}
+    return {
+        "job_id": item["key"],
+        "batch_id": item["payload"].get("batch_id"),
+        "user_id": item["payload"].get("user_id"),
+        "state": state,
+        "progress": progress,
+        "error": item.get("error"),
+        "submitted_at": item["created_at"].isoformat(),
+        "started_at": item["started_at"].isoformat() if item.get("started_at") else None,
+        "finished_at": item["finished_at"].isoformat() if item.get("finished_at") else None,
+        "worker": item.get("owner"),
+        "attempts": item.get("attempts", 0)
+    }
+
+
+class PipelineJobManager:
+    """
+    Очередь заданий пайплайна с пулом воркеров.
+
+    Отправка возвращает job_id сразу; результаты пишутся под тем же batch_id,
+    что и при синхронном /pipeline/analyze, поэтому /batches/* читает их без изменений.
+    В режиме WORK_QUEUE_MODE=distributed очередь — коллекция work_items:
+    воркеры любой реплики берут задания по аренде, статус читается из Mongo.
+    """
+
+    def __init__(self, queue_size: int = PIPELINE_JOB_QUEUE_SIZE, workers: int = PIPELINE_JOB_WORKERS,
+                 distributed: bool = DISTRIBUTED):
+        self.queue_size = queue_size
+        self.worker_count = max(1, workers)
+        self.distributed = distributed
+        self.jobs: "OrderedDict[str, PipelineJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self):
+        if self._workers:
+            return
+        if self.distributed:
+            await lease_queue.ensure_indexes()
+            worker = self._lease_worker
+        else:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            worker = self._worker
+        self._workers = [
+            asyncio.create_task(worker(ix)) for ix in range(self.worker_count)
+        ]
+        log(f"Pipeline job workers started: {self.worker_count}, queue size: {self.queue_size}, "
+            f"distributed: {self.distributed}", MODULE)
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, data: MotorDataInput) -> PipelineJob:
+        if not self._workers:
+            raise RuntimeError("Job workers are not running")
+        job = PipelineJob(data)
+        if self.distributed:
+            if await lease_queue.count(JOB_KIND, "pending") >= self.queue_size:
+                raise asyncio.QueueFull()
+            payload = {**data.dict(), "batch_id": job.run.batch_id}
+            await lease_queue.enqueue(JOB_KIND, job.job_id, payload, item_id=job.job_id)
+            log(f"Job queued in work queue: {job.job_id}, batch: {job.run.batch_id}", MODULE)
+            return job
+        self._queue.put_nowait(job)
+        self.jobs[job.job_id] = job
+        self._trim()
+        log(f"Job queued: {job.job_id}, batch: {job.run.batch_id}, depth: {self._queue.qsize()}", MODULE)
+        return job
+
+    def get(self, job_id: str) -> Optional[PipelineJob]:
+        return self.jobs.get(job_id)
+
+    async def get_status(self, job_id: str, with_result: bool = False) -> Optional[Dict[str, Any]]:
+        """Статус задания: своё — из памяти, чужое или завершённое на другом узле — из очереди аренд"""
+        job = self.jobs.get(job_id)
+        if job is not None and (not self.distributed or job.state not in FINAL_STATES):
+            status = job.status()
+            result = job.result
+        elif self.distributed:
+            item = await lease_queue.get(job_id)
+            if item is None or item["kind"] != JOB_KIND:
+                return None
+            status = _item_status(item)
+            result = item.get("result")
+        else:
+            return None
+        if with_result:
+            status["result"] = result
+        return status
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if job is not None and job.state not in FINAL_STATES:
+            if job.state == "queued":
+                self._finish(job, "cancelled")
+            elif job.task is not None:
+                job.cancel_requested = True
+                job.task.cancel()
+        elif self.distributed:
+            await lease_queue.request_stop(job_id)
+        return await self.get_status(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {
+            "workers": self.worker_count,
+            "queue_size": self.queue_size,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "distributed": self.distributed,
+            "jobs": states
+        }
+
+    async def _worker(self, ix: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.state == "queued":
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _lease_worker(self, ix: int):
+        """Воркер распределённого режима: берёт задание по аренде, держит её heartbeat'ом до конца"""
+        while True:
+            item = await poll_claim(JOB_KIND, WORK_MAX_ATTEMPTS)
+            try:
+                job = PipelineJob.from_item(item)
+            except Exception as e:
+                log(f"Malformed job {item['_id']}: {e}", MODULE, level="ERROR")
+                await lease_queue.finish(item["_id"], "failed", error=f"Malformed job: {e}")
+                continue
+
+            job.lease = Lease(
+                item,
+                status_fn=lambda: {"progress": job.progress()},
+                on_stop=lambda: self._cancel_running(job),
+                on_lost=lambda: self._cancel_running(job)
+            )
+            self.jobs[job.job_id] = job
+            self._trim()
+            job.lease.start()
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                await job.lease.release()
+                raise
+            await job.lease.finish(job.state, job.result, job.error)
+
+    async def _cancel_running(self, job: PipelineJob):
+        if job.task is not None:
+            job.cancel_requested = True
+            job.task.cancel()
+
+    async def _run(self, job: PipelineJob):
+        job.state = "running"
+        job.started_at = datetime.utcnow()
+        job.task = asyncio.create_task(
+            pipeline_processor.run_full_pipeline(job.data, run=job.run, allow_reject=False, priority="jobs")
+        )
+        try:
+            result = await job.task
+            persisted = await write_behind.wait_for_batch(job.run.batch_id)
+        except asyncio.CancelledError:
+            if not job.cancel_requested:
+                raise
+            self._finish(job, "cancelled")
+            log(f"Job cancelled: {job.job_id}", MODULE, level="WARN")
+            return
+        except Exception as e:
+            self._finish(job, "failed", error=str(e))
+            log(f"Job failed: {job.job_id}: {e}", MODULE, level="ERROR")
+            return
+
+        job.result = result.dict()
+        state = "failed" if result.overall_status == "failure" else "completed"
+        error = None if state == "completed" else "All pipeline stages failed"
+        if not persisted:
+            error = error or "Some results were not persisted"
+        self._finish(job, state, error=error)
+        log(f"Job {state}: {job.job_id}, batch: {job.run.batch_id}", MODULE)
+
+    def _finish(self, job: PipelineJob, state: str, error: Optional[str] = None):
+        job.state = state
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        job.task = None
+
+    def _trim(self):
+        """Держит в памяти не больше PIPELINE_JOB_RETENTION заданий, вытесняя старые завершённые"""
+        excess = len(self.jobs) - PIPELINE_JOB_RETENTION
+        for job_id in [jid for jid, job in self.jobs.items() if job.state in FINAL_STATES][:max(0, excess)]:
+            del self.jobs[job_id]
+
+
+pipeline_job_manager = PipelineJobManager()
+
+
+async def _get_status_or_404(job_id: str, with_result: bool = False) -> Dict[str, Any]:
+    status = await pipeline_job_manager.get_status(job_id, with_result=with_result)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+
+@router.post("", status_code=202)
+async def submit_pipeline_job(data: MotorDataInput):
+    """Ставит анализ в очередь и сразу возвращает job_id и batch_id"""
+    try:
+        job = await pipeline_job_manager.submit(data)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=429, detail="Pipeline job queue is full")
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {
+        "job_id": job.job_id,
+        "batch_id": job.run.batch_id,
+        "state": job.state,
+        "status_url": f"/pipeline/jobs/{job.job_id}",
+        "result_url": f"/pipeline/jobs/{job.job_id}/result"
+    }
+
+
+@router.get("")
+async def get_pipeline_jobs_stats():
+    """Глубина очереди и задания по состояниям"""
+    return {**pipeline_job_manager.stats(), "timestamp": datetime.now().isoformat()}
+
+
+@router.get("/{job_id}")
+async def get_pipeline_job_status(job_id: str):
+    """Состояние и прогресс задания по этапам"""
+    return await _get_status_or_404(job_id)
+
+
+@router.get("/{job_id}/result")
+async def get_pipeline_job_result(job_id: str):
+    """Итог пайплайна; данные батча — в /batches/{batch_id}/complete"""
+    status = await _get_status_or_404(job_id, with_result=True)
+    if status["state"] not in FINAL_STATES:
+        raise HTTPException(status_code=409, detail=f"Job is {status['state']}")
+    return status
+
+
+@router.delete("/{job_id}")
+async def cancel_pipeline_job(job_id: str):
+    """Отменяет задание: из очереди — сразу, выполняющееся — с прерыванием текущего этапа"""
+    status = await pipeline_job_manager.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
@@ -2,21 +2,34 @@
 
 from fastapi import APIRouter, HTTPException
 import asyncio
+import os
 import websockets
 import json
 import numpy as np
 from typing import Dict, List, Optional
 from datetime import datetime
 from routers.pipeline import pipeline_processor
+from database.lease_queue import DISTRIBUTED, WORK_CLAIM_INTERVAL_S, Lease, lease_queue, poll_claim
+from database.write_behind import write_behind
 from utils.logger import log
+from utils.metrics import CallbackMetric
 from config.hosts import hosts
 
 MODULE = 'streaming'
 router = APIRouter(prefix="/streaming", tags=["Real-time Pipeline"])
 
+STREAM_KIND = "stream_session"
+# Сколько потоковых сессий один узел берёт из общей очереди в распределённом режиме
+WORKER_MAX_STREAMS = int(os.getenv("WORKER_MAX_STREAMS", 8))
+
+
+def _stream_item_id(user_id: str) -> str:
+    return f"stream:{user_id}"
+
 class StreamingPipelineProcessor:
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, profile: bool = False):
         self.user_id = user_id
+        self.profile = profile
         self.is_running = False
         self.websocket_uri = hosts.MOTOR_WEBSOCKET_URL 
         self.data_buffer = {
@@ -48,14 +61,15 @@ class StreamingPipelineProcessor:
         step_size = int(self.window_size * (1 - self.overlap_ratio))
         return (self.windows_per_batch - 1) * step_size + self.window_size
         
-    async def start_streaming(self):
+    async def start_streaming(self, session_id: Optional[str] = None, processed_batches: int = 0):
+        """session_id и processed_batches передаются при переезде сессии с другого узла"""
         if self.is_running:
             return {"status": "already_running", "user_id": self.user_id}
             
         self.is_running = True
         self.start_time = datetime.now()
-        self.stream_session_id = f"stream_{self.user_id}_{int(self.start_time.timestamp())}"
-        self.processed_batches = 0
+        self.stream_session_id = session_id or f"stream_{self.user_id}_{int(self.start_time.timestamp())}"
+        self.processed_batches = processed_batches
         self._reset_stats()
         
         self.processing_task = asyncio.create_task(self._stream_processor())
@@ -116,7 +130,8 @@ class StreamingPipelineProcessor:
                 "window_size": self.window_size,
                 "windows_per_batch": self.windows_per_batch,
                 "overlap_ratio": self.overlap_ratio,
-                "dual_lstm_steps": self.dual_lstm_steps
+                "dual_lstm_steps": self.dual_lstm_steps,
+                "profile": self.profile
             },
             "ready_for_processing": buffer_size >= required_size
         }
@@ -184,11 +199,13 @@ class StreamingPipelineProcessor:
                 batch_id=f"{self.stream_session_id}_batch_{self.processed_batches + 1}",
                 use_windowing=True,
                 window_size=self.window_size,
-                dual_lstm_steps=self.dual_lstm_steps
+                dual_lstm_steps=self.dual_lstm_steps,
+                profile=self.profile
             )
             
             try:
-                pipeline_result = await pipeline_processor.run_full_pipeline(pipeline_input)
+                pipeline_result = await pipeline_processor.run_full_pipeline(pipeline_input, allow_reject=False,
+                                                                         priority="streaming")
                 
                 self.processed_batches += 1
                 self._update_pipeline_stats(pipeline_result)
@@ -247,10 +264,46 @@ class StreamingPipelineProcessor:
         }
 
 class StreamingPipelineManager:
-    def __init__(self):
+    """
+    Потоковые сессии узла.
+
+    В режиме WORK_QUEUE_MODE=distributed старт только ставит сессию в очередь
+    аренд; _claim_sessions на каждой реплике забирает сессии, пока их на узле
+    меньше WORKER_MAX_STREAMS. Сессия умершего узла переезжает на другой
+    с прежними session_id и счётчиком батчей, поэтому batch_id не повторяются.
+    """
+
+    def __init__(self, distributed: bool = DISTRIBUTED, max_streams: int = WORKER_MAX_STREAMS):
         self.active_processors: Dict[str, StreamingPipelineProcessor] = {}
+        self.leases: Dict[str, Lease] = {}
+        self.distributed = distributed
+        self.max_streams = max_streams
+        self._claim_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if not self.distributed or self._claim_task is not None:
+            return
+        await lease_queue.ensure_indexes()
+        self._claim_task = asyncio.create_task(self._claim_sessions())
+        log(f"Stream session claiming started, up to {self.max_streams} per node", MODULE)
+
+    async def shutdown(self):
+        """Останавливает сессии узла; в распределённом режиме сразу отдаёт их другим узлам"""
+        if self._claim_task is not None:
+            self._claim_task.cancel()
+            await asyncio.gather(self._claim_task, return_exceptions=True)
+            self._claim_task = None
+        for user_id in list(self.active_processors.keys()):
+            processor = self.active_processors.pop(user_id)
+            lease = self.leases.pop(user_id, None)
+            await processor.stop_streaming()
+            if lease is not None:
+                await lease.release()
     
-    async def start_pipeline_stream(self, user_id: str) -> dict:
+    async def start_pipeline_stream(self, user_id: str, profile: bool = False) -> dict:
+        if self.distributed:
+            return await self._enqueue_stream(user_id, profile)
+
         if user_id in self.active_processors:
             return {
                 "status": "already_running",
@@ -258,7 +311,7 @@ class StreamingPipelineManager:
                 "message": f"Pipeline stream already exists for user: {user_id}"
             }
         
-        processor = StreamingPipelineProcessor(user_id)
+        processor = StreamingPipelineProcessor(user_id, profile=profile)
         result = await processor.start_streaming()
         self.active_processors[user_id] = processor
         
@@ -266,23 +319,28 @@ class StreamingPipelineManager:
         return result
     
     async def stop_pipeline_stream(self, user_id: str) -> dict:
-        if user_id not in self.active_processors:
-            return {
-                "status": "not_found",
-                "user_id": user_id,
-                "message": f"No active pipeline stream for user: {user_id}"
-            }
-        
-        processor = self.active_processors[user_id]
-        result = await processor.stop_streaming()
-        del self.active_processors[user_id]
-        
-        log(f"Pipeline processor removed for user {user_id}, total active: {len(self.active_processors)}", MODULE)
-        return result
+        if user_id in self.active_processors:
+            return await self._stop_local(user_id)
+
+        if self.distributed:
+            item = await lease_queue.request_stop(_stream_item_id(user_id))
+            if item is not None:
+                return {
+                    "status": "stopped" if item["state"] == "cancelled" else "stopping",
+                    "user_id": user_id,
+                    "session_id": item["payload"]["session_id"],
+                    "worker": item.get("owner")
+                }
+
+        return {
+            "status": "not_found",
+            "user_id": user_id,
+            "message": f"No active pipeline stream for user: {user_id}"
+        }
     
     async def stop_all_streams(self) -> dict:
         stopped_users = []
-        for user_id in list(self.active_processors.keys()):
+        for user_id in await self.get_active_users():
             result = await self.stop_pipeline_stream(user_id)
             if result["status"] != "not_found":
                 stopped_users.append(user_id)
@@ -293,31 +351,136 @@ class StreamingPipelineManager:
             "count": len(stopped_users)
         }
     
-    def get_user_status(self, user_id: str) -> Optional[dict]:
-        if user_id not in self.active_processors:
+    async def get_user_status(self, user_id: str) -> Optional[dict]:
+        if user_id in self.active_processors:
+            return self.active_processors[user_id].get_status()
+        if not self.distributed:
+            return None
+        item = await lease_queue.get(_stream_item_id(user_id))
+        if item is None or item["state"] not in ("pending", "leased"):
             return None
-        return self.active_processors[user_id].get_status()
+        return self._item_status(item)
     
-    def get_all_statuses(self) -> dict:
+    async def get_all_statuses(self) -> dict:
         statuses = {}
+        if self.distributed:
+            for item in await lease_queue.list_active(STREAM_KIND):
+                statuses[item["key"]] = self._item_status(item)
         for user_id, processor in self.active_processors.items():
             statuses[user_id] = processor.get_status()
         
         return {
-            "active_pipeline_streams": len(self.active_processors),
-            "streams": statuses
+            "active_pipeline_streams": len(statuses),
+            "local_pipeline_streams": len(self.active_processors),
+            "streams": statuses,
+            "pipeline_concurrency": pipeline_processor.concurrency_stats(),
+            "persistence": write_behind.stats()
         }
     
-    def get_active_users(self) -> List[str]:
-        return list(self.active_processors.keys())
+    async def get_active_users(self) -> List[str]:
+        users = set(self.active_processors.keys())
+        if self.distributed:
+            users.update(item["key"] for item in await lease_queue.list_active(STREAM_KIND))
+        return sorted(users)
+
+    async def _enqueue_stream(self, user_id: str, profile: bool) -> dict:
+        session_id = f"stream_{user_id}_{int(datetime.now().timestamp())}"
+        item = await lease_queue.enqueue(STREAM_KIND, user_id, {"session_id": session_id, "profile": profile},
+                                         item_id=_stream_item_id(user_id))
+        if item is None:
+            return {
+                "status": "already_running",
+                "user_id": user_id,
+                "message": f"Pipeline stream already exists for user: {user_id}"
+            }
+        log(f"Pipeline stream queued for user {user_id}, session: {session_id}", MODULE)
+        return {
+            "status": "queued",
+            "user_id": user_id,
+            "session_id": session_id,
+            "pipeline_enabled": True
+        }
+
+    async def _claim_sessions(self):
+        while True:
+            if len(self.active_processors) >= self.max_streams:
+                await asyncio.sleep(WORK_CLAIM_INTERVAL_S)
+                continue
+            item = await poll_claim(STREAM_KIND)
+            try:
+                await self._adopt(item)
+            except Exception as e:
+                log(f"Failed to start claimed stream {item['_id']}: {e}", MODULE, level="ERROR")
+                await lease_queue.release(item["_id"])
+
+    async def _adopt(self, item: dict):
+        """Запускает взятую по аренде сессию, продолжая её счётчик батчей"""
+        user_id = item["key"]
+        previous = item.get("status") or {}
+        processor = StreamingPipelineProcessor(user_id, profile=item["payload"].get("profile", False))
+        await processor.start_streaming(
+            session_id=item["payload"]["session_id"],
+            processed_batches=previous.get("processed_batches", 0)
+        )
+        lease = Lease(
+            item,
+            status_fn=processor.get_status,
+            on_stop=lambda: self._stop_local(user_id),
+            on_lost=lambda: self._stop_local(user_id)
+        )
+        self.active_processors[user_id] = processor
+        self.leases[user_id] = lease
+        lease.start()
+        log(f"Pipeline stream adopted for user {user_id}, attempt {item['attempts']}, "
+            f"local active: {len(self.active_processors)}", MODULE)
+
+    async def _stop_local(self, user_id: str) -> Optional[dict]:
+        processor = self.active_processors.pop(user_id, None)
+        if processor is None:
+            return None
+        lease = self.leases.pop(user_id, None)
+        result = await processor.stop_streaming()
+        if lease is not None:
+            await lease.finish("completed", result=result)
+        
+        log(f"Pipeline processor removed for user {user_id}, total active: {len(self.active_processors)}", MODULE)
+        return result
+
+    @staticmethod
+    def _item_status(item: dict) -> dict:
+        status = dict(item.get("status") or {})
+        status.update({
+            "user_id": item["key"],
+            "is_running": item["state"] == "leased",
+            "session_id": item.get("payload", {}).get("session_id", status.get("session_id")),
+            "worker": item.get("owner"),
+            "lease_state": item["state"],
+            "attempts": item.get("attempts", 0)
+        })
+        return status
 
 streaming_pipeline_manager = StreamingPipelineManager()
 
+
+def _buffer_fill():
+    fill = []
+    for user_id, processor in list(streaming_pipeline_manager.active_processors.items()):
+        required = processor.required_buffer_size
+        if required > 0:
+            fill.append(((user_id,), len(processor.data_buffer['current_R']) / required))
+    return fill
+
+
+CallbackMetric("streaming_active_sessions", "Активные потоковые сессии",
+               lambda: len(streaming_pipeline_manager.active_processors))
+CallbackMetric("streaming_buffer_fill_ratio", "Заполнение буфера сессии до следующего батча, доля",
+               _buffer_fill, labelnames=("user_id",))
+
 @router.post("/pipeline/start/{user_id}")
-async def start_realtime_pipeline(user_id: str):
-    """Запуск полного пайплайна в реальном времени"""
+async def start_realtime_pipeline(user_id: str, profile: bool = False):
+    """Запуск полного пайплайна в реальном времени; profile=true — каждый батч под профилировщиком"""
     try:
-        result = await streaming_pipeline_manager.start_pipeline_stream(user_id)
+        result = await streaming_pipeline_manager.start_pipeline_stream(user_id, profile=profile)
         return result
     except Exception as e:
         log(f"Failed to start pipeline streaming for user {user_id}: {e}", MODULE, level="ERROR")
@@ -346,7 +509,7 @@ async def stop_all_pipeline_processing():
 @router.get("/pipeline/status/{user_id}")
 async def get_pipeline_streaming_status(user_id: str):
     """Статус пайплайна для пользователя"""
-    status = streaming_pipeline_manager.get_user_status(user_id)
+    status = await streaming_pipeline_manager.get_user_status(user_id)
     if not status:
         return {
             "user_id": user_id,
@@ -365,14 +528,15 @@ async def get_pipeline_streaming_status(user_id: str):
 @router.get("/pipeline/status")
 async def get_all_pipeline_statuses():
     """Статус всех активных пайплайнов"""
-    return streaming_pipeline_manager.get_all_statuses()
+    return await streaming_pipeline_manager.get_all_statuses()
 
 @router.get("/pipeline/users")
 async def get_active_pipeline_users():
     """Пользователи с активными пайплайнами"""
+    active_users = await streaming_pipeline_manager.get_active_users()
     return {
-        "active_users": streaming_pipeline_manager.get_active_users(),
-        "count": len(streaming_pipeline_manager.get_active_users())
+        "active_users": active_users,
+        "count": len(active_users)
     }
 
 @router.get("/flow/{user_id}")
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Optional
+
+from utils.logger import log
+from utils.metrics import Counter
+
+MODULE = "deadline"
+
+# Заголовки дедлайна: абсолютный (Unix-время, мс) или относительный (мс от получения запроса)
+DEADLINE_HEADER = "X-Request-Deadline"
+TIMEOUT_HEADER = "X-Request-Timeout-Ms"
+# Дедлайн по умолчанию для /pipeline/analyze и /features/extract; 0 — без дедлайна
+REQUEST_DEFAULT_TIMEOUT_MS = float(os.getenv("REQUEST_DEFAULT_TIMEOUT_MS", 0))
+# Запуск не начинается, если до дедлайна осталось меньше этой доли ожидаемого времени запуска
+DEADLINE_MIN_REMAINING_RATIO = float(os.getenv("DEADLINE_MIN_REMAINING_RATIO", 0.5))
+DISCONNECT_POLL_INTERVAL_S = float(os.getenv("DISCONNECT_POLL_INTERVAL_S", 0.5))
+
+CANCELLED_WORK = Counter(
+    "pipeline_cancelled_total",
+    "Работа, брошенная до конца: reason — deadline, disconnected, infeasible; stage — где заметили",
+    ("reason", "stage")
+)
+CANCELLED_WINDOWS = Counter(
+    "pipeline_cancelled_windows_total", "Окна, которые не считались из-за отмены запроса", ("stage",)
+)
+
+_current: ContextVar[Optional["Deadline"]] = ContextVar("request_deadline", default=None)
+
+
+class WorkCancelled(Exception):
+    """Запрос больше не ждёт ответа: дедлайн истёк или клиент отключился"""
+
+    def __init__(self, reason: str, stage: str):
+        super().__init__(f"Request {reason} during {stage}")
+        self.reason = reason
+        self.stage = stage
+        # 499 — клиент отключился и ответ никто не прочитает; 504 — дедлайн истёк или недостижим
+        self.status_code = 499 if reason == "disconnected" else 504
+
+
+class Deadline:
+    """
+    Дедлайн одного запроса. Виден всем этапам через ContextVar, в том числе
+    в рабочих потоках asyncio.to_thread, которые копируют контекст.
+    cancel() выставляет причину; следующая проверка check() бросает WorkCancelled.
+    """
+
+    def __init__(self, timeout_ms: Optional[float] = None):
+        self.expires_at = time.monotonic() + timeout_ms / 1000 if timeout_ms else None
+        self.reason: Optional[str] = None
+        self.stage = "queue"
+        self.counted = False
+
+    def remaining_ms(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return (self.expires_at - time.monotonic()) * 1000
+
+    def cancel(self, reason: str):
+        if self.reason is None:
+            self.reason = reason
+
+    def check(self, stage: str):
+        self.stage = stage
+        if self.reason is None and self.expires_at is not None and time.monotonic() >= self.expires_at:
+            self.reason = "deadline"
+        if self.reason is not None:
+            if not self.counted:
+                self.counted = True
+                CANCELLED_WORK.labels(self.reason, stage).inc()
+            raise WorkCancelled(self.reason, stage)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+def check(stage: str):
+    """Точка отмены между окнами и этапами; без дедлайна ничего не делает"""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check(stage)
+
+
+def ensure_feasible(stage: str, expected_ms: Optional[float]):
+    """
+    Отказ от запуска, на который не хватит времени: до дедлайна осталось меньше
+    DEADLINE_MIN_REMAINING_RATIO от обычного времени запуска — слот отдаётся тем,
+    кому ещё можно ответить
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return
+    remaining = deadline.remaining_ms()
+    if remaining is not None and expected_ms and remaining < expected_ms * DEADLINE_MIN_REMAINING_RATIO:
+        deadline.cancel("infeasible")
+    deadline.check(stage)
+
+
+def check_windows(stage: str, skipped: int):
+    """Точка отмены в цикле по окнам: несчитанные окна идут в метрику"""
+    deadline = _current.get()
+    if deadline is None:
+        return
+    try:
+        deadline.check(stage)
+    except WorkCancelled:
+        CANCELLED_WINDOWS.labels(stage).inc(skipped)
+        raise
+
+
+def from_headers(headers, timeout_ms: Optional[float] = None) -> Deadline:
+    """Дедлайн из параметра запроса, заголовков или REQUEST_DEFAULT_TIMEOUT_MS — что наступит раньше"""
+    candidates = [timeout_ms] if timeout_ms else []
+    try:
+        if headers.get(TIMEOUT_HEADER):
+            candidates.append(float(headers[TIMEOUT_HEADER]))
+        if headers.get(DEADLINE_HEADER):
+            candidates.append(float(headers[DEADLINE_HEADER]) - time.time() * 1000)
+    except ValueError:
+        log(f"Ignoring malformed deadline headers: {dict(headers)}", MODULE, level="WARN")
+    if not candidates and REQUEST_DEFAULT_TIMEOUT_MS > 0:
+        candidates.append(REQUEST_DEFAULT_TIMEOUT_MS)
+    # уже истёкший дедлайн — не ноль, чтобы первая проверка его заметила
+    return Deadline(max(min(candidates), 1e-3) if candidates else None)
+
+
+async def run_with_deadline(request, deadline: Deadline, work: Awaitable[Any]) -> Any:
+    """
+    Выполняет work под дедлайном запроса. При истечении дедлайна или отключении
+    клиента задача отменяется: ожидание слота и модели прерывается сразу,
+    расчёт в рабочих потоках — на ближайшей проверке check().
+    """
+    token = _current.set(deadline)
+    try:
+        task = asyncio.ensure_future(work)
+    finally:
+        _current.reset(token)
+
+    async def watch_disconnect():
+        while not task.done():
+            if await request.is_disconnected():
+                deadline.cancel("disconnected")
+                task.cancel()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL_S)
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        remaining = deadline.remaining_ms()
+        done, _ = await asyncio.wait({task}, timeout=max(remaining, 0) / 1000 if remaining is not None else None)
+        if not done:
+            deadline.cancel("deadline")
+            task.cancel()
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if deadline.reason is None:
+                raise
+            deadline.check(deadline.stage)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
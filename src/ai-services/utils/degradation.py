@@ -0,0 +1,180 @@
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.logger import log
+from utils.metrics import CallbackMetric, Counter
+
+MODULE = "degradation"
+
+DEGRADATION_ENABLED = os.getenv("DEGRADATION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Целевое время пайплайна на одно окно; давление = max(ожидающие / слоты, EWMA времени на окно / цель)
+DEGRADATION_TARGET_WINDOW_MS = float(os.getenv("DEGRADATION_TARGET_WINDOW_MS", 250))
+# Давление, с которого включается уровень 1..5 (последний — отказ 429)
+DEGRADATION_THRESHOLDS = [float(v) for v in os.getenv("DEGRADATION_THRESHOLDS", "1,2,3,4,6").split(",")]
+# Уровень снижается, только когда давление ниже порога × DEGRADATION_RECOVERY_RATIO
+DEGRADATION_RECOVERY_RATIO = float(os.getenv("DEGRADATION_RECOVERY_RATIO", 0.8))
+DEGRADATION_EWMA_ALPHA = float(os.getenv("DEGRADATION_EWMA_ALPHA", 0.2))
+# Без новых запусков EWMA времени вдвое убывает за это время: простой снимает давление,
+# даже если запросы отклоняются и ничего не завершается
+DEGRADATION_HALF_LIFE_S = float(os.getenv("DEGRADATION_HALF_LIFE_S", 30))
+DEGRADED_MC_PASSES = int(os.getenv("DEGRADED_MC_PASSES", 2))
+DEGRADED_LSTM_STEPS = int(os.getenv("DEGRADED_LSTM_STEPS", 1))
+DEGRADED_LSTM_MAX_SEQUENCES = int(os.getenv("DEGRADED_LSTM_MAX_SEQUENCES", 4))
+
+
+class DegradationTier:
+    """
+    Объём работы одного запуска. None в mc_passes/lstm_steps/lstm_max_sequences —
+    без ограничения (как в запросе).
+    """
+
+    def __init__(self, level: int, name: str, mc_passes: Optional[int] = None, explain: bool = True,
+                 lstm_steps: Optional[int] = None, lstm_max_sequences: Optional[int] = None,
+                 run_lstm: bool = True, reject: bool = False):
+        self.level = level
+        self.name = name
+        self.mc_passes = mc_passes
+        self.explain = explain
+        self.lstm_steps = lstm_steps
+        self.lstm_max_sequences = lstm_max_sequences
+        self.run_lstm = run_lstm
+        self.reject = reject
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tier": self.level,
+            "name": self.name,
+            "mc_passes": self.mc_passes,
+            "explain": self.explain,
+            "lstm_steps": self.lstm_steps,
+            "lstm_max_sequences": self.lstm_max_sequences,
+            "run_lstm": self.run_lstm
+        }
+
+
+TIERS: List[DegradationTier] = [
+    DegradationTier(0, "full"),
+    DegradationTier(1, "reduced_mc", mc_passes=DEGRADED_MC_PASSES),
+    DegradationTier(2, "no_explain", mc_passes=DEGRADED_MC_PASSES, explain=False),
+    DegradationTier(3, "reduced_lstm", mc_passes=DEGRADED_MC_PASSES, explain=False,
+                    lstm_steps=DEGRADED_LSTM_STEPS, lstm_max_sequences=DEGRADED_LSTM_MAX_SEQUENCES),
+    DegradationTier(4, "no_lstm", mc_passes=DEGRADED_MC_PASSES, explain=False, run_lstm=False),
+    DegradationTier(5, "reject", mc_passes=DEGRADED_MC_PASSES, explain=False, run_lstm=False, reject=True),
+]
+
+TIER_RUNS = Counter("pipeline_degradation_runs_total", "Запуски пайплайна по уровню деградации", ("tier",))
+
+
+class PipelineOverloaded(Exception):
+    def __init__(self, retry_after_s: int):
+        super().__init__(f"Pipeline overloaded, retry after {retry_after_s}s")
+        self.retry_after_s = retry_after_s
+
+
+class DegradationPolicy:
+    """
+    Уровень деградации по нагрузке: глубине очереди пайплайна и EWMA
+    времени последних запусков на одно окно, затухающей со временем. Уровни идут по порядку — сначала меньше
+    MC-проходов, затем без латентов, затем короткий LSTM, затем без LSTM;
+    отказ — только на последнем. Свежий вердикт автоэнкодера по каждому
+    двигателю важнее полноты. Вниз — с гистерезисом, чтобы не дёргаться.
+    """
+
+    def __init__(self, enabled: bool = DEGRADATION_ENABLED, thresholds: List[float] = DEGRADATION_THRESHOLDS,
+                 target_window_ms: float = DEGRADATION_TARGET_WINDOW_MS,
+                 half_life_s: float = DEGRADATION_HALF_LIFE_S):
+        self.enabled = enabled
+        self.thresholds = thresholds[:len(TIERS) - 1]
+        self.target_window_ms = target_window_ms
+        self.half_life_s = half_life_s
+        self.level = 0
+        self.pressure = 0.0
+        # EWMA на момент observed_at; текущие значения — через _decayed()
+        self._window_ms = 0.0
+        self._run_ms = 0.0
+        self._observed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _decay(self) -> float:
+        if self._observed_at is None or self.half_life_s <= 0:
+            return 1.0
+        return 0.5 ** ((time.monotonic() - self._observed_at) / self.half_life_s)
+
+    @property
+    def window_ewma_ms(self) -> Optional[float]:
+        """EWMA времени запуска на окно с учётом простоя; None — запусков ещё не было"""
+        return None if self._observed_at is None else self._window_ms * self._decay()
+
+    @property
+    def latency_ewma_ms(self) -> Optional[float]:
+        """EWMA времени всего запуска с учётом простоя"""
+        return None if self._observed_at is None else self._run_ms * self._decay()
+
+    def expected_ms(self, windows: int) -> Optional[float]:
+        """Ожидаемое время запуска на windows окон по текущей EWMA"""
+        window_ms = self.window_ewma_ms
+        return None if window_ms is None else window_ms * max(1, windows)
+
+    def select(self, waiting: int, slots: int, allow_reject: bool = True) -> DegradationTier:
+        """Уровень для нового запуска; без allow_reject (потоки, задания) — не выше «без LSTM»"""
+        if not self.enabled:
+            return TIERS[0]
+        with self._lock:
+            latency_ratio = (self.window_ewma_ms or 0.0) / self.target_window_ms
+            self.pressure = max(waiting / max(1, slots), latency_ratio)
+            target = sum(1 for threshold in self.thresholds if self.pressure >= threshold)
+            if target < self.level:
+                target = sum(1 for threshold in self.thresholds
+                             if self.pressure >= threshold * DEGRADATION_RECOVERY_RATIO)
+            if target != self.level:
+                log(f"Degradation tier {self.level} -> {target}, pressure {self.pressure:.2f}", MODULE,
+                    level="WARN" if target > self.level else "INFO")
+                self.level = target
+            tier = TIERS[self.level]
+        if tier.reject and not allow_reject:
+            tier = TIERS[-2]
+        TIER_RUNS.labels(tier.name).inc()
+        return tier
+
+    def observe(self, total_ms: float, windows: int = 1):
+        """Время завершённого запуска; нормируется на число окон, чтобы одна большая запись не поднимала давление"""
+        with self._lock:
+            decay = self._decay()
+            window_ms = total_ms / max(1, windows)
+            if self._observed_at is None:
+                self._window_ms, self._run_ms = window_ms, total_ms
+            else:
+                self._window_ms = self._window_ms * decay + DEGRADATION_EWMA_ALPHA * (
+                    window_ms - self._window_ms * decay)
+                self._run_ms = self._run_ms * decay + DEGRADATION_EWMA_ALPHA * (total_ms - self._run_ms * decay)
+            self._observed_at = time.monotonic()
+
+    def retry_after(self, waiting: int, slots: int) -> int:
+        """Оценка, когда очередь рассосётся: ожидающие волны × среднее время запуска"""
+        latency_s = (self.latency_ewma_ms or self.target_window_ms) / 1000
+        return max(1, math.ceil(latency_s * (waiting / max(1, slots) + 1)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            window_ms, run_ms = self.window_ewma_ms, self.latency_ewma_ms
+            return {
+                "enabled": self.enabled,
+                "tier": TIERS[self.level].to_dict(),
+                "pressure": round(self.pressure, 2),
+                "latency_ewma_ms": round(run_ms, 1) if run_ms is not None else None,
+                "window_ewma_ms": round(window_ms, 1) if window_ms is not None else None,
+                "target_window_ms": self.target_window_ms,
+                "half_life_s": self.half_life_s,
+                "thresholds": self.thresholds
+            }
+
+
+degradation_policy = DegradationPolicy()
+
+CallbackMetric("pipeline_degradation_tier", "Текущий уровень деградации пайплайна",
+               lambda: degradation_policy.level)
+CallbackMetric("pipeline_degradation_pressure", "Давление нагрузки: 1 — на пределе",
+               lambda: degradation_policy.pressure)
@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.metrics import LabeledHistogram
+
+# Классы по убыванию приоритета: свободный слот всегда получает старший ожидающий класс.
+# jobs — задания пользователей (/pipeline/jobs) выше потоков: их конечная очередь не должна
+# стоять за непрерывным потоковым трафиком; backfill — только фоновый перерасчёт
+PRIORITY_CLASSES = ("interactive", "jobs", "streaming", "backfill")
+# Слоты, которые занимает только interactive: запуск не прерывается, поэтому без резерва
+# интерактивный запрос ждёт, пока освободится слот, занятый потоком
+PIPELINE_INTERACTIVE_RESERVED_SLOTS = int(os.getenv("PIPELINE_INTERACTIVE_RESERVED_SLOTS", 1))
+# Веса пользователей внутри класса: "user_a:2,user_b:0.5"; остальные — 1
+PIPELINE_USER_WEIGHTS = {
+    user.strip(): float(weight)
+    for user, weight in (item.split(":", 1) for item in os.getenv("PIPELINE_USER_WEIGHTS", "").split(",") if ":" in item)
+}
+QUEUE_WAIT_MS_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 30000, 60000)
+
+CLASS_WAIT_MS = LabeledHistogram(
+    "pipeline_class_queue_wait_ms", "Ожидание слота пайплайна по классу приоритета, мс", QUEUE_WAIT_MS_BUCKETS,
+    ("class",)
+)
+
+
+class _Waiter:
+    __slots__ = ("priority", "tenant", "start_tag", "future", "enqueued_at")
+
+    def __init__(self, priority: str, tenant: str, start_tag: float, future: asyncio.Future):
+        self.priority = priority
+        self.tenant = tenant
+        self.start_tag = start_tag
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class FairScheduler:
+    """
+    Раздача слотов пайплайна.
+
+    Между классами — строгий приоритет: interactive > jobs > streaming > backfill,
+    плюс PIPELINE_INTERACTIVE_RESERVED_SLOTS слотов только для interactive.
+    Внутри класса — взвешенная справедливая очередь по пользователям
+    (start-time fair queueing): у запроса метка старта max(виртуальное время
+    класса, конец предыдущего запроса пользователя), конец = старт + цена / вес.
+    Слот получает запрос с наименьшей меткой, поэтому пользователь с десятком
+    потоков получает ту же долю, что и пользователь с одним. Цена — число окон.
+    """
+
+    def __init__(self, slots: int, reserved_interactive: int = PIPELINE_INTERACTIVE_RESERVED_SLOTS,
+                 weights: Optional[Dict[str, float]] = None):
+        self.slots = max(1, slots)
+        self.reserved_interactive = max(0, min(reserved_interactive, self.slots - 1))
+        self.weights = weights if weights is not None else PIPELINE_USER_WEIGHTS
+        self.running = 0
+        self.running_by_class: Dict[str, int] = {priority: 0 for priority in PRIORITY_CLASSES}
+        self.completed_by_class: Dict[str, int] = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._queues: Dict[str, List[Tuple[float, int, _Waiter]]] = {priority: [] for priority in PRIORITY_CLASSES}
+        self._virtual_time: Dict[str, float] = {priority: 0.0 for priority in PRIORITY_CLASSES}
+        self._last_finish: Dict[Tuple[str, str], float] = {}
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(self.depth(priority) for priority in PRIORITY_CLASSES)
+
+    def depth(self, priority: str) -> int:
+        return sum(1 for _, _, waiter in self._queues[priority] if not waiter.future.done())
+
+    async def acquire(self, priority: str, tenant: str, cost: float = 1.0) -> float:
+        """Ждёт слот; возвращает ожидание в мс. После работы обязательно release(priority)"""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}, expected one of {PRIORITY_CLASSES}")
+        key = (priority, tenant)
+        start_tag = max(self._virtual_time[priority], self._last_finish.get(key, 0.0))
+        self._last_finish[key] = start_tag + max(cost, 1e-3) / self.weights.get(tenant, 1.0)
+        waiter = _Waiter(priority, tenant, start_tag, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queues[priority], (start_tag, next(self._seq), waiter))
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # слот уже выдан, но ждавший ушёл — возвращаем
+                self.release(priority)
+            else:
+                waiter.future.cancel()
+            raise
+
+        wait_ms = (time.perf_counter() - waiter.enqueued_at) * 1000
+        CLASS_WAIT_MS.labels(priority).observe(wait_ms)
+        return wait_ms
+
+    def release(self, priority: str):
+        self.running -= 1
+        self.running_by_class[priority] -= 1
+        self.completed_by_class[priority] += 1
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "reserved_interactive": self.reserved_interactive,
+            "classes": {
+                priority: {
+                    "queue_depth": self.depth(priority),
+                    "running": self.running_by_class[priority],
+                    "completed": self.completed_by_class[priority],
+                    "waiting_users": len({w.tenant for _, _, w in self._queues[priority] if not w.future.done()}),
+                    "queue_wait_ms": CLASS_WAIT_MS.labels(priority).snapshot()
+                }
+                for priority in PRIORITY_CLASSES
+            }
+        }
+
+    def _limit(self, priority: str) -> int:
+        return self.slots if priority == PRIORITY_CLASSES[0] else self.slots - self.reserved_interactive
+
+    def _dispatch(self):
+        granted = True
+        while granted:
+            granted = False
+            for priority in PRIORITY_CLASSES:
+                queue = self._queues[priority]
+                while queue and queue[0][2].future.done():
+                    heapq.heappop(queue)
+                if not queue:
+                    continue
+                if self.running >= self._limit(priority):
+                    # младшие классы не обгоняют старший, которому не хватило слота
+                    return
+                start_tag, _, waiter = heapq.heappop(queue)
+                self._virtual_time[priority] = start_tag
+                self.running += 1
+                self.running_by_class[priority] += 1
+                waiter.future.set_result(None)
+                granted = True
+                break
+        self._prune()
+
+    def _prune(self):
+        """Пользователи, чья очередь догнала виртуальное время класса, больше не влияют на метки"""
+        if len(self._last_finish) < 1024:
+            return
+        self._last_finish = {
+            key: finish for key, finish in self._last_finish.items() if finish > self._virtual_time[key[0]]
+        }
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import time
+
+from utils.logger import log
+from utils.metrics import BYTES_BUCKETS, MS_BUCKETS, Gauge, Histogram, LabeledHistogram
+
+MODULE = "instrumentation"
+
+EVENT_LOOP_LAG_INTERVAL_MS = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_MS", 500))
+
+LOOP_LAG_MS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+HTTP_REQUEST_MS = LabeledHistogram(
+    "http_request_ms", "Время обработки HTTP-запроса, мс", MS_BUCKETS, ("method", "route", "status")
+)
+HTTP_REQUEST_BYTES = LabeledHistogram(
+    "http_request_bytes", "Размер тела HTTP-запроса, байт", BYTES_BUCKETS, ("method", "route")
+)
+HTTP_RESPONSE_BYTES = LabeledHistogram(
+    "http_response_bytes", "Размер тела HTTP-ответа, байт", BYTES_BUCKETS, ("method", "route")
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP-запросов в обработке")
+
+EVENT_LOOP_LAG_MS = Histogram(
+    "event_loop_lag_ms", "Запаздывание event loop относительно таймера, мс", LOOP_LAG_MS_BUCKETS
+)
+
+
+class HTTPMetricsMiddleware:
+    """
+    ASGI-middleware: латентность и размеры запросов по шаблону маршрута
+    (/batches/{batch_id}, а не конкретный id), чтобы число рядов не росло.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        sizes = {"request": 0, "response": 0}
+        status = {"code": 500}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.inc(-1)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUEST_MS.labels(method, path, status["code"]).observe((time.perf_counter() - started) * 1000)
+            HTTP_REQUEST_BYTES.labels(method, path).observe(sizes["request"])
+            HTTP_RESPONSE_BYTES.labels(method, path).observe(sizes["response"])
+
+
+async def monitor_event_loop_lag(interval_ms: float = EVENT_LOOP_LAG_INTERVAL_MS):
+    """Спит interval_ms и меряет, насколько позже loop вернул управление — признак блокирующего кода"""
+    interval = interval_ms / 1000
+    log(f"Event loop lag monitor started, interval {interval_ms:.0f}ms", MODULE)
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_MS.observe(max(0.0, (time.perf_counter() - started - interval) * 1000))
@@ -0,0 +1,233 @@
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_:]")
+
+MS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+BYTES_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000, 100000000)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def _metric_name(name: str) -> str:
+    return _INVALID_NAME_CHARS.sub("_", name)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса; render() отдаёт их в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Регистрирует метрику; метрика с тем же именем заменяется (пересоздание батчера, перезагрузка)"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Histogram:
+    """Потокобезопасная гистограмма с фиксированными границами корзин"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Iterable[float], register: bool = True):
+        self.name = _metric_name(name)
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * len(self.buckets)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+        if register:
+            REGISTRY.register(self)
+
+    def observe(self, value: float):
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets, self._counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self._count
+            return {
+                "count": self._count,
+                "sum": round(self._sum, 3),
+                "mean": round(self._sum / self._count, 3) if self._count else 0.0,
+                "buckets": buckets
+            }
+
+    def render(self, labels: Optional[Dict[str, str]] = None) -> List[str]:
+        labels = labels or {}
+        with self._lock:
+            counts, count, total = list(self._counts), self._count, self._sum
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+        lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class _Labeled:
+    """Общая часть метрик с метками: дочерняя метрика на каждый набор значений"""
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...]):
+        self.name = _metric_name(name)
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        key = tuple(str(v) for v in values)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _items(self):
+        with self._lock:
+            return [(dict(zip(self.labelnames, key)), child) for key, child in self._children.items()]
+
+
+class LabeledHistogram(_Labeled):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Iterable[float], labelnames: Tuple[str, ...]):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, description, labelnames)
+
+    def _new_child(self):
+        return Histogram(self.name, self.description, self.buckets, register=False)
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, child in self._items():
+            lines.extend(child.render(labels))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+
+class Counter(_Labeled):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, description, labelnames)
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def values(self) -> List[Tuple[Dict[str, str], float]]:
+        return [(labels, child.value) for labels, child in self._items()]
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(child.value)}" for labels, child in self._items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class CallbackMetric:
+    """
+    Значение считывается в момент выдачи /metrics. fn возвращает число
+    или список (значения меток, число) для метрики с метками.
+    """
+
+    def __init__(self, name: str, description: str, fn: Callable, kind: str = "gauge",
+                 labelnames: Tuple[str, ...] = ()):
+        self.name = _metric_name(name)
+        self.description = description
+        self.fn = fn
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        REGISTRY.register(self)
+
+    def render(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if not self.labelnames:
+            return [f"{self.name} {_format_value(value)}"]
+        return [
+            f"{self.name}{_format_labels(dict(zip(self.labelnames, map(str, values))))} {_format_value(v)}"
+            for values, v in value
+        ]
+
+
+# Метрики, которые пишут несколько модулей
+MODEL_CALL_MS = LabeledHistogram(
+    "model_call_ms", "Длительность прохода модели, мс", MS_BUCKETS, ("model", "backend")
+)
+MODEL_BATCH_SIZE = LabeledHistogram(
+    "model_call_batch_size", "Сэмплов в одном проходе модели", BATCH_SIZE_BUCKETS, ("model",)
+)
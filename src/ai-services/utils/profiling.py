@@ -0,0 +1,205 @@
+import asyncio
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Set
+
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", 30))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", 2))
+PROFILE_MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", 2000))
+
+FEATURE_GROUPS = ("common", "rotor", "stator", "bearing", "eccentricity")
+
+# Собственное время функций этих модулей и с этими именами считается сериализацией
+_SERIALIZATION_MODULES = ("json", "pickle", "bson", "pydantic")
+_SERIALIZATION_FUNCTIONS = ("tobytes", "tolist", "to_document", "to_dicts", "frombuffer", "dumps", "loads")
+
+# Ожидание event loop в select — простой, а не работа; в топ функций не попадает
+_IDLE_MARKERS = ("selectors.py", "base_events.py", "select.epoll", "select.kqueue", "select.select")
+
+_active: ContextVar[Optional["RunProfiler"]] = ContextVar("run_profiler", default=None)
+# cProfile в потоке event loop может быть только один на процесс
+_loop_profiler_lock = threading.Lock()
+# С 3.12 cProfile работает через sys.monitoring: один профайлер видит все потоки,
+# а второй enable() бросает ValueError, поэтому отдельные профайлеры потоков — только до 3.12
+_PROCESS_WIDE_PROFILER = sys.version_info >= (3, 12)
+
+
+class RunProfiler:
+    """
+    Детерминированный профиль одного запуска пайплайна.
+
+    cProfile включается в потоке event loop на время запуска; до Python 3.12 —
+    ещё и в каждом потоке, куда работа уходит через to_thread() этого модуля,
+    и статистика потоков складывается (с 3.12 профайлер loop видит все потоки). В потоке loop попадают и корутины других запросов,
+    идущих параллельно, поэтому одновременно профилируется только один запуск.
+    section() добавляет время по стенным часам для того, что cProfile не
+    видит: ожидание модели в батчере и запись в Mongo.
+    Свёрнутые стеки для flame graph — выборкой sys._current_frames(),
+    т.к. cProfile хранит только пары вызывающий — вызываемый.
+    """
+
+    def __init__(self, stacks: bool = False, top_n: int = PROFILE_TOP_N):
+        self.stacks = stacks
+        self.top_n = top_n
+        self.sections: Dict[str, float] = {}
+        self._profiles: List[cProfile.Profile] = []
+        self._loop_profile: Optional[cProfile.Profile] = None
+        self._lock = threading.Lock()
+        self._threads: Set[int] = set()
+        self._samples: Counter = Counter()
+        self._sampler: Optional[threading.Thread] = None
+        self._sampling = threading.Event()
+        self._token = None
+        self._started = 0.0
+        self.wall_ms = 0.0
+
+    def start(self) -> bool:
+        """False — уже идёт другой профилируемый запуск; тогда запуск выполняется без профиля"""
+        if not _loop_profiler_lock.acquire(blocking=False):
+            return False
+        self._started = time.perf_counter()
+        self._token = _active.set(self)
+        self._loop_profile = cProfile.Profile()
+        self._attach(threading.get_ident())
+        self._loop_profile.enable()
+        if self.stacks:
+            self._sampling.set()
+            self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+            self._sampler.start()
+        return True
+
+    def stop(self):
+        self._loop_profile.disable()
+        self._detach(threading.get_ident(), self._loop_profile)
+        self._sampling.clear()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.wall_ms = (time.perf_counter() - self._started) * 1000
+        _active.reset(self._token)
+        _loop_profiler_lock.release()
+
+    def add_section(self, name: str, ms: float):
+        with self._lock:
+            self.sections[name] = self.sections.get(name, 0.0) + ms
+
+    def run_profiled(self, fn: Callable, *args, **kwargs):
+        """Выполняет fn в текущем (рабочем) потоке под отдельным cProfile; с 3.12 — под общим"""
+        ident = threading.get_ident()
+        if _PROCESS_WIDE_PROFILER:
+            with self._lock:
+                self._threads.add(ident)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._threads.discard(ident)
+        profile = cProfile.Profile()
+        self._attach(ident)
+        profile.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._detach(ident, profile)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        feature_groups = {group: 0.0 for group in FEATURE_GROUPS}
+        serialization_s = 0.0
+        top = []
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            if filename.endswith("motor_features.py") and name.endswith("_features"):
+                group = name[:-len("_features")]
+                if group in feature_groups:
+                    feature_groups[group] += cumtime * 1000
+            if (any(module in filename for module in _SERIALIZATION_MODULES)
+                    or any(function in name for function in _SERIALIZATION_FUNCTIONS)):
+                serialization_s += tottime
+            if not any(marker in filename or marker in name for marker in _IDLE_MARKERS):
+                top.append((cumtime, tottime, calls, f"{os.path.basename(filename)}:{line}({name})"))
+        top.sort(reverse=True)
+
+        with self._lock:
+            sections = dict(self.sections)
+        report: Dict[str, Any] = {
+            "wall_ms": round(self.wall_ms, 1),
+            "profiled_threads": len(profiles),
+            "breakdown_ms": {
+                "feature_groups": {group: round(ms, 1) for group, ms in feature_groups.items()},
+                "model_call": round(sections.get("model_call", 0.0), 1),
+                "serialization": round(serialization_s * 1000, 1),
+                "mongo_write": round(sections.get("mongo_write", 0.0), 1)
+            },
+            "top_functions": [
+                {"function": function, "calls": calls, "cumtime_ms": round(cumtime * 1000, 2),
+                 "tottime_ms": round(tottime * 1000, 2)}
+                for cumtime, tottime, calls, function in top[:self.top_n]
+            ]
+        }
+        if self.stacks:
+            report["collapsed_stacks"] = [
+                f"{stack} {count}" for stack, count in self._samples.most_common(PROFILE_MAX_STACKS)
+            ]
+            report["sample_interval_ms"] = PROFILE_SAMPLE_INTERVAL_MS
+        return report
+
+    def _attach(self, ident: int):
+        with self._lock:
+            self._threads.add(ident)
+
+    def _detach(self, ident: int, profile: cProfile.Profile):
+        with self._lock:
+            self._threads.discard(ident)
+            self._profiles.append(profile)
+
+    def _sample(self):
+        interval = PROFILE_SAMPLE_INTERVAL_MS / 1000
+        while self._sampling.is_set():
+            with self._lock:
+                threads = set(self._threads)
+            frames = sys._current_frames()
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self._samples[";".join(reversed(stack))] += 1
+            time.sleep(interval)
+
+
+@contextmanager
+def section(name: str):
+    """Время блока по стенным часам в профиль текущего запуска; без профиля — ничего не делает"""
+    profiler = _active.get()
+    if profiler is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add_section(name, (time.perf_counter() - started) * 1000)
+
+
+async def to_thread(fn: Callable, *args, **kwargs):
+    """asyncio.to_thread, который профилирует рабочий поток, если запуск профилируется"""
+    profiler = _active.get()
+    if profiler is None:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    return await asyncio.to_thread(profiler.run_profiled, fn, *args, **kwargs)
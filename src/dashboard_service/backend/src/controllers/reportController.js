@@ -2,6 +2,7 @@
 import UserBatchesCache from "../models/UserBatchesCache.js";
 import BatchCache from "../models/BatchCache.js";
 import { buildReportResponse } from "../utils/buildReportResponse.js";
+import { fetchWindowExplanation } from "../services/aiService.js";
 
 export const getUserReport = async (req, res) => {
   const { user_id } = req.params;
@@ -92,6 +93,15 @@ export const getWindowReport = async (req, res) => {
       (p) => p.window_index == window_id
     );
 
+    let attention = ae?.autoencoder_features?.attention_weights || null;
+    if (ae && !attention) {
+      try {
+        attention = (await fetchWindowExplanation(batch_id, window_id)).attention_weights || null;
+      } catch (err) {
+        console.warn(`[REPORT] Attention unavailable for ${batch_id}/${window_id}`);
+      }
+    }
+
     const data = {
       type: "window_report",
       batch_id,
@@ -99,7 +109,7 @@ export const getWindowReport = async (req, res) => {
       autoencoder: ae
         ? { overall: ae.overall, components: ae } // полный набор компонентов
         : null,
-      attention: ae?.autoencoder_features?.attention_weights || null,
+      attention,
       lstm: lstm
         ? {
           steps: lstm.predictions.steps,
@@ -1,5 +1,6 @@
 // backend/src/controllers/windowController.js
 import BatchCache from "../models/BatchCache.js";
+import { fetchWindowExplanation } from "../services/aiService.js";
 
 // helper: get batch from cache
 const getBatchFromCache = async (batch_id) => {
@@ -43,9 +44,16 @@ export const getAttentionWindow = async (req, res) => {
     const window = data.autoencoder?.results?.[window_id];
     if (!window) return res.status(404).json({ error: "Window not found" });
 
+    // latents/attention хранятся только при explain=true, иначе считаем в AI-сервисе
+    let attention_weights = window.autoencoder_features?.attention_weights;
+    if (!attention_weights) {
+      const explanation = await fetchWindowExplanation(batch_id, window_id);
+      attention_weights = explanation.attention_weights;
+    }
+
     res.json({
       window_index: window_id,
-      attention_weights: window.autoencoder_features?.attention_weights || {},
+      attention_weights: attention_weights || {},
     });
   } catch (err) {
     console.error("[WINDOW] Attention error", err);
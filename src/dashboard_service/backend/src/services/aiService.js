@@ -2,17 +2,27 @@
 import axios from "axios";
 
 const AI_SERVICE_URL = process.env.AI_SERVICE_URL || "http://127.0.0.1:8000";
+const AI_REQUEST_TIMEOUT_MS = Number(process.env.AI_REQUEST_TIMEOUT_MS || 30000);
+
+// Таймаут клиента уходит в AI-services заголовком: после него сервер бросает работу
+const aiClient = axios.create({ timeout: AI_REQUEST_TIMEOUT_MS });
+aiClient.interceptors.request.use((config) => {
+  if (config.timeout) {
+    config.headers["X-Request-Timeout-Ms"] = String(config.timeout);
+  }
+  return config;
+});
 
 export const fetchCompleteBatch = async (batchId) => {
   const url = `${AI_SERVICE_URL}/batches/${batchId}/complete`;
-  const { data } = await axios.get(url);
+  const { data } = await aiClient.get(url);
   console.log(`[AI_SERVICE] Loaded complete batch ${batchId}`);
   return data;
 };
 
 export const fetchUserBatches = async (userId, count = 10) => {
   const url = `${AI_SERVICE_URL}/batches/user/${userId}/recent?count=${count}`;
-  const { data } = await axios.get(url);
+  const { data } = await aiClient.get(url);
 
   if (!data.batches) {
     console.warn(`[AI_SERVICE] No batches[] key in response`);
@@ -22,3 +32,10 @@ export const fetchUserBatches = async (userId, count = 10) => {
   console.log(`[AI_SERVICE] Loaded ${data.actual_count} batches for ${userId}`);
   return data.batches; // ✅ теперь точно массив
 };
+
+export const fetchWindowExplanation = async (batchId, windowId) => {
+  const url = `${AI_SERVICE_URL}/batches/${batchId}/windows/${windowId}/explain`;
+  const { data } = await aiClient.get(url);
+  console.log(`[AI_SERVICE] Explained window ${windowId} of ${batchId}`);
+  return data;
+};